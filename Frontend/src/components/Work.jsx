@@ -29,6 +29,7 @@ function Work() {
   // --- STATE MANAGEMENT ---
   const [file, setFile] = useState(null);
   const [extractedText, setExtractedText] = useState("");
+  const [documentId, setDocumentId] = useState(null);
   const [summary, setSummary] = useState("");
   const [keyClauses, setKeyClauses] = useState([]);
   const [legalObligations, setLegalObligations] = useState([]);
@@ -155,6 +156,7 @@ function Work() {
     if (uploadedFile) {
       setFile(uploadedFile);
       setExtractedText("");
+      setDocumentId(null);
       setSummary("");
       setKeyClauses([]);
       setLegalObligations([]);
@@ -269,17 +271,24 @@ function Work() {
       const extracted = textData.text || "No text extracted";
 
       setExtractedText(extracted);
+      setDocumentId(textData.document_id || null);
       setLoadingStates((prev) => ({ ...prev, text: false }));
 
       if (extracted && extracted !== "No text extracted") {
-        const analyzeResponse = await fetch(
-          `${API_BASE_URL}/analyze_document`,
-          {
+        // Refer to the server-side copy by id; resend the text only if it expired
+        const analyze = (body) =>
+          fetch(`${API_BASE_URL}/analyze_document`, {
             method: "POST",
             headers: { "Content-Type": "application/json" },
-            body: JSON.stringify({ text: extracted }),
-          }
-        );
+            body: JSON.stringify(body),
+          });
+        let analyzeResponse = textData.document_id
+          ? await analyze({ document_id: textData.document_id })
+          : await analyze({ text: extracted });
+        if (analyzeResponse.status === 404 && textData.document_id) {
+          setDocumentId(null);
+          analyzeResponse = await analyze({ text: extracted });
+        }
 
         if (!analyzeResponse.ok)
           throw new Error(
@@ -569,7 +578,7 @@ function Work() {
         </span>
       </button>
 
-      {isChatOpen && <Chatbot context={extractedText} />}
+      {isChatOpen && <Chatbot context={extractedText} documentId={documentId} />}
     </div>
   );
 }
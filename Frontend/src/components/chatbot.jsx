@@ -3,7 +3,7 @@ import axios from "axios";
 import { X, Send, Bot, User, Sparkles } from "lucide-react";
 import { API_BASE_URL } from "../apiConfig";
 
-const Chatbot = ({ context }) => {
+const Chatbot = ({ context, documentId }) => {
   const [chatInput, setChatInput] = useState("");
   const [chatHistory, setChatHistory] = useState([
     {
@@ -32,10 +32,18 @@ const Chatbot = ({ context }) => {
     setIsLoading(true);
 
     try {
-      const response = await axios.post(`${API_BASE_URL}/chatbot`, {
-        chatInput: userMessage.text,
-        context: context || "",
-      });
+      // Prefer the server-side copy of the document; fall back to sending it
+      const ask = (doc) =>
+        axios.post(`${API_BASE_URL}/chatbot`, { chatInput: userMessage.text, ...doc });
+      let response;
+      try {
+        response = documentId
+          ? await ask({ document_id: documentId })
+          : await ask({ context: context || "" });
+      } catch (err) {
+        if (err?.response?.status !== 404 || !documentId) throw err;
+        response = await ask({ context: context || "" });
+      }
 
       const botResponse = response?.data?.reply || "I couldn't generate a response.";
       setChatHistory((prev) => [...prev, { sender: "bot", text: botResponse }]);
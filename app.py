@@ -1,29 +1,68 @@
-from flask import Flask, request, jsonify
-from typing import Optional
+from flask import Flask, Response, g, has_request_context, request, jsonify, stream_with_context
+from flask.json.provider import DefaultJSONProvider
+from typing import Callable, Optional
 from flask_cors import CORS
-from groq import Groq
 import os
 import json
+import random
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from dotenv import load_dotenv
 from werkzeug.utils import secure_filename
-from PyPDF2 import PdfReader
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
-from io import BytesIO
-
-from PIL import Image
-import pytesseract
-
-from rag_engine import RAGStore
 
 load_dotenv()
 
-# Initialize Groq Client
+# Local modules read their tuning knobs from the environment at import time,
+# so they are imported after .env has been loaded.
+from context_packer import (  # noqa: E402
+    BASELINE_TOKEN_BUDGET, CHARS_PER_TOKEN, CHAT_TOKEN_BUDGET, CONTEXT_TOKEN_BUDGET,
+    count_tokens, fit_budget, fits_tokens, truncate_to_tokens,
+)
+from corpus import CORPUS_MAX_TOP_K, corpus_index, format_hits  # noqa: E402
+from document_store import document_store  # noqa: E402
+from extraction import EXTRACT_WORKERS, iter_image_frames, iter_pdf_pages  # noqa: E402
+from jobs import QueueFull, job_manager, sse_format  # noqa: E402
+from llm_cache import llm_cache, response_key  # noqa: E402
+from llm_gateway import LLMGateway, make_groq_client  # noqa: E402
+from map_reduce import (  # noqa: E402
+    MAP_MAX_SECTIONS, MAP_REDUCE_CONCURRENCY, MAP_REDUCE_DIGEST_TOKENS, MAP_REDUCE_MIN_TOKENS,
+    MAP_SECTION_TOKENS, merge_partials, reduce_batches, render_digest, split_sections,
+)
+from rag_engine import (  # noqa: E402
+    DEFAULT_CHUNK_STRATEGY, DOCUMENT_CHUNK_STRATEGY, WARMUP_ENABLED, align_stores, document_key,
+    embedding_backend_info, embedding_batcher, index_cache, start_warmup, warmup_status,
+)
+
+# Initialize Groq Client — every call goes through the gateway (pooling,
+# concurrency limit, retries, circuit breaker). GROQ_BASE_URL points it at
+# a local stub server for load and failure testing.
 GROQ_API_KEY = os.getenv("GROQ_API_KEY")
-client = Groq(api_key=GROQ_API_KEY)
+llm_gateway = LLMGateway(make_groq_client(GROQ_API_KEY, os.getenv("GROQ_BASE_URL")))
+
+class _TimedJSONProvider(DefaultJSONProvider):
+    """Flask's JSON provider, timing every encode/decode made for the current request."""
+
+    def dumps(self, obj, **kwargs):
+        t0 = time.perf_counter()
+        out = super().dumps(obj, **kwargs)
+        if has_request_context():
+            g.json_encode_ms = g.get("json_encode_ms", 0.0) + (time.perf_counter() - t0) * 1000
+        return out
+
+    def loads(self, s, **kwargs):
+        t0 = time.perf_counter()
+        out = super().loads(s, **kwargs)
+        if has_request_context():
+            g.json_decode_ms = g.get("json_decode_ms", 0.0) + (time.perf_counter() - t0) * 1000
+        return out
+
 
 app = Flask(__name__)
+app.json_provider_class = _TimedJSONProvider
+app.json = _TimedJSONProvider(app)
 CORS(app, resources={r"/*": {"origins": ["https://docbrief.vercel.app", "http://localhost:5173"]}})
 limiter = Limiter(
     get_remote_address,
@@ -44,20 +83,94 @@ MAX_METRICS = 50
 def _log_metrics(endpoint: str, timings: dict):
     """Append timing data for a request to the metrics log."""
     entry = {"endpoint": endpoint, "timestamp": time.time(), **timings}
+    if has_request_context():
+        entry.setdefault("request_bytes", request.content_length or 0)
+        entry.setdefault("json_decode_ms", round(g.get("json_decode_ms", 0.0), 2))
     _metrics_log.append(entry)
     if len(_metrics_log) > MAX_METRICS:
         _metrics_log.pop(0)
 
 
+# ---------------------------------------------------------------------------
+# Payload metrics (request/response bytes and JSON time, per endpoint)
+# ---------------------------------------------------------------------------
+_payload_stats: dict[str, dict] = {}
+_payload_lock = threading.Lock()
+
+
+@app.after_request
+def _record_payload(response):
+    """Accumulate body sizes and JSON encode/decode time for /metrics."""
+    endpoint = request.url_rule.rule if request.url_rule else "<unmatched>"
+    request_bytes = request.content_length or 0
+    response_bytes = 0 if response.is_streamed else (response.content_length or 0)
+    with _payload_lock:
+        s = _payload_stats.setdefault(endpoint, {
+            "requests": 0, "request_bytes": 0, "max_request_bytes": 0,
+            "response_bytes": 0, "max_response_bytes": 0,
+            "json_decode_ms": 0.0, "json_encode_ms": 0.0,
+        })
+        s["requests"] += 1
+        s["request_bytes"] += request_bytes
+        s["max_request_bytes"] = max(s["max_request_bytes"], request_bytes)
+        s["response_bytes"] += response_bytes
+        s["max_response_bytes"] = max(s["max_response_bytes"], response_bytes)
+        s["json_decode_ms"] += g.get("json_decode_ms", 0.0)
+        s["json_encode_ms"] += g.get("json_encode_ms", 0.0)
+    return response
+
+
+def _payload_summary() -> dict:
+    with _payload_lock:
+        return {
+            endpoint: {
+                "requests": s["requests"],
+                "avg_request_bytes": round(s["request_bytes"] / s["requests"]),
+                "max_request_bytes": s["max_request_bytes"],
+                "avg_response_bytes": round(s["response_bytes"] / s["requests"]),
+                "max_response_bytes": s["max_response_bytes"],
+                "avg_json_decode_ms": round(s["json_decode_ms"] / s["requests"], 3),
+                "avg_json_encode_ms": round(s["json_encode_ms"] / s["requests"], 3),
+            }
+            for endpoint, s in _payload_stats.items()
+        }
+
+
 # ---------------------------------------------------------------------------
 # In-memory A/B comparison log (last 50 comparisons)
 # ---------------------------------------------------------------------------
 _comparison_log: list[dict] = []
 MAX_COMPARISONS = 50
 
-
-# --- FALLBACK DATA (The Circuit Breaker) ---
-# If AI fails, we return this so the app never crashes during a demo.
+# ---------------------------------------------------------------------------
+# Analysis pipeline mode
+#   rag | baseline | sampled (A/B on AB_SAMPLE_RATE of requests) | concurrent
+#   | map_reduce (every section of the document, see map_reduce.py)
+# ---------------------------------------------------------------------------
+PIPELINE_MODES = ("rag", "baseline", "sampled", "concurrent", "map_reduce")
+REQUEST_PIPELINES = ("rag", "baseline", "map_reduce")  # per-request "pipeline" overrides
+ANALYSIS_PIPELINE_MODE = os.getenv("ANALYSIS_PIPELINE_MODE", "sampled").lower()
+if ANALYSIS_PIPELINE_MODE not in PIPELINE_MODES:
+    print(f"Unknown ANALYSIS_PIPELINE_MODE '{ANALYSIS_PIPELINE_MODE}', using 'rag'")
+    ANALYSIS_PIPELINE_MODE = "rag"
+AB_SAMPLE_RATE = float(os.getenv("AB_SAMPLE_RATE", "0.1"))
+
+# Runs the baseline half of an A/B pair alongside the request thread
+_ab_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="ab-baseline")
+
+# Section and batch-reduce calls of every map-reduce analysis share this
+# pool, so MAP_REDUCE_CONCURRENCY caps those LLM calls across requests
+_map_executor = ThreadPoolExecutor(max_workers=MAP_REDUCE_CONCURRENCY,
+                                   thread_name_prefix="map-section")
+
+# Load MiniLM + FAISS in the background as soon as the worker imports the
+# app, so the first RAG request after a cold start does not pay for it.
+if WARMUP_ENABLED:
+    start_warmup()
+
+
+# --- FALLBACK DATA ---
+# If AI fails (or the gateway's circuit breaker is open), we return this so the app never crashes during a demo.
 MOCK_DATA = {
     "summary": "System Alert: The AI service is currently experiencing high traffic. (Displaying Placeholder) \n\nThis document appears to be a legal agreement or technical specification. It outlines key responsibilities, timelines, and compliance requirements. The primary focus is on data privacy and user obligations.",
     "key_clauses": [
@@ -90,6 +203,27 @@ MOCK_COMPARISON = {
 }
 
 
+# Retrieval for analysis: "multi" runs one query per section of the JSON
+# schema below (batched, merged under a per-section quota); "single" is the
+# original one mixed-topic query.
+ANALYSIS_RETRIEVAL = os.getenv("ANALYSIS_RETRIEVAL", "multi").lower()
+if ANALYSIS_RETRIEVAL not in ("multi", "single"):
+    print(f"Unknown ANALYSIS_RETRIEVAL '{ANALYSIS_RETRIEVAL}', using 'multi'")
+    ANALYSIS_RETRIEVAL = "multi"
+ANALYSIS_QUERIES = {
+    "summary": "overview of the agreement: the parties, its purpose, scope and term",
+    "key_clauses": "termination, liability, indemnification, confidentiality, "
+                   "governing law and dispute resolution clauses",
+    "obligations": "obligations and responsibilities a party shall perform, comply with or pay",
+    "actions": "deadlines, due dates, notice periods, renewal dates and payment dates",
+}
+ANALYSIS_QUERY = (
+    "key legal clauses, obligations, responsibilities, deadlines, "
+    "termination, liability, confidentiality, compliance, penalties, "
+    "summary of the document"
+)
+
+
 def _build_analysis_prompt(context: str) -> str:
     """Build the analysis prompt for a given context string."""
     return f"""
@@ -115,45 +249,161 @@ def _build_analysis_prompt(context: str) -> str:
     """
 
 
-def _call_groq(prompt: str) -> Optional[str]:
-    """Send a prompt to Groq (Llama 3.3) and return raw response."""
+LLM_MODEL = "llama-3.3-70b-versatile"
+
+
+def _chat_completion(messages: list[dict], temperature: Optional[float] = None,
+                     use_cache: bool = True,
+                     cache_if: Optional[Callable[[str], bool]] = None) -> tuple[Optional[str], bool]:
+    """
+    One Groq chat completion through the LLM response cache.
+
+    With *use_cache* False the cached answer is not read, but the fresh
+    one still replaces it. Responses are only cached when *cache_if*
+    (if given) accepts them. Returns (content, served_from_cache); Groq
+    and gateway errors (llm_gateway.LLMUnavailable) propagate to the caller.
+    """
+    key = response_key(messages, LLM_MODEL, temperature)
+    if use_cache:
+        entry = llm_cache.get(key)
+        if entry is not None:
+            return entry["response"], True
+    else:
+        llm_cache.record_bypass()
+
+    kwargs = {} if temperature is None else {"temperature": temperature}
+    t0 = time.perf_counter()
+    content = llm_gateway.complete(messages, LLM_MODEL, **kwargs)
+    if content and (cache_if is None or cache_if(content)):
+        llm_cache.put(key, content, (time.perf_counter() - t0) * 1000)
+    return content, False
+
+
+def _is_json_reply(raw: str) -> bool:
+    try:
+        json.loads(raw.replace("```json", "").replace("```", "").strip())
+        return True
+    except json.JSONDecodeError:
+        return False
+
+
+def _parse_json_reply(raw: Optional[str]) -> Optional[dict]:
+    if not raw:
+        return None
+    try:
+        parsed = json.loads(raw.replace("```json", "").replace("```", "").strip())
+    except json.JSONDecodeError:
+        return None
+    return parsed if isinstance(parsed, dict) else None
+
+
+def _call_groq(prompt: str,
+               system: str = "You are a legal AI assistant. Output strictly JSON.",
+               use_cache: bool = True) -> tuple[Optional[str], bool]:
+    """
+    Send a prompt to Groq (Llama 3.3) and return (raw response, cache_hit).
+    Only replies that parse as JSON are cached.
+    """
     try:
-        chat_completion = client.chat.completions.create(
-            messages=[
-                {"role": "system", "content": "You are a legal AI assistant. Output strictly JSON."},
+        return _chat_completion(
+            [
+                {"role": "system", "content": system},
                 {"role": "user", "content": prompt}
             ],
-            model="llama-3.3-70b-versatile",
-            temperature=0.1,
+            temperature=0.1, use_cache=use_cache, cache_if=_is_json_reply,
         )
-        return chat_completion.choices[0].message.content
     except Exception as e:
         print(f"Groq API Error: {e}")
-        return None
+        return None, False
 
 
 def analyze_with_groq(context: str) -> Optional[str]:
     """Convenience wrapper for backward compatibility."""
-    return _call_groq(_build_analysis_prompt(context))
+    return _call_groq(_build_analysis_prompt(context))[0]
+
+
+def _request_document(data: dict, text_field: str = "text",
+                      id_field: str = "document_id") -> tuple[str, Optional[str], str, bool]:
+    """
+    Document text for a request: the inline *text_field*, else the text
+    registered under *id_field*. Returns (text, index_key, chunk_strategy,
+    unknown_id); the key and strategy are those the registered document's
+    index is cached under, and unknown_id is True when an id was sent but
+    is no longer stored.
+    """
+    text = data.get(text_field) or ""
+    document_id = data.get(id_field)
+    if text or not document_id:
+        return text, None, DEFAULT_CHUNK_STRATEGY, False
+    entry = document_store.get(str(document_id))
+    if entry is None:
+        return "", None, DEFAULT_CHUNK_STRATEGY, True
+    return entry["text"], entry["index_key"], entry["chunk_strategy"], False
+
+
+def _is_id_list(value) -> bool:
+    """True for a JSON list of string ids (a bare string would iterate as characters)."""
+    return isinstance(value, list) and all(isinstance(v, str) for v in value)
+
+
+def _is_page_offsets(value) -> bool:
+    """True for a list of [page, start_offset] integer pairs with non-decreasing offsets."""
+    if not isinstance(value, list):
+        return False
+    last = 0
+    for pair in value:
+        if not (isinstance(pair, list) and len(pair) == 2
+                and all(isinstance(v, int) and not isinstance(v, bool) for v in pair)):
+            return False
+        if pair[1] < last:
+            return False
+        last = pair[1]
+    return True
+
+
+def _unknown_document(document_id):
+    return jsonify({"error": "Unknown or expired document_id. Upload the document again "
+                             "or send its text.", "document_id": document_id}), 404
+
+
+def _request_pipeline(data: dict) -> Optional[str]:
+    """Per-request "pipeline" override (rag / baseline / map_reduce); None keeps the server mode."""
+    pipeline = str(data.get("pipeline") or "").lower()
+    return pipeline if pipeline in REQUEST_PIPELINES else None
+
+
+def _llm_cache_allowed(data: dict) -> bool:
+    """Clients bypass the LLM response cache with "no_cache": true or Cache-Control: no-cache."""
+    return not (data.get("no_cache") or "no-cache" in request.headers.get("Cache-Control", ""))
 
 
 # ---------------------------------------------------------------------------
 # A/B Pipeline Functions
 # ---------------------------------------------------------------------------
 
-def baseline_llm_analysis(text: str) -> dict:
+def _noop_progress(stage: str, **data):
+    """Default progress hook for synchronous callers."""
+
+
+def baseline_llm_analysis(text: str, progress: Callable = _noop_progress,
+                          use_cache: bool = True) -> dict:
     """
     BASELINE approach: send truncated full text directly to LLM.
     No chunking, no embeddings, no retrieval.
-    This is the "old" system for comparison.
+    This is the "old" system for comparison; the text is cut to
+    BASELINE_TOKEN_BUDGET tokens (≈ the original 15,000 characters).
     """
-    truncated = text[:15000]
+    truncated = truncate_to_tokens(
+        text, fit_budget(BASELINE_TOKEN_BUDGET, _build_analysis_prompt(""))
+    )
     input_chars = len(truncated)
     prompt = _build_analysis_prompt(truncated)
+    prompt_tokens = count_tokens(prompt)
 
     t0 = time.perf_counter()
-    raw = _call_groq(prompt)
+    raw, cache_hit = _call_groq(prompt, use_cache=use_cache)
     llm_ms = round((time.perf_counter() - t0) * 1000, 2)
+    progress("baseline_llm", llm_ms=llm_ms, input_chars=input_chars, llm_cache_hit=cache_hit)
 
     result = None
     if raw:
@@ -169,39 +419,59 @@ def baseline_llm_analysis(text: str) -> dict:
             "llm_ms": llm_ms,
             "total_ms": llm_ms,  # no other stages
             "input_chars": input_chars,
+            "prompt_tokens": prompt_tokens,
+            "llm_cache_hit": cache_hit,
         }
     }
 
 
-def rag_llm_analysis(text: str) -> dict:
+def rag_llm_analysis(text: str, progress: Callable = _noop_progress,
+                     use_cache: bool = True, index_key: Optional[str] = None,
+                     chunk_strategy: str = DEFAULT_CHUNK_STRATEGY) -> dict:
     """
     RAG approach: chunk -> embed -> retrieve Top-K -> send context to LLM.
-    This is the current system.
+    This is the current system. *progress* is called after each stage with
+    that stage's timings. *index_key* (known for registered documents,
+    built with *chunk_strategy*) saves hashing the text for the index
+    cache lookup.
     """
     timings = {}
 
     try:
-        rag_store = RAGStore()
-        analysis_query = (
-            "key legal clauses, obligations, responsibilities, deadlines, "
-            "termination, liability, confidentiality, compliance, penalties, "
-            "summary of the document"
-        )
-        rag_context, rag_timings = rag_store.get_context_for_analysis(
-            text, query=analysis_query, top_k=10
-        )
+        # Cached by content hash so a follow-up /chatbot on the same
+        # document reuses this index instead of re-embedding it.
+        rag_store, build_timings = index_cache.get_or_build(text, strategy=chunk_strategy,
+                                                            key=index_key)
+        budget = fit_budget(CONTEXT_TOKEN_BUDGET, _build_analysis_prompt(""))
+        if ANALYSIS_RETRIEVAL == "multi":
+            rag_context, rag_timings = rag_store.context_for_queries(
+                ANALYSIS_QUERIES, budget, build_timings=build_timings,
+            )
+        else:
+            rag_context, rag_timings = rag_store.context_for_query(
+                ANALYSIS_QUERY, top_k=10, build_timings=build_timings, token_budget=budget,
+            )
         timings.update(rag_timings)
+        timings["index_cache"] = index_cache.stats()
+        progress("retrieval", **{k: timings.get(k) for k in (
+            "cache_hit", "n_chunks", "chunk_ms", "embedding_ms", "index_ms",
+            "query_embedding_ms", "retrieval_mode", "retrieval_ms", "total_rag_ms",
+            "context_tokens")})
     except Exception as e:
         print(f"RAG Pipeline Error: {e}")
-        rag_context = text[:15000]
+        rag_context = truncate_to_tokens(text, CONTEXT_TOKEN_BUDGET)
         timings["rag_fallback"] = True
+        progress("retrieval", rag_fallback=True)
 
     input_chars = len(rag_context)
     prompt = _build_analysis_prompt(rag_context)
+    timings["prompt_tokens"] = count_tokens(prompt)
 
     t0 = time.perf_counter()
-    raw = _call_groq(prompt)
+    raw, timings["llm_cache_hit"] = _call_groq(prompt, use_cache=use_cache)
     timings["llm_ms"] = round((time.perf_counter() - t0) * 1000, 2)
+    progress("llm", llm_ms=timings["llm_ms"], input_chars=input_chars,
+             llm_cache_hit=timings["llm_cache_hit"])
     timings["total_ms"] = round(
         timings.get("total_rag_ms", 0) + timings.get("llm_ms", 0), 2
     )
@@ -221,6 +491,236 @@ def rag_llm_analysis(text: str) -> dict:
     }
 
 
+def _build_map_prompt(section: str, index: int, total: int) -> str:
+    """Section-level extraction prompt for the map stage."""
+    return f"""
+    This is section {index} of {total} of a longer document. Extract only what
+    this section contains. Return ONLY valid JSON.
+
+    Structure:
+    {{
+      "summary": "60 word summary of this section",
+      "key_clauses": ["critical legal clauses in this section"],
+      "obligations": ["obligation 1", "obligation 2", ...],
+      "actions": [
+         {{"title": "Event Name", "date": "YYYY-MM-DD", "description": "Brief details"}}
+      ]
+    }}
+
+    Use empty arrays for anything this section does not contain.
+    Convert all dates to YYYY-MM-DD format.
+
+    Section text:
+    {section}
+    """
+
+
+def _build_reduce_prompt(digest: str, n_sections: int) -> str:
+    """Reduce prompt: merge section extractions into the analysis schema."""
+    return f"""
+    Below are extractions from {n_sections} consecutive sections of one document.
+    Combine them into one analysis of the whole document. Return ONLY valid JSON.
+
+    Structure:
+    {{
+      "summary": "200 word summary of the whole document...",
+      "key_clauses": ["each distinct critical legal clause, once"],
+      "obligations": ["obligation 1", "obligation 2", ...],
+      "actions": [
+         {{"title": "Event Name", "date": "YYYY-MM-DD", "description": "Brief details"}}
+      ]
+    }}
+
+    Instructions:
+    - Summarise the document as a whole, not section by section.
+    - Merge clauses and obligations that state the same thing; keep distinct ones.
+    - Keep every dated action, merging repeats of the same event.
+
+    Extractions:
+    {digest}
+    """
+
+
+def _reduce_call(partials: list[Optional[dict]], use_cache: bool = True,
+                 merged: Optional[dict] = None) -> tuple[dict, dict]:
+    """
+    One reduce call over *partials* (their *merged* lists, if already
+    computed). Returns (result, stats); if the reply is not valid JSON the
+    mechanical merge stands in, so the result is never None.
+    """
+    merged = merged or merge_partials(partials)
+    n = len(partials)
+    digest = truncate_to_tokens(
+        render_digest(partials, merged),
+        fit_budget(MAP_REDUCE_DIGEST_TOKENS, _build_reduce_prompt("", n)),
+    )
+    prompt = _build_reduce_prompt(digest, n)
+    raw, cache_hit = _call_groq(prompt, use_cache=use_cache)
+    result = _parse_json_reply(raw)
+    stats = {"prompt_tokens": count_tokens(prompt), "completion_tokens": count_tokens(raw or ""),
+             "llm_cache_hit": cache_hit, "ok": result is not None}
+    if result is None:
+        result = dict(merged, summary=truncate_to_tokens(merged["summary"], 400))
+    elif merged["actions"] and not result.get("actions"):
+        result["actions"] = merged["actions"]
+    return result, stats
+
+
+def map_reduce_analysis(text: str, progress: Callable = _noop_progress,
+                        use_cache: bool = True) -> dict:
+    """
+    MAP-REDUCE approach for documents beyond one context window: split the
+    whole text into sections that each fit the context window, extract
+    each section concurrently (at most MAP_REDUCE_CONCURRENCY calls in
+    flight), merge the partial results (clauses de-duplicated, actions
+    merged by date) and write the final analysis in a reduce call. More
+    than MAP_MAX_SECTIONS partials are first reduced in batches, level by
+    level, so no call's input grows with the document. Unlike RAG, no part
+    of the document is left out; the cost is one LLM call per section.
+    """
+    timings: dict = {}
+    t_start = time.perf_counter()
+
+    section_tokens = fit_budget(MAP_SECTION_TOKENS, _build_map_prompt("", 1, 1))
+    sections = split_sections(text, section_tokens)
+    n = len(sections)
+    timings["section_ms"] = round((time.perf_counter() - t_start) * 1000, 2)
+    timings["n_sections"] = n
+    progress("sectioning", n_sections=n, section_ms=timings["section_ms"])
+
+    # --- Map: one extraction per section, concurrently ---
+    prompts = [_build_map_prompt(s, i, n) for i, s in enumerate(sections, start=1)]
+
+    def run_section(i: int):
+        t = time.perf_counter()
+        raw, cache_hit = _call_groq(prompts[i], use_cache=use_cache)
+        return i, raw, cache_hit, (time.perf_counter() - t) * 1000
+
+    t_map = time.perf_counter()
+    partials: list[Optional[dict]] = [None] * n
+    per_section: list[dict] = [{}] * n
+    for future in as_completed([_map_executor.submit(run_section, i) for i in range(n)]):
+        i, raw, cache_hit, llm_ms = future.result()
+        partials[i] = _parse_json_reply(raw)
+        per_section[i] = {
+            "section": i + 1,
+            "prompt_tokens": count_tokens(prompts[i]),
+            "completion_tokens": count_tokens(raw or ""),
+            "llm_ms": round(llm_ms, 2),
+            "llm_cache_hit": cache_hit,
+            "ok": partials[i] is not None,
+        }
+        progress("map", completed=sum(1 for s in per_section if s), **per_section[i])
+    timings["map_ms"] = round((time.perf_counter() - t_map) * 1000, 2)
+
+    # --- Merge: deterministic de-duplication across sections ---
+    t_merge = time.perf_counter()
+    merged = merge_partials(partials)
+    n_ok = sum(1 for p in partials if p is not None)
+    timings["merge_ms"] = round((time.perf_counter() - t_merge) * 1000, 2)
+
+    # --- Reduce: batches of at most MAP_MAX_SECTIONS partials per call,
+    #     level by level, until one call writes the whole-document analysis ---
+    result = None
+    reduce_stats: list[dict] = []
+    reduce_levels = 0
+    t_reduce = time.perf_counter()
+    if n_ok == 1 and n == 1:
+        result = partials[0]
+    elif n_ok:
+        level = [p for p in partials if p is not None]
+        while len(level) > MAP_MAX_SECTIONS:
+            futures = [_map_executor.submit(_reduce_call, batch, use_cache)
+                       for batch in reduce_batches(level, MAP_MAX_SECTIONS)]
+            replies = [f.result() for f in futures]
+            reduce_stats += [stats for _, stats in replies]
+            level = [reply for reply, _ in replies]
+            reduce_levels += 1
+            progress("reduce_level", level=reduce_levels, partials=len(level))
+        # The final call keeps the merged actions of every section as fallback
+        result, stats = _reduce_call(level, use_cache, merged if not reduce_levels else None)
+        if merged["actions"] and not result.get("actions"):
+            result["actions"] = merged["actions"]
+        reduce_stats.append(stats)
+        reduce_levels += 1
+    timings["reduce_ms"] = round((time.perf_counter() - t_reduce) * 1000, 2)
+    reduce_cache_hits = sum(1 for s in reduce_stats if s["llm_cache_hit"])
+    progress("reduce", reduce_ms=timings["reduce_ms"], sections_ok=n_ok,
+             llm_cache_hit=reduce_cache_hits > 0)
+
+    map_prompt_tokens = sum(s.get("prompt_tokens", 0) for s in per_section)
+    map_completion_tokens = sum(s.get("completion_tokens", 0) for s in per_section)
+    reduce_prompt_tokens = sum(s["prompt_tokens"] for s in reduce_stats)
+    reduce_completion_tokens = sum(s["completion_tokens"] for s in reduce_stats)
+    cache_hits = sum(1 for s in per_section if s.get("llm_cache_hit")) + reduce_cache_hits
+    timings.update({
+        "reduce_levels": reduce_levels,
+        "reduce_calls": len(reduce_stats),
+        "reduce_failed": sum(1 for s in reduce_stats if not s["ok"]),
+        "sections_failed": n - n_ok,
+        "map_prompt_tokens": map_prompt_tokens,
+        "reduce_prompt_tokens": reduce_prompt_tokens,
+        "prompt_tokens": map_prompt_tokens + reduce_prompt_tokens,
+        "completion_tokens": map_completion_tokens + reduce_completion_tokens,
+        "llm_ms": round(timings["map_ms"] + timings["reduce_ms"], 2),
+        "llm_cache_hit": cache_hits > 0,
+        "llm_cache_hits": cache_hits,
+        "input_chars": len(text),
+        "sections": per_section,
+        "total_ms": round((time.perf_counter() - t_start) * 1000, 2),
+    })
+    return {"result": result, "timings": timings}
+
+
+def _run_ab_pipelines(text: str, progress: Callable = _noop_progress,
+                      use_cache: bool = True, index_key: Optional[str] = None,
+                      chunk_strategy: str = DEFAULT_CHUNK_STRATEGY) -> tuple[dict, dict]:
+    """
+    Run BASELINE and RAG with both LLM calls in flight at once.
+    The baseline goes to the shared executor; RAG runs on the calling thread.
+    """
+    baseline_future = _ab_executor.submit(baseline_llm_analysis, text, progress, use_cache)
+    rag = rag_llm_analysis(text, progress, use_cache, index_key, chunk_strategy)
+    return baseline_future.result(), rag
+
+
+def _build_comparison(baseline: dict, rag: dict) -> dict:
+    """Compute the A/B comparison block from two pipeline outputs."""
+    baseline_latency = baseline["timings"]["total_ms"]
+    rag_latency = rag["timings"]["total_ms"]
+    baseline_input = baseline["timings"]["input_chars"]
+    rag_input = rag["timings"]["input_chars"]
+
+    latency_reduction = round(
+        ((baseline_latency - rag_latency) / baseline_latency) * 100, 2
+    ) if baseline_latency > 0 else 0
+
+    input_reduction = round(
+        ((baseline_input - rag_input) / baseline_input) * 100, 2
+    ) if baseline_input > 0 else 0
+
+    return {
+        "baseline": {
+            "latency_ms": baseline_latency,
+            "input_chars": baseline_input,
+            "prompt_tokens": baseline["timings"].get("prompt_tokens", 0),
+        },
+        "rag": {
+            "latency_ms": rag_latency,
+            "input_chars": rag_input,
+            "prompt_tokens": rag["timings"].get("prompt_tokens", 0),
+            "n_chunks": rag["timings"].get("n_chunks", 0),
+            "embedding_ms": rag["timings"].get("embedding_ms", 0),
+            "retrieval_ms": rag["timings"].get("retrieval_ms", 0),
+        },
+        "comparison": {
+            "latency_reduction_percent": latency_reduction,
+            "input_reduction_percent": input_reduction,
+            "rag_is_faster": rag_latency < baseline_latency,
+        }
+    }
+
+
 # ---------------------------------------------------------------------------
 # ENDPOINTS
 # ---------------------------------------------------------------------------
@@ -231,14 +731,28 @@ def index():
     return jsonify({
         "name": "DocBrief API",
         "status": "online",
-        "endpoints": ["/health", "/keep-alive", "/extract_text", "/analyze_document", "/chatbot"]
+        "endpoints": ["/health", "/ready", "/keep-alive", "/extract_text", "/analyze_document",
+                      "/jobs/analyze_document", "/chatbot", "/documents/<id>",
+                      "/corpus/documents", "/corpus/query"]
     })
 
 
 @app.route('/health', methods=['GET'])
 def health():
-    """Simple healthcheck endpoint."""
-    return jsonify({"status": "ok", "service": "docbrief-backend"})
+    """
+    Liveness plus readiness: always 200 while the process serves requests;
+    "ready" turns true once the embedding model and FAISS are warmed up.
+    """
+    warmup = warmup_status()
+    return jsonify({"status": "ok", "service": "docbrief-backend",
+                    "alive": True, "ready": warmup["ready"], "warmup": warmup})
+
+
+@app.route('/ready', methods=['GET'])
+def ready():
+    """Readiness probe: 503 until warm-up has finished, so traffic can wait for it."""
+    warmup = warmup_status()
+    return jsonify({"ready": warmup["ready"], "warmup": warmup}), 200 if warmup["ready"] else 503
 
 
 @app.route('/keep-alive', methods=['GET'])
@@ -255,6 +769,10 @@ def keep_alive():
     supabase_key = os.getenv("SUPABASE_KEY")
     
     status = {"backend_status": "awake", "supabase_status": "skipped", "timestamp": time.time()}
+
+    # A ping that lands on a freshly restarted worker also starts (or retries) warm-up
+    start_warmup()
+    status["rag_ready"] = warmup_status()["ready"]
     
     if supabase_url and supabase_key:
         try:
@@ -281,8 +799,75 @@ def keep_alive():
     return jsonify(status)
 
 
+def _extract_pdf_streaming(data: bytes,
+                           build_index: bool = True) -> tuple[str, dict, list[dict], Optional[str]]:
+    """
+    Parse a PDF page by page and index it while parsing.
+
+    Pages come back in order from ``extraction.iter_pdf_pages`` (fanned out
+    over the process pool for large PDFs) and are yielded into
+    ``index_cache.build_from_stream`` so chunks are embedded before the last
+    page is parsed. The finished index is cached under the full text's key
+    (returned last, None if indexing failed) for the follow-up
+    /analyze_document call. If indexing fails, the remaining pages are
+    still extracted. With *build_index* False the pages are only extracted
+    (rag timings and key come back None).
+    """
+    parts: list[str] = []
+    page_timings: list[dict] = []
+    pdf_error = None
+    n_chars = 0
+
+    def pages():
+        nonlocal pdf_error, n_chars
+        try:
+            for page_no, page_text, page_ms, source in iter_pdf_pages(data):
+                page_timings.append({"page": page_no + 1, "ms": page_ms, "source": source,
+                                     "offset": n_chars})
+                if page_text:
+                    part = page_text + "\n"
+                    parts.append(part)
+                    n_chars += len(part)
+                    yield part
+        except Exception as e:
+            pdf_error = e
+            raise
+
+    stream = pages()
+    index_key = None
+    if not build_index:
+        for _ in stream:
+            pass
+        return "".join(parts), None, page_timings, None
+    try:
+        _, rag_timings, index_key = index_cache.build_from_stream(
+            stream, strategy=DOCUMENT_CHUNK_STRATEGY
+        )
+    except Exception as e:
+        if pdf_error is not None:
+            raise
+        print(f"Streaming RAG index error: {e}")
+        rag_timings = {"rag_fallback": True}
+        for _ in stream:
+            pass
+
+    return "".join(parts), rag_timings, page_timings, index_key
+
+
 @app.route('/extract_text', methods=['POST'])
 def extract_text():
+    """
+    Extract text from an uploaded PDF, image or .txt file and register it
+    in the document store. The response carries a compact document_id that
+    /analyze_document, /chatbot, /jobs/analyze_document and
+    /compare_documents accept instead of the text; pass include_text=false
+    (form field or query parameter) to leave the text out of the response.
+
+    An edited version of an earlier upload can pass that upload's id as
+    previous_document_id: the new version's index then reuses the stored
+    embeddings of every unchanged chunk and embeds only new or changed ones
+    (counts in metrics.rag and metrics.version).
+    """
     if 'file' not in request.files:
         return jsonify({"error": "No file part"}), 400
 
@@ -296,26 +881,30 @@ def extract_text():
         file_ext = os.path.splitext(filename)[1].lower()
         text = ""
 
-        # 1. Handle PDF
+        rag_timings = None
+        index_key = None
+        page_timings: list[dict] = []
+        previous_id = request.values.get("previous_document_id")
+        previous = document_store.get(previous_id) if previous_id else None
+
+        # 1. Handle PDF (pages stream straight into the chunker + embedder,
+        #    unless the index is built incrementally from a previous version)
         if file_ext == '.pdf':
-            reader = PdfReader(file)
-            for page in reader.pages:
-                page_text = page.extract_text()
-                if page_text:
-                    text += page_text + "\n"
+            text, rag_timings, page_timings, index_key = _extract_pdf_streaming(
+                file.read(), build_index=previous is None
+            )
 
-        # 2. Handle Images (OCR)
+        # 2. Handle Images (OCR, one job per frame for multi-frame TIFFs)
         elif file_ext in ['.png', '.jpg', '.jpeg', '.tiff']:
             try:
-                image = Image.open(file)
-                image = image.convert('L')  # Grayscale for speed
-
-                max_dimension = 1200
-                if max(image.size) > max_dimension:
-                    image.thumbnail((max_dimension, max_dimension), Image.Resampling.LANCZOS)
-
-                custom_config = r'--psm 3'
-                text = pytesseract.image_to_string(image, config=custom_config)
+                frames = []
+                offset = 0
+                for frame_no, frame_text, frame_ms, source in iter_image_frames(file.read(), file_ext):
+                    page_timings.append({"page": frame_no + 1, "ms": frame_ms, "source": source,
+                                         "offset": offset})
+                    frames.append(frame_text)
+                    offset += len(frame_text) + 1
+                text = "\n".join(frames)
             except Exception as e:
                 print(f"OCR Error: {e}")
                 return jsonify({"error": "Failed to process image. Ensure it is clear."}), 400
@@ -330,90 +919,240 @@ def extract_text():
         extraction_ms = round((time.perf_counter() - t_start) * 1000, 2)
 
         if not text.strip():
-            return jsonify({"error": "No text found. If this is a scanned PDF, try converting to Image first."}), 400
-
-        _log_metrics("/extract_text", {"extraction_ms": extraction_ms, "text_length": len(text)})
-        return jsonify({"text": text, "metrics": {"extraction_ms": extraction_ms}})
+            return jsonify({"error": "No text found. The document may be blank or too low-quality to OCR."}), 400
+
+        extract_metrics = {"extraction_ms": extraction_ms}
+        if page_timings:
+            extract_metrics["n_pages"] = len(page_timings)
+            extract_metrics["extract_workers"] = EXTRACT_WORKERS
+            extract_metrics["pages"] = page_timings
+            sources = [p["source"] for p in page_timings]
+            extract_metrics["ocr_pages"] = sum(src in ("ocr", "ocr_cache") for src in sources)
+            extract_metrics["ocr_cache_hits"] = sources.count("ocr_cache")
+            extract_metrics["ocr_skipped"] = sources.count("ocr_skipped")
+        if previous_id:
+            extract_metrics["version"] = {"previous_document_id": previous_id,
+                                          "previous_found": previous is not None}
+        if previous is not None:
+            try:
+                index_key = document_key(text, strategy=DOCUMENT_CHUNK_STRATEGY)
+                _, rag_timings = index_cache.get_or_build(
+                    text, strategy=DOCUMENT_CHUNK_STRATEGY, key=index_key,
+                    previous_key=previous["index_key"],
+                )
+                for k in ("incremental", "chunks_reused", "chunks_embedded", "chunks_removed"):
+                    if k in rag_timings:
+                        extract_metrics["version"][k] = rag_timings[k]
+            except Exception as e:
+                print(f"Incremental RAG index error: {e}")
+                rag_timings = {"rag_fallback": True}
+        if rag_timings is not None:
+            extract_metrics["rag"] = rag_timings
+
+        meta = {"previous_document_id": previous_id} if previous is not None else {}
+        # [page, start_offset] pairs, kept with the document for /corpus/documents
+        page_offsets = [[p["page"], p["offset"]] for p in page_timings] or None
+        if page_offsets:
+            meta["page_offsets"] = page_offsets
+        document_id = document_store.register(text, index_key, filename=filename, **meta)
+        include_text = request.values.get("include_text", "true").lower() not in ("0", "false", "no")
+        body = {"document_id": document_id, "n_chars": len(text), "metrics": extract_metrics}
+        if page_offsets:
+            body["page_offsets"] = page_offsets
+        if include_text or document_id is None:
+            body["text"] = text
+        _log_metrics("/extract_text", {**extract_metrics, "text_length": len(text),
+                                       "document_id": document_id, "text_returned": "text" in body})
+        return jsonify(body)
 
     except Exception as e:
         print(f"Error extracting text: {e}")
         return jsonify({"error": str(e)}), 500
 
 
+def run_analysis(text: str, progress: Callable = _noop_progress,
+                 use_cache: bool = True, index_key: Optional[str] = None,
+                 pipeline: Optional[str] = None,
+                 chunk_strategy: str = DEFAULT_CHUNK_STRATEGY) -> dict:
+    """
+    Analysis pipeline (mode set by ANALYSIS_PIPELINE_MODE, or per request
+    by *pipeline*, one of REQUEST_PIPELINES):
+      - rag        : RAG only (chunk → embed → retrieve → LLM)
+      - baseline   : full-context truncation → LLM only
+      - sampled    : RAG only, plus a concurrent A/B run for AB_SAMPLE_RATE of requests
+      - concurrent : BASELINE and RAG on every request, both LLM calls in flight at once
+      - map_reduce : every section extracted concurrently, then one reduce call
+    In rag / sampled mode, documents of at least MAP_REDUCE_MIN_TOKENS
+    (estimated) go to map_reduce instead.
+    When both pipelines run, reduction percentages are logged to /compare_pipelines
+    (unless either answer came from the LLM response cache, which would skew latency).
+    Returns the response body: analysis JSON plus _metrics (and _comparison).
+    """
+    mode = pipeline or ANALYSIS_PIPELINE_MODE
+    if (pipeline is None and mode in ("rag", "sampled") and MAP_REDUCE_MIN_TOKENS
+            and len(text) // CHARS_PER_TOKEN >= MAP_REDUCE_MIN_TOKENS):
+        mode = "map_reduce"
+    run_ab = mode == "concurrent" or (
+        mode == "sampled" and random.random() < AB_SAMPLE_RATE
+    )
+
+    baseline = rag = mapped = None
+    if run_ab:
+        baseline, rag = _run_ab_pipelines(text, progress, use_cache, index_key, chunk_strategy)
+    elif mode == "baseline":
+        baseline = baseline_llm_analysis(text, progress, use_cache)
+    elif mode == "map_reduce":
+        mapped = map_reduce_analysis(text, progress, use_cache)
+    else:
+        rag = rag_llm_analysis(text, progress, use_cache, index_key, chunk_strategy)
+
+    primary = next(p for p in (mapped, rag, baseline) if p is not None)
+    timings = primary["timings"]
+    timings["pipeline_mode"] = mode
+    timings["ab_sampled"] = run_ab
+
+    comparison = None
+    if run_ab:
+        comparison = _build_comparison(baseline, rag)
+
+        # Log comparison
+        if not (baseline["timings"]["llm_cache_hit"] or rag["timings"]["llm_cache_hit"]):
+            comp_entry = {"timestamp": time.time(), "text_length": len(text), **comparison}
+            _comparison_log.append(comp_entry)
+            if len(_comparison_log) > MAX_COMPARISONS:
+                _comparison_log.pop(0)
+
+    _log_metrics("/analyze_document", timings)
+
+    # Prefer the map-reduce / RAG result, fall back to the baseline, then to mock data
+    result = next(
+        (p["result"] for p in (mapped, rag, baseline) if p is not None and p["result"]),
+        None,
+    ) or dict(MOCK_DATA)
+
+    # Attach metrics and comparison
+    if isinstance(result, dict):
+        result["_metrics"] = timings
+        if comparison is not None:
+            result["_comparison"] = comparison
+
+    return result
+
+
 @app.route('/analyze_document', methods=['POST'])
 @limiter.limit("10 per minute")
 def analyze_document():
     """
-    A/B Comparison Pipeline:
-      1. Run BASELINE (full-context truncation → LLM)
-      2. Run RAG (chunk → embed → retrieve → LLM)
-      3. Measure both, compute reduction percentages
-      4. Return RAG result as primary + comparison metrics
+    Synchronous analysis of "text" or a registered "document_id"; see
+    :func:`run_analysis` for the pipeline modes.
     """
     data = request.get_json()
-    text = data.get("text", "")
+    text, index_key, chunk_strategy, unknown = _request_document(data)
+    if unknown:
+        return _unknown_document(data.get("document_id"))
 
     if not text:
         return jsonify({"error": "No text provided"}), 400
 
-    # --- Run BASELINE pipeline ---
-    baseline = baseline_llm_analysis(text)
+    return jsonify(run_analysis(text, use_cache=_llm_cache_allowed(data), index_key=index_key,
+                                pipeline=_request_pipeline(data), chunk_strategy=chunk_strategy))
 
-    # --- Run RAG pipeline ---
-    rag = rag_llm_analysis(text)
 
-    # --- Compute A/B comparison ---
-    baseline_latency = baseline["timings"]["total_ms"]
-    rag_latency = rag["timings"]["total_ms"]
-    baseline_input = baseline["timings"]["input_chars"]
-    rag_input = rag["timings"]["input_chars"]
+CHAT_FALLBACK_REPLY = "I'm having trouble connecting to the brain right now. Please try again."
 
-    latency_reduction = round(
-        ((baseline_latency - rag_latency) / baseline_latency) * 100, 2
-    ) if baseline_latency > 0 else 0
 
-    input_reduction = round(
-        ((baseline_input - rag_input) / baseline_input) * 100, 2
-    ) if baseline_input > 0 else 0
+def _chat_retrieval(chat_input: str, context: str, index_key: Optional[str] = None,
+                    chunk_strategy: str = DEFAULT_CHUNK_STRATEGY) -> tuple[str, dict]:
+    """
+    Pack the best chunks for *chat_input* into CHAT_TOKEN_BUDGET tokens;
+    falls back to the document truncated to the same budget.
+    """
+    timings = {}
+    budget = fit_budget(CHAT_TOKEN_BUDGET, _chat_messages("", chat_input)[0]["content"] + chat_input)
+    chat_context = ""
+    if context:
+        try:
+            rag_store, build_timings = index_cache.get_or_build(context, strategy=chunk_strategy,
+                                                                key=index_key)
+            timings["index_cache"] = index_cache.stats()
+
+            chat_context, rag_timings = rag_store.context_for_query(
+                chat_input, top_k=5, build_timings=build_timings, token_budget=budget
+            )
+            timings.update(rag_timings)
+        except Exception as e:
+            print(f"Chatbot RAG Error: {e}")
+            # Falls back to truncated context
+        if not chat_context:
+            chat_context = truncate_to_tokens(context, budget)
+    return chat_context, timings
 
-    comparison = {
-        "baseline": {
-            "latency_ms": baseline_latency,
-            "input_chars": baseline_input,
-        },
-        "rag": {
-            "latency_ms": rag_latency,
-            "input_chars": rag_input,
-            "n_chunks": rag["timings"].get("n_chunks", 0),
-            "embedding_ms": rag["timings"].get("embedding_ms", 0),
-            "retrieval_ms": rag["timings"].get("retrieval_ms", 0),
-        },
-        "comparison": {
-            "latency_reduction_percent": latency_reduction,
-            "input_reduction_percent": input_reduction,
-            "rag_is_faster": rag_latency < baseline_latency,
-        }
-    }
 
-    # Log comparison
-    comp_entry = {"timestamp": time.time(), "text_length": len(text), **comparison}
-    _comparison_log.append(comp_entry)
-    if len(_comparison_log) > MAX_COMPARISONS:
-        _comparison_log.pop(0)
+def _chat_prompt_tokens(chat_context: str, chat_input: str) -> int:
+    return sum(count_tokens(m["content"]) for m in _chat_messages(chat_context, chat_input))
 
-    _log_metrics("/analyze_document", rag["timings"])
 
-    # Use RAG result as primary response
-    result = rag["result"] if rag["result"] else (
-        baseline["result"] if baseline["result"] else MOCK_DATA
-    )
+def _corpus_chat_retrieval(chat_input: str, document_ids: Optional[list]) -> tuple[str, dict]:
+    """Retrieve the Top-5 chunks for *chat_input* from corpus documents (None → all)."""
+    hits, timings = corpus_index.query(chat_input, document_ids=document_ids, top_k=5)
+    timings["sources"] = [{k: h[k] for k in ("document_id", "page", "start", "end", "score")}
+                          for h in hits]
+    return format_hits(hits), timings
 
-    # Attach metrics and comparison
-    if isinstance(result, dict):
-        result["_metrics"] = rag["timings"]
-        result["_comparison"] = comparison
 
-    return jsonify(result)
+def _chat_messages(chat_context: str, chat_input: str) -> list[dict]:
+    return [
+        {"role": "system", "content": f"You are a helpful document assistant. Answer the user's question based ONLY on the following retrieved context:\n\n{chat_context}"},
+        {"role": "user", "content": chat_input}
+    ]
+
+
+def _stream_chat(chat_input: str, chat_context: str, timings: dict, use_cache: bool = True):
+    """
+    SSE generator for a streamed chatbot reply:
+      event: retrieval  → retrieval metrics (sent before the LLM is called)
+      event: token      → {"delta": "..."} per Groq chunk
+      event: done       → {"reply": full text, "_metrics": timings incl. ttft_ms}
+    A reply served from the LLM response cache arrives as a single token event.
+    """
+    yield sse_format(timings, "retrieval")
+
+    messages = _chat_messages(chat_context, chat_input)
+    key = response_key(messages, LLM_MODEL, None)
+    t_llm = time.perf_counter()
+    cached = llm_cache.get(key) if use_cache else None
+    timings["llm_cache_hit"] = cached is not None
+    if cached is not None:
+        timings["ttft_ms"] = timings["llm_ms"] = round((time.perf_counter() - t_llm) * 1000, 2)
+        _log_metrics("/chatbot", timings)
+        yield sse_format({"delta": cached["response"]}, "token")
+        yield sse_format({"reply": cached["response"], "_metrics": timings}, "done")
+        return
+    if not use_cache:
+        llm_cache.record_bypass()
+
+    parts: list[str] = []
+    try:
+        for delta in llm_gateway.stream(messages, LLM_MODEL):
+            if not parts:
+                timings["ttft_ms"] = round((time.perf_counter() - t_llm) * 1000, 2)
+            parts.append(delta)
+            yield sse_format({"delta": delta}, "token")
+        reply = "".join(parts)
+        if reply:
+            llm_cache.put(key, reply, (time.perf_counter() - t_llm) * 1000)
+    except Exception as e:
+        print(f"Chatbot Stream Error: {e}")
+        reply = "".join(parts) or CHAT_FALLBACK_REPLY
+        if not parts:
+            yield sse_format({"delta": reply}, "token")
+        timings["stream_error"] = True
+
+    timings["llm_ms"] = round((time.perf_counter() - t_llm) * 1000, 2)
+    if "ttft_ms" in timings:
+        timings["generation_ms"] = round(timings["llm_ms"] - timings["ttft_ms"], 2)
+    _log_metrics("/chatbot", timings)
+    yield sse_format({"reply": reply, "_metrics": timings}, "done")
 
 
 @app.route('/chatbot', methods=['POST'])
@@ -425,59 +1164,70 @@ def chatbot():
       2. Embed the question
       3. Retrieve Top-5 relevant chunks from document
       4. Send ONLY retrieved chunks + question to Llama-3.3
+    Instead of "context", "document_id" names a document registered by
+    /extract_text, and "document_ids" (a list, or "*" for the whole corpus)
+    retrieves across documents already added via /corpus/documents.
+    With "stream": true (or Accept: text/event-stream) the reply is streamed
+    token by token as Server-Sent Events; otherwise one JSON body is returned.
+    Replies are served from the LLM response cache unless "no_cache" is set.
     """
     data = request.get_json()
     chat_input = data.get("chatInput", "")
-    context = data.get("context", "")
+    context, index_key, chunk_strategy, unknown = _request_document(data, text_field="context")
+    if unknown:
+        return _unknown_document(data.get("document_id"))
+    want_stream = bool(data.get("stream")) or (
+        request.accept_mimetypes.best == "text/event-stream"
+    )
 
-    timings = {}
+    document_ids = data.get("document_ids")
+    if document_ids and document_ids != "*" and not _is_id_list(document_ids):
+        return jsonify({"error": 'document_ids must be a list of ids or "*".'}), 400
 
     # --- RAG Retrieval for chatbot ---
-    chat_context = context[:10000]  # default fallback
-    if context:
-        try:
-            rag_store = RAGStore()
-            build_timings = rag_store.build_index(context)
-            timings.update(build_timings)
-
-            retrieved_chunks, query_timings = rag_store.query(chat_input, top_k=5)
-            timings.update(query_timings)
+    if document_ids:
+        chat_context, timings = _corpus_chat_retrieval(
+            chat_input, None if document_ids == "*" else document_ids
+        )
+    else:
+        chat_context, timings = _chat_retrieval(chat_input, context, index_key, chunk_strategy)
+    timings["prompt_tokens"] = _chat_prompt_tokens(chat_context, chat_input)
+    use_cache = _llm_cache_allowed(data)
 
-            if retrieved_chunks:
-                chat_context = "\n\n---\n\n".join(retrieved_chunks)
-        except Exception as e:
-            print(f"Chatbot RAG Error: {e}")
-            # Falls back to truncated context
+    if want_stream:
+        return Response(stream_with_context(_stream_chat(chat_input, chat_context, timings,
+                                                         use_cache)),
+                        mimetype="text/event-stream",
+                        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
     try:
         t_llm = time.perf_counter()
-        chat_completion = client.chat.completions.create(
-            messages=[
-                {"role": "system", "content": f"You are a helpful document assistant. Answer the user's question based ONLY on the following retrieved context:\n\n{chat_context}"},
-                {"role": "user", "content": chat_input}
-            ],
-            model="llama-3.3-70b-versatile",
+        reply, timings["llm_cache_hit"] = _chat_completion(
+            _chat_messages(chat_context, chat_input), use_cache=use_cache
         )
-        reply = chat_completion.choices[0].message.content
         timings["llm_ms"] = round((time.perf_counter() - t_llm) * 1000, 2)
     except Exception as e:
-        reply = "I'm having trouble connecting to the brain right now. Please try again."
+        reply = CHAT_FALLBACK_REPLY
         print(f"Chatbot Error: {e}")
 
     _log_metrics("/chatbot", timings)
     return jsonify({"reply": reply, "_metrics": timings})
 
 
-@app.route('/compare_documents', methods=['POST'])
-def compare_documents():
-    data = request.get_json()
-    text1 = data.get("text1", "")
-    text2 = data.get("text2", "")
+# ---------------------------------------------------------------------------
+# Document comparison (aligned retrieval instead of blind truncation)
+# ---------------------------------------------------------------------------
+COMPARE_CONTEXT_TOKENS = int(os.getenv("COMPARE_CONTEXT_TOKENS", "3000"))
+COMPARE_PAIR_SHARE = 0.6         # share of the budget reserved for aligned pairs
+COMPARE_IDENTICAL_SCORE = 0.95   # pairs above this are sent once, not twice
+COMPARE_QUERY = (
+    "obligations, rights, termination, liability, indemnity, payment terms, "
+    "penalties, confidentiality, deadlines, governing law, dispute resolution"
+)
 
-    if not text1 or not text2:
-        return jsonify({"error": "Both documents must be provided."}), 400
 
-    prompt = f"""
+def _build_compare_prompt(context: str) -> str:
+    return f"""
     Compare the following two documents. Return ONLY valid JSON.
 
     Structure:
@@ -487,35 +1237,342 @@ def compare_documents():
         "verdict": "A brief conclusion on which document is 'stricter' or 'better' (max 2 sentences)."
     }}
 
-    --- DOCUMENT A ---
-    {text1[:7000]}
+    {context}
+    """
+
+
+def _truncated_compare_context(text1: str, text2: str, limit: int) -> str:
+    return f"""--- DOCUMENT A ---
+    {text1[:limit]}
 
     --- DOCUMENT B ---
-    {text2[:7000]}
+    {text2[:limit]}"""
+
+
+def _select_compare_sections(store_a, store_b, alignment: dict,
+                             budget: int) -> tuple[str, dict]:
+    """
+    Pack aligned pairs and unmatched chunks into *budget* tokens.
+
+    Pairs get COMPARE_PAIR_SHARE of the budget first, then unmatched chunks
+    from either side, then leftover pairs; within each group chunks are
+    taken by relevance to COMPARE_QUERY, with identical pairs last. The result is laid out in document
+    order so the LLM reads clauses in their original sequence.
+    """
+    rel_a, score_timings_a = store_a.score_chunks(COMPARE_QUERY)
+    rel_b, _ = store_b.score_chunks(COMPARE_QUERY)
+
+    # Pairs that differ say more about the comparison than identical ones
+    pairs = sorted(alignment["pairs"], key=lambda p: (p[2] >= COMPARE_IDENTICAL_SCORE,
+                                                      -max(rel_a[p[0]], rel_b[p[1]])))
+    unmatched = sorted([("a", i) for i in alignment["only_a"]] +
+                       [("b", j) for j in alignment["only_b"]],
+                       key=lambda u: -(rel_a[u[1]] if u[0] == "a" else rel_b[u[1]]))
+
+    def pair_cost(p):
+        a, b = store_a.chunks[p[0]], store_b.chunks[p[1]]
+        if p[2] >= COMPARE_IDENTICAL_SCORE:
+            return count_tokens(a)
+        return count_tokens(a) + count_tokens(b)
+
+    used = 0
+    chosen_pairs, chosen_a, chosen_b = [], [], []
+    leftover_pairs = []
+    for p in pairs:
+        if used + pair_cost(p) <= budget * COMPARE_PAIR_SHARE:
+            chosen_pairs.append(p)
+            used += pair_cost(p)
+        else:
+            leftover_pairs.append(p)
+    for side, i in unmatched:
+        cost = count_tokens((store_a if side == "a" else store_b).chunks[i])
+        if used + cost <= budget:
+            (chosen_a if side == "a" else chosen_b).append(i)
+            used += cost
+    for p in leftover_pairs:
+        if used + pair_cost(p) <= budget:
+            chosen_pairs.append(p)
+            used += pair_cost(p)
+
+    blocks = ["--- ALIGNED SECTIONS (matched by meaning across A and B) ---"]
+    for n, (i, j, score) in enumerate(sorted(chosen_pairs), 1):
+        if score >= COMPARE_IDENTICAL_SCORE:
+            blocks.append(f"[Section {n}, identical in A and B]\n{store_a.chunks[i]}")
+        else:
+            blocks.append(f"[Section {n}, similarity {score:.2f}]\n"
+                          f"A: {store_a.chunks[i]}\nB: {store_b.chunks[j]}")
+    blocks.append("--- ONLY IN DOCUMENT A ---")
+    blocks.extend(store_a.chunks[i] for i in sorted(chosen_a))
+    blocks.append("--- ONLY IN DOCUMENT B ---")
+    blocks.extend(store_b.chunks[j] for j in sorted(chosen_b))
+
+    return "\n\n".join(blocks), {
+        "query_embedding_ms": score_timings_a["query_embedding_ms"],
+        "pairs_sent": len(chosen_pairs),
+        "only_a_sent": len(chosen_a),
+        "only_b_sent": len(chosen_b),
+        "pairs_dropped": len(alignment["pairs"]) - len(chosen_pairs),
+        "unmatched_dropped": len(unmatched) - len(chosen_a) - len(chosen_b),
+    }
+
+
+def rag_compare_documents(text1: str, text2: str, use_cache: bool = True,
+                          keys: tuple[Optional[str], Optional[str]] = (None, None),
+                          strategies: tuple[str, str] = (DEFAULT_CHUNK_STRATEGY,
+                                                         DEFAULT_CHUNK_STRATEGY)
+                          ) -> tuple[Optional[dict], dict]:
+    """
+    Comparison pipeline: index both documents (via the shared index cache),
+    align their chunks by embedding similarity, and send only aligned pairs
+    and unmatched chunks to the LLM. Documents that fit the budget together
+    are sent whole. *keys* and *strategies* are the index keys and chunk
+    strategies of registered documents, so their cached (e.g. incrementally
+    built) indexes are used.
+
+    Returns (parsed_result or None, timings).
+    """
+    timings: dict = {"baseline_input_chars": len(_truncated_compare_context(text1, text2, 7000))}
+    budget = fit_budget(COMPARE_CONTEXT_TOKENS, _build_compare_prompt(""))
+
+    if fits_tokens([text1, text2], budget):
+        context = _truncated_compare_context(text1, text2, len(text1) + len(text2))
+        timings["compare_mode"] = "full"
+    else:
+        try:
+            t0 = time.perf_counter()
+            store_a, timings_a = index_cache.get_or_build(text1, strategy=strategies[0],
+                                                          key=keys[0])
+            store_b, timings_b = index_cache.get_or_build(text2, strategy=strategies[1],
+                                                          key=keys[1])
+            for key in ("chunk_ms", "embedding_ms", "index_ms", "n_chunks"):
+                timings[key] = round(timings_a.get(key, 0) + timings_b.get(key, 0), 2)
+            timings["cache_hit"] = [timings_a.get("cache_hit", False),
+                                    timings_b.get("cache_hit", False)]
+            diff = store_b.diff(store_a)
+            timings["chunks_unchanged"] = diff["unchanged"]
+            timings["chunks_added"] = len(diff["added"])
+            timings["chunks_removed"] = len(diff["removed"])
+
+            alignment, align_timings = align_stores(store_a, store_b)
+            timings.update(align_timings)
+            context, select_timings = _select_compare_sections(
+                store_a, store_b, alignment, budget
+            )
+            timings.update(select_timings)
+            timings["total_rag_ms"] = round((time.perf_counter() - t0) * 1000, 2)
+            timings["index_cache"] = index_cache.stats()
+            timings["compare_mode"] = "aligned"
+        except Exception as e:
+            print(f"Comparison RAG Error: {e}")
+            context = _truncated_compare_context(text1, text2, 7000)
+            timings["rag_fallback"] = True
+            timings["compare_mode"] = "truncated"
+
+    input_chars = len(context)
+    prompt = _build_compare_prompt(context)
+    timings["prompt_tokens"] = count_tokens(prompt)
+    t_llm = time.perf_counter()
+    raw, timings["llm_cache_hit"] = _call_groq(
+        prompt, system="You are a helpful analyst. Output strictly JSON.", use_cache=use_cache
+    )
+    timings["llm_ms"] = round((time.perf_counter() - t_llm) * 1000, 2)
+    timings["total_ms"] = round(timings.get("total_rag_ms", 0) + timings["llm_ms"], 2)
+    timings["input_chars"] = input_chars
+    timings["input_reduction_percent"] = round(
+        (timings["baseline_input_chars"] - input_chars) / timings["baseline_input_chars"] * 100, 2
+    ) if timings["baseline_input_chars"] else 0
+
+    result = None
+    if raw:
+        try:
+            result = json.loads(raw.replace("```json", "").replace("```", "").strip())
+        except json.JSONDecodeError:
+            pass
+    return result, timings
+
+
+@app.route('/compare_documents', methods=['POST'])
+def compare_documents():
+    """
+    Compare two documents on their aligned clauses and unmatched content
+    rather than on the first 7,000 characters of each. Each side is sent
+    as "text1" / "text2" or as a registered "document_id1" / "document_id2".
+    """
+    data = request.get_json()
+    text1, key1, strategy1, unknown1 = _request_document(data, "text1", "document_id1")
+    text2, key2, strategy2, unknown2 = _request_document(data, "text2", "document_id2")
+    if unknown1 or unknown2:
+        return _unknown_document(data.get("document_id1") if unknown1 else data.get("document_id2"))
+
+    if not text1 or not text2:
+        return jsonify({"error": "Both documents must be provided."}), 400
+
+    parsed_data, timings = rag_compare_documents(text1, text2, _llm_cache_allowed(data),
+                                                 (key1, key2), (strategy1, strategy2))
+    _log_metrics("/compare_documents", timings)
+    if parsed_data is None:
+        print("Comparison Error: no valid JSON from LLM")
+        return jsonify({**MOCK_COMPARISON, "_metrics": timings})
+    parsed_data["_metrics"] = timings
+    return jsonify(parsed_data)
+
+
+@app.route('/corpus/documents', methods=['POST'])
+@limiter.limit("20 per minute")
+def add_corpus_document():
+    """
+    Add (or replace) a document in the long-lived corpus index.
+    Body: {"text", "document_id"?, "title"?, "page_offsets"?: [[page, start], ...]}
+    Without "text", "document_id" names a document registered by
+    /extract_text: its text, index and page offsets are taken from there.
     """
+    data = request.get_json()
+    text = data.get("text", "")
+    page_offsets = data.get("page_offsets")
+    title = data.get("title")
+    if page_offsets is not None and not _is_page_offsets(page_offsets):
+        return jsonify({"error": "page_offsets must be a list of [page, start_offset] integer "
+                                 "pairs with non-decreasing offsets."}), 400
+    index_key = None
+    strategy = DEFAULT_CHUNK_STRATEGY
+
+    if not text and data.get("document_id"):
+        entry = document_store.get(str(data["document_id"]))
+        if entry is None:
+            return _unknown_document(data["document_id"])
+        text, index_key, strategy = entry["text"], entry["index_key"], entry["chunk_strategy"]
+        page_offsets = page_offsets or entry.get("page_offsets")
+        title = title or entry.get("filename")
+
+    if not text:
+        return jsonify({"error": "No text provided"}), 400
+
+    document_id, timings = corpus_index.add_document(
+        text,
+        document_id=data.get("document_id"),
+        page_offsets=[tuple(p) for p in page_offsets] if page_offsets else None,
+        title=title,
+        index_key=index_key,
+        strategy=strategy,
+    )
+    timings["corpus"] = corpus_index.stats()
+    _log_metrics("/corpus/documents", timings)
+    return jsonify({"document_id": document_id, "_metrics": timings}), 201
+
+
+@app.route('/documents/<document_id>', methods=['GET'])
+def get_document(document_id):
+    """Metadata for a document registered by /extract_text (not its text)."""
+    entry = document_store.get(document_id)
+    if entry is None:
+        return _unknown_document(document_id)
+    return jsonify({"document_id": document_id,
+                    **{k: v for k, v in entry.items() if k not in ("text", "index_key")}})
+
+
+@app.route('/documents/<document_id>', methods=['DELETE'])
+def delete_document(document_id):
+    if not document_store.remove(document_id):
+        return _unknown_document(document_id)
+    return jsonify({"deleted": document_id, **document_store.stats()})
+
+
+@app.route('/corpus/documents', methods=['GET'])
+def list_corpus_documents():
+    """Documents currently held in the corpus index."""
+    return jsonify({"stats": corpus_index.stats(), "documents": corpus_index.list_documents()})
+
+
+@app.route('/corpus/documents/<document_id>', methods=['DELETE'])
+def delete_corpus_document(document_id):
+    if not corpus_index.remove_document(document_id):
+        return jsonify({"error": "Unknown document id"}), 404
+    return jsonify({"deleted": document_id, **corpus_index.stats()})
+
+
+@app.route('/corpus/query', methods=['POST'])
+@limiter.limit("30 per minute")
+def query_corpus():
+    """
+    Retrieve the best-matching passages across the corpus.
+    Body: {"query", "document_ids"?: [...] (default: whole corpus), "top_k"?: 5}
+    """
+    data = request.get_json()
+    query = data.get("query", "")
+
+    if not query:
+        return jsonify({"error": "No query provided"}), 400
+
+    document_ids = data.get("document_ids")
+    if document_ids is not None and not _is_id_list(document_ids):
+        return jsonify({"error": "document_ids must be a list of ids."}), 400
+    top_k = data.get("top_k", 5)
+    if isinstance(top_k, bool) or not isinstance(top_k, int) or not 1 <= top_k <= CORPUS_MAX_TOP_K:
+        return jsonify({"error": f"top_k must be an integer from 1 to {CORPUS_MAX_TOP_K}."}), 400
+
+    hits, timings = corpus_index.query(query, document_ids=document_ids, top_k=top_k)
+    _log_metrics("/corpus/query", timings)
+    return jsonify({"results": hits, "_metrics": timings})
+
+
+@app.route('/jobs/analyze_document', methods=['POST'])
+@limiter.limit("10 per minute")
+def submit_analysis_job():
+    """
+    Asynchronous /analyze_document: returns a job id immediately (202).
+    Follow progress via GET /jobs/<id> (poll) or GET /jobs/<id>/events (SSE).
+    """
+    data = request.get_json()
+    text, index_key, chunk_strategy, unknown = _request_document(data)
+    if unknown:
+        return _unknown_document(data.get("document_id"))
+
+    if not text:
+        return jsonify({"error": "No text provided"}), 400
 
     try:
-        t_llm = time.perf_counter()
-        chat_completion = client.chat.completions.create(
-            messages=[
-                {"role": "system", "content": "You are a helpful analyst. Output strictly JSON."},
-                {"role": "user", "content": prompt}
-            ],
-            model="llama-3.3-70b-versatile",
-            temperature=0.1,
+        job = job_manager.submit(
+            "analyze_document",
+            lambda job, t, c, k, p, s: run_analysis(t, job.progress, c, k, p, s),
+            text, _llm_cache_allowed(data), index_key, _request_pipeline(data), chunk_strategy
         )
-        raw_response = chat_completion.choices[0].message.content
-        llm_ms = round((time.perf_counter() - t_llm) * 1000, 2)
+    except QueueFull:
+        return jsonify({"error": "Analysis queue is full. Please retry shortly.",
+                        "queue_depth": job_manager.queue_depth()}), 503
+
+    return jsonify({
+        "job_id": job.id,
+        "state": job.state,
+        "queue_depth": job_manager.queue_depth(),
+        "status_url": f"/jobs/{job.id}",
+        "events_url": f"/jobs/{job.id}/events",
+    }), 202
+
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    """Current state, per-stage timings and (once done) the result of a job."""
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown or expired job id"}), 404
+    status = job.to_dict()
+    status["queue_depth"] = job_manager.queue_depth()
+    return jsonify(status)
 
-        clean_json = raw_response.replace("```json", "").replace("```", "").strip()
-        parsed_data = json.loads(clean_json)
-        _log_metrics("/compare_documents", {"llm_ms": llm_ms})
-        parsed_data["_metrics"] = {"llm_ms": llm_ms}
-        return jsonify(parsed_data)
 
-    except Exception as e:
-        print(f"Comparison Error: {e}")
-        return jsonify(MOCK_COMPARISON)
+@app.route('/jobs/<job_id>/events', methods=['GET'])
+def job_events(job_id):
+    """Server-Sent Events stream of a job's stages, ending with done/failed."""
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown or expired job id"}), 404
+
+    def stream():
+        for event in job.iter_events():
+            yield sse_format(event)
+
+    return Response(stream_with_context(stream()), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
 
 @app.route('/metrics', methods=['GET'])
@@ -523,6 +1580,15 @@ def metrics():
     """Expose recent request timing data for latency analysis."""
     return jsonify({
         "total_logged": len(_metrics_log),
+        "index_cache": index_cache.stats(),
+        "jobs": job_manager.stats(),
+        "embedding_batcher": embedding_batcher.stats(),
+        "embedding_backend": embedding_backend_info(),
+        "corpus": corpus_index.stats(),
+        "llm_cache": llm_cache.stats(),
+        "llm_gateway": llm_gateway.stats(),
+        "document_store": document_store.stats(),
+        "payloads": _payload_summary(),
         "requests": _metrics_log
     })
 
@@ -0,0 +1,180 @@
+"""
+Token-budget Context Packing for DocBrief
+=========================================
+Turns retrieved chunks into an LLM context that fits a token budget:
+  1. Count    — tokens are counted with tiktoken (cl100k_base, close to the
+                Llama 3 tokenizer) when installed, else estimated from length
+  2. Budget   — the requested budget is clamped to what is left of the
+                Llama 3.3 context window after the prompt and reserved output
+  3. Fill     — chunks are taken greedily in retrieval-score order while
+                they fit the remaining budget
+  4. De-dup   — text repeated by the chunk overlap (and exact duplicate
+                chunks) is counted and sent only once; adjacent chunks are
+                stitched back into one passage
+
+Every pack reports the tokens it used, so each request can log what it sent.
+"""
+
+import os
+import threading
+from typing import Optional
+
+LLM_CONTEXT_WINDOW = int(os.getenv("LLM_CONTEXT_WINDOW", "131072"))  # Llama 3.3 70B
+LLM_OUTPUT_RESERVE = int(os.getenv("LLM_OUTPUT_RESERVE", "4096"))
+CONTEXT_TOKEN_BUDGET = int(os.getenv("LLM_CONTEXT_TOKEN_BUDGET", "3000"))
+CHAT_TOKEN_BUDGET = int(os.getenv("LLM_CHAT_TOKEN_BUDGET", "1500"))
+BASELINE_TOKEN_BUDGET = int(os.getenv("BASELINE_CONTEXT_TOKENS", "3750"))  # ≈ the old 15,000 chars
+TOKENIZER_NAME = os.getenv("LLM_TOKENIZER", "cl100k_base")
+CHARS_PER_TOKEN = 4
+PREFIX_SLACK = 2   # × CHARS_PER_TOKEN: chars read per budget token before encoding
+MIN_OVERLAP_CHARS = 8   # shorter suffix/prefix matches are coincidence, not chunk overlap
+SEPARATOR = "\n\n---\n\n"
+
+_encoding = None
+_encoding_lock = threading.Lock()
+_encoding_failed = False
+
+
+def _get_encoding():
+    """Lazy-load the tiktoken encoding; None if tiktoken (or its BPE file) is unavailable."""
+    global _encoding, _encoding_failed
+    if _encoding is not None or _encoding_failed:
+        return _encoding
+    with _encoding_lock:
+        if _encoding is None and not _encoding_failed:
+            try:
+                import tiktoken
+                _encoding = tiktoken.get_encoding(TOKENIZER_NAME)
+            except Exception as e:
+                print(f"Token counting falls back to a length estimate: {e}")
+                _encoding_failed = True
+    return _encoding
+
+
+def token_counter_name() -> str:
+    return TOKENIZER_NAME if _get_encoding() is not None else "estimate"
+
+
+def count_tokens(text: str) -> int:
+    if not text:
+        return 0
+    enc = _get_encoding()
+    if enc is not None:
+        return len(enc.encode(text, disallowed_special=()))
+    return -(-len(text) // CHARS_PER_TOKEN)
+
+
+def _prefix_chars(max_tokens: int) -> int:
+    """Characters that comfortably hold *max_tokens* tokens; longer text is never encoded whole."""
+    return max(0, max_tokens) * CHARS_PER_TOKEN * PREFIX_SLACK
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """
+    The longest prefix of *text* that fits in *max_tokens*. Only the first
+    few characters per token are encoded, so a multi-MB document costs the
+    same as its prefix.
+    """
+    enc = _get_encoding()
+    if enc is None:
+        return text[:max_tokens * CHARS_PER_TOKEN]
+    head = text[:_prefix_chars(max_tokens)]
+    tokens = enc.encode(head, disallowed_special=())
+    if len(tokens) <= max_tokens:
+        return head
+    return enc.decode(tokens[:max_tokens])
+
+
+def fits_tokens(texts: list[str], max_tokens: int) -> bool:
+    """
+    Whether *texts* together fit in *max_tokens*. Text far longer than the
+    budget is rejected on length alone, without being tokenized.
+    """
+    if sum(len(t) for t in texts) > _prefix_chars(max_tokens):
+        return False
+    return sum(count_tokens(t) for t in texts) <= max_tokens
+
+
+def fit_budget(budget: int, prompt_overhead: str = "") -> int:
+    """Clamp *budget* to the context window left after the prompt and the output reserve."""
+    available = LLM_CONTEXT_WINDOW - LLM_OUTPUT_RESERVE - count_tokens(prompt_overhead)
+    return max(0, min(budget, available))
+
+
+def _overlap(left: str, right: str) -> int:
+    """Length of the longest suffix of *left* that is a prefix of *right*."""
+    cap = min(len(left), len(right)) // 2
+    tail = left[-cap:] if cap else ""
+    for k in range(cap, MIN_OVERLAP_CHARS - 1, -1):
+        if tail.endswith(right[:k]):
+            return k
+    return 0
+
+
+def pack_chunks(chunks: list[str], hits: list[tuple[int, float]], budget_tokens: int,
+                separator: str = SEPARATOR) -> tuple[str, dict]:
+    """
+    Pack ``chunks[i]`` for *hits* ``[(i, score), ...]`` into *budget_tokens*.
+
+    Chunks are considered best score first. A chunk whose neighbour was
+    already taken only pays for the text beyond their shared overlap, and
+    runs of adjacent chunks are emitted as one passage in document order.
+
+    Returns
+    -------
+    (context, stats)
+        stats : dict — context_tokens, budget_tokens, chunks_considered,
+                chunks_packed, chunks_skipped, duplicates_dropped,
+                overlap_chars_dropped, token_counter
+    """
+    chosen: dict[int, str] = {}      # chunk index → text it contributes
+    seams: set[int] = set()          # i where chunks i-1 and i were de-overlapped
+    seen_texts: set[str] = set()
+    sep_tokens = count_tokens(separator)
+    used = 0
+    skipped = duplicates = overlap_chars = 0
+
+    for i, _score in sorted(hits, key=lambda h: -h[1]):
+        text = chunks[i]
+        if i in chosen or text in seen_texts:
+            duplicates += 1
+            continue
+        trimmed = text
+        head = _overlap(chunks[i - 1], trimmed) if i - 1 in chosen else 0
+        trimmed = trimmed[head:]
+        tail = _overlap(trimmed, chunks[i + 1]) if i + 1 in chosen and trimmed else 0
+        trimmed = trimmed[:len(trimmed) - tail]
+        joins_run = (i - 1 in chosen) or (i + 1 in chosen)
+        cost = count_tokens(trimmed) + (0 if joins_run or not chosen else sep_tokens)
+        if used + cost > budget_tokens:
+            skipped += 1
+            continue
+        used += cost
+        overlap_chars += len(text) - len(trimmed)
+        seen_texts.add(text)
+        chosen[i] = trimmed
+        if head:
+            seams.add(i)
+        if tail:
+            seams.add(i + 1)
+
+    passages: list[str] = []
+    prev: Optional[int] = None
+    for i in sorted(chosen):
+        if prev is not None and i == prev + 1:
+            passages[-1] += chosen[i] if i in seams else "\n" + chosen[i]
+        else:
+            passages.append(chosen[i])
+        prev = i
+
+    context = separator.join(p.strip() for p in passages)
+    return context, {
+        "context_tokens": count_tokens(context),
+        "budget_tokens": budget_tokens,
+        "chunks_considered": len(hits),
+        "chunks_packed": len(chosen),
+        "chunks_skipped": skipped,
+        "duplicates_dropped": duplicates,
+        "overlap_chars_dropped": overlap_chars,
+        "token_counter": token_counter_name(),
+    }
@@ -0,0 +1,228 @@
+"""
+Multi-document Corpus Index for DocBrief
+========================================
+A long-lived FAISS index holding chunks from many documents at once:
+  1. Add      — chunk + embed a document (reusing the per-document index
+                cache) and append its vectors under fresh chunk ids
+  2. Metadata — every chunk records document_id, page and character offsets
+  3. Query    — search one document, a set of documents, or the whole corpus
+                via a FAISS ID selector over the chosen documents' chunk ids
+  4. Evict    — least-recently-used documents are dropped once the corpus
+                exceeds CORPUS_MAX_CHUNKS
+
+All public methods return timing data (elapsed_ms) like rag_engine.
+"""
+
+import bisect
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+import numpy as np
+
+from rag_engine import (
+    DEFAULT_CHUNK_STRATEGY, _get_faiss, chunk_spans, document_key, embedding_batcher, index_cache,
+)
+
+CORPUS_MAX_CHUNKS = int(os.getenv("CORPUS_MAX_CHUNKS", "200000"))
+CORPUS_MAX_TOP_K = int(os.getenv("CORPUS_MAX_TOP_K", "50"))  # per /corpus/query request
+
+
+class CorpusIndex:
+    """
+    Thread-safe multi-document vector index.
+
+    Workflow
+    --------
+    corpus = CorpusIndex()
+    doc_id, timing = corpus.add_document(text, page_offsets=[(1, 0), (2, 1834)])
+    hits, timing = corpus.query("termination notice", document_ids=[doc_id])
+    """
+
+    def __init__(self, max_chunks: int = CORPUS_MAX_CHUNKS,
+                 chunk_size: int = 500, overlap: int = 50):
+        self.max_chunks = max_chunks
+        self.chunk_size = chunk_size
+        self.overlap = overlap
+        self.index = None                  # faiss.IndexIDMap2(IndexFlatIP)
+        self._next_id = 0
+        self._texts: dict[int, str] = {}
+        self._meta: dict[int, tuple] = {}  # chunk id → (document_id, page, start, end)
+        self._docs: "OrderedDict[str, dict]" = OrderedDict()  # LRU order
+        self._lock = threading.RLock()
+
+    # ---- add / remove ----------------------------------------------------
+
+    def add_document(self, text: str, document_id: Optional[str] = None,
+                     page_offsets: Optional[list[tuple[int, int]]] = None,
+                     title: Optional[str] = None, index_key: Optional[str] = None,
+                     strategy: str = DEFAULT_CHUNK_STRATEGY) -> tuple[str, dict]:
+        """
+        Index *text* under *document_id* (default: a content hash), replacing
+        any previous version. *page_offsets* is an ascending list of
+        (page_number, start_offset) pairs; a chunk's page is the page its
+        first character falls on. *index_key* and *strategy* identify an
+        index already cached for the text (e.g. a registered upload).
+        """
+        t0 = time.perf_counter()
+        document_id = document_id or document_key(text, self.chunk_size, self.overlap,
+                                                  strategy=strategy)[:16]
+
+        # Embeddings come from the shared index cache, so a document that was
+        # just analysed or chatted about is not embedded a second time.
+        store, build_timings = index_cache.get_or_build(text, self.chunk_size, self.overlap,
+                                                        strategy, key=index_key)
+        spans = chunk_spans(text, self.chunk_size, self.overlap, strategy)
+        page_starts = [start for _, start in page_offsets] if page_offsets else None
+
+        t1 = time.perf_counter()
+        with self._lock:
+            self._remove_locked(document_id)
+            n = len(spans)
+            ids = np.arange(self._next_id, self._next_id + n, dtype="int64")
+            self._next_id += n
+            if n:
+                vectors = store.vectors()
+                if self.index is None:
+                    faiss = _get_faiss()
+                    self.index = faiss.IndexIDMap2(faiss.IndexFlatIP(vectors.shape[1]))
+                self.index.add_with_ids(vectors, ids)
+            for cid, chunk, (start, end) in zip(ids.tolist(), store.chunks, spans):
+                page = None
+                if page_starts:
+                    page = page_offsets[max(0, bisect.bisect_right(page_starts, start) - 1)][0]
+                self._texts[cid] = chunk
+                self._meta[cid] = (document_id, page, start, end)
+            self._docs[document_id] = {
+                "document_id": document_id,
+                "title": title,
+                "n_chunks": n,
+                "n_chars": len(text),
+                "first_id": int(ids[0]) if n else self._next_id,
+                "added_at": time.time(),
+            }
+            evicted = self._evict_locked(keep=document_id)
+        add_ms = round((time.perf_counter() - t1) * 1000, 2)
+
+        return document_id, {
+            **{k: v for k, v in build_timings.items() if k != "scores"},
+            "corpus_add_ms": add_ms,
+            "corpus_evicted": evicted,
+            "total_ms": round((time.perf_counter() - t0) * 1000, 2),
+        }
+
+    def remove_document(self, document_id: str) -> bool:
+        with self._lock:
+            return self._remove_locked(document_id)
+
+    def _remove_locked(self, document_id: str) -> bool:
+        doc = self._docs.pop(document_id, None)
+        if doc is None:
+            return False
+        first, n = doc["first_id"], doc["n_chunks"]
+        if n and self.index is not None:
+            self.index.remove_ids(_get_faiss().IDSelectorRange(first, first + n))
+        for cid in range(first, first + n):
+            self._texts.pop(cid, None)
+            self._meta.pop(cid, None)
+        return True
+
+    def _evict_locked(self, keep: str) -> list[str]:
+        evicted = []
+        while len(self._texts) > self.max_chunks and len(self._docs) > 1:
+            oldest = next(iter(self._docs))
+            if oldest == keep:
+                self._docs.move_to_end(oldest)
+                continue
+            self._remove_locked(oldest)
+            evicted.append(oldest)
+        return evicted
+
+    # ---- query -----------------------------------------------------------
+
+    def query(self, query_text: str, document_ids: Optional[list[str]] = None,
+              top_k: int = 5) -> tuple[list[dict], dict]:
+        """
+        Retrieve the *top_k* best chunks for *query_text* across
+        *document_ids* (None → whole corpus).
+
+        Returns (hits, timings); each hit carries document_id, page, start,
+        end, score and text.
+        """
+        timings: dict = {}
+        with self._lock:
+            if self.index is None or not self._texts:
+                return [], {"retrieval_ms": 0, "query_embedding_ms": 0, "top_k": 0}
+            targets = list(self._docs) if document_ids is None else \
+                [d for d in document_ids if d in self._docs]
+            if not targets:
+                return [], {"retrieval_ms": 0, "query_embedding_ms": 0, "top_k": 0,
+                            "missing_documents": list(document_ids or [])}
+            for d in targets:
+                self._docs.move_to_end(d)
+            n_candidates = sum(self._docs[d]["n_chunks"] for d in targets)
+
+        t0 = time.perf_counter()
+        q_emb = embedding_batcher.encode([query_text])
+        timings["query_embedding_ms"] = round((time.perf_counter() - t0) * 1000, 2)
+
+        t1 = time.perf_counter()
+        faiss = _get_faiss()
+        k = min(top_k, n_candidates)
+        with self._lock:
+            params = None
+            if document_ids is not None:
+                ids = np.concatenate([
+                    np.arange(self._docs[d]["first_id"],
+                              self._docs[d]["first_id"] + self._docs[d]["n_chunks"], dtype="int64")
+                    for d in targets if d in self._docs
+                ])
+                params = faiss.SearchParameters(sel=faiss.IDSelectorBatch(ids))
+            scores, ids_out = self.index.search(q_emb, k, params=params) if params \
+                else self.index.search(q_emb, k)
+            hits = []
+            for cid, score in zip(ids_out[0].tolist(), scores[0].tolist()):
+                if cid < 0 or cid not in self._meta:
+                    continue
+                doc_id, page, start, end = self._meta[cid]
+                hits.append({"document_id": doc_id, "page": page, "start": start, "end": end,
+                             "score": round(float(score), 4), "text": self._texts[cid]})
+        timings["retrieval_ms"] = round((time.perf_counter() - t1) * 1000, 2)
+        timings["top_k"] = k
+        timings["n_documents"] = len(targets)
+        timings["n_candidates"] = n_candidates
+        if document_ids is not None and len(targets) < len(document_ids):
+            timings["missing_documents"] = [d for d in document_ids if d not in self._docs]
+        return hits, timings
+
+    # ---- introspection ---------------------------------------------------
+
+    def has_document(self, document_id: str) -> bool:
+        with self._lock:
+            return document_id in self._docs
+
+    def list_documents(self) -> list[dict]:
+        with self._lock:
+            return [{k: v for k, v in d.items() if k != "first_id"} for d in self._docs.values()]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "documents": len(self._docs),
+                "chunks": len(self._texts),
+                "max_chunks": self.max_chunks,
+            }
+
+
+def format_hits(hits: list[dict]) -> str:
+    """Join corpus hits into an LLM context block labelled by source."""
+    blocks = []
+    for h in hits:
+        where = f"{h['document_id']}" + (f", p.{h['page']}" if h["page"] is not None else "")
+        blocks.append(f"[{where}]\n{h['text']}")
+    return "\n\n---\n\n".join(blocks)
+
+
+corpus_index = CorpusIndex()
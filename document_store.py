@@ -0,0 +1,130 @@
+"""
+Server-side Document Store for DocBrief
+=======================================
+Lets clients refer to an uploaded document by a compact id instead of
+posting its full text back on every analysis and chat call:
+  1. Register — /extract_text keeps the text under an id derived from the
+                document's index-cache key (same text → same id), built
+                with DOCUMENT_CHUNK_STRATEGY so revisions re-index cheaply
+  2. Resolve  — analysis, chat, job and compare endpoints accept
+                document_id in place of the text
+  3. Evict    — LRU bounded by DOCUMENT_STORE_MAX_DOCS and
+                DOCUMENT_STORE_MAX_MB of text, plus an idle TTL
+
+The built index is not duplicated here: it stays in rag_engine.index_cache,
+and the entry remembers its cache key and chunk strategy so lookups skip
+re-hashing the text and a rebuild after eviction chunks it the same way.
+An unknown id (evicted, expired, or another worker) is reported to the
+client, which can fall back to sending the text.
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from rag_engine import DOCUMENT_CHUNK_STRATEGY, document_key
+
+DOCUMENT_ID_CHARS = 24
+
+
+class DocumentStore:
+    """Thread-safe LRU of extracted document texts keyed by document id."""
+
+    def __init__(self, max_documents: int = 64, max_bytes: int = 64 * 1024 * 1024,
+                 ttl_s: float = 3600):
+        self.max_documents = max_documents
+        self.max_bytes = max_bytes
+        self.ttl_s = ttl_s
+        self._docs: "OrderedDict[str, dict]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.registered = 0
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evictions = 0
+
+    # ---- public ----------------------------------------------------------
+
+    def register(self, text: str, index_key: Optional[str] = None,
+                 chunk_strategy: str = DOCUMENT_CHUNK_STRATEGY, **meta) -> Optional[str]:
+        """
+        Store *text* (re-registering refreshes it) and return its document id,
+        or None if the text alone exceeds the byte budget. *index_key*, if
+        given, must be the document's key under *chunk_strategy*.
+        """
+        index_key = index_key or document_key(text, strategy=chunk_strategy)
+        document_id = index_key[:DOCUMENT_ID_CHARS]
+        size = len(text.encode("utf-8", errors="ignore"))
+        entry = {"text": text, "index_key": index_key, "chunk_strategy": chunk_strategy,
+                 "n_chars": len(text), "bytes": size, "registered_at": time.time(), **meta}
+        entry["last_used"] = entry["registered_at"]
+        with self._lock:
+            self._drop(document_id)
+            if size > self.max_bytes:
+                return None
+            self._docs[document_id] = entry
+            self._bytes += size
+            self.registered += 1
+            self._evict()
+        return document_id
+
+    def get(self, document_id: str) -> Optional[dict]:
+        """The live entry (text, index_key, n_chars, ...) or None if unknown or expired."""
+        now = time.time()
+        with self._lock:
+            entry = self._docs.get(document_id)
+            if entry is not None and now - entry["last_used"] > self.ttl_s:
+                self._drop(document_id)
+                self.expired += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            entry["last_used"] = now
+            self._docs.move_to_end(document_id)
+            self.hits += 1
+            return entry
+
+    def remove(self, document_id: str) -> bool:
+        with self._lock:
+            return self._drop(document_id)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "documents": len(self._docs),
+                "bytes": self._bytes,
+                "registered": self.registered,
+                "hits": self.hits,
+                "misses": self.misses,
+                "expired": self.expired,
+                "evictions": self.evictions,
+                "max_documents": self.max_documents,
+                "max_bytes": self.max_bytes,
+                "ttl_s": self.ttl_s,
+            }
+
+    # ---- internals (lock held) -------------------------------------------
+
+    def _drop(self, document_id: str) -> bool:
+        entry = self._docs.pop(document_id, None)
+        if entry is None:
+            return False
+        self._bytes -= entry["bytes"]
+        return True
+
+    def _evict(self):
+        while self._docs and (len(self._docs) > self.max_documents or self._bytes > self.max_bytes):
+            oldest = next(iter(self._docs))
+            self._drop(oldest)
+            self.evictions += 1
+
+
+document_store = DocumentStore(
+    max_documents=int(os.getenv("DOCUMENT_STORE_MAX_DOCS", "64")),
+    max_bytes=int(os.getenv("DOCUMENT_STORE_MAX_MB", "64")) * 1024 * 1024,
+    ttl_s=float(os.getenv("DOCUMENT_STORE_TTL_S", "3600")),
+)
@@ -0,0 +1,100 @@
+"""
+Embedding Backends for DocBrief
+===============================
+Pluggable loaders for the MiniLM sentence encoder, selected with EMBED_BACKEND:
+  1. torch       — the PyTorch SentenceTransformer (default)
+  2. torch-int8  — the same model with its Linear layers dynamically
+                   quantized to int8 (no extra dependencies, ~2x smaller)
+  3. onnx        — ONNX Runtime export from the model hub
+  4. onnx-int8   — int8-quantized ONNX export (EMBED_ONNX_INT8_FILE)
+
+Every backend returns an object with the SentenceTransformer ``encode``
+signature, so the rest of the engine (and the benchmark's stub embedders)
+does not care which one is loaded. EMBED_THREADS caps intra-op threads
+(0 = library default). The ONNX backends need the optional extra
+``pip install "sentence-transformers[onnx]"``; if it is missing they fall
+back to torch.
+
+Embeddings differ slightly between backends, so the active backend is part
+of the index cache key (see embedding_id). scripts/benchmark_embeddings.py
+compares throughput, memory and retrieval agreement between backends.
+"""
+
+import os
+from typing import Callable
+
+EMBEDDING_BACKENDS = ("torch", "torch-int8", "onnx", "onnx-int8")
+EMBED_BACKEND = os.getenv("EMBED_BACKEND", "torch").lower()
+EMBED_THREADS = int(os.getenv("EMBED_THREADS", "0"))
+ONNX_FILE = os.getenv("EMBED_ONNX_FILE", "onnx/model.onnx")
+ONNX_INT8_FILE = os.getenv("EMBED_ONNX_INT8_FILE", "onnx/model_quint8_avx2.onnx")
+
+_LOADERS: dict[str, Callable[[str, int], object]] = {}
+
+
+def register_backend(name: str, loader: Callable[[str, int], object]):
+    """Make *loader(model_name, threads)* selectable as EMBED_BACKEND=*name*."""
+    _LOADERS[name] = loader
+
+
+def embedding_id(model_name: str, backend: str = EMBED_BACKEND) -> str:
+    """Identity of the vectors a backend produces; torch keeps the bare model name."""
+    return model_name if backend == "torch" else f"{model_name}:{backend}"
+
+
+def _set_torch_threads(threads: int):
+    if threads > 0:
+        import torch
+        torch.set_num_threads(threads)
+
+
+def _load_torch(model_name: str, threads: int):
+    from sentence_transformers import SentenceTransformer
+    _set_torch_threads(threads)
+    return SentenceTransformer(model_name, device="cpu")
+
+
+def _load_torch_int8(model_name: str, threads: int):
+    import torch
+    model = _load_torch(model_name, threads)
+    return torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+def _onnx_loader(file_name: str) -> Callable[[str, int], object]:
+    def load(model_name: str, threads: int):
+        import onnxruntime as ort
+        from sentence_transformers import SentenceTransformer
+        options = ort.SessionOptions()
+        if threads > 0:
+            options.intra_op_num_threads = threads
+            options.inter_op_num_threads = 1
+        return SentenceTransformer(model_name, device="cpu", backend="onnx", model_kwargs={
+            "file_name": file_name,
+            "provider": "CPUExecutionProvider",
+            "session_options": options,
+        })
+    return load
+
+
+register_backend("torch", _load_torch)
+register_backend("torch-int8", _load_torch_int8)
+register_backend("onnx", _onnx_loader(ONNX_FILE))
+register_backend("onnx-int8", _onnx_loader(ONNX_INT8_FILE))
+
+
+def load_backend(name: str, model_name: str, threads: int = EMBED_THREADS):
+    """
+    Load *model_name* with backend *name*.
+
+    Returns (model, backend actually loaded). A backend whose optional
+    dependencies are missing falls back to torch with a printed warning.
+    """
+    if name not in _LOADERS:
+        raise ValueError(f"unknown embedding backend {name!r}; expected one of {sorted(_LOADERS)}")
+    try:
+        return _LOADERS[name](model_name, threads), name
+    except ImportError as e:
+        if name == "torch":
+            raise
+        print(f"Embedding backend {name!r} unavailable ({e}); falling back to torch")
+        return _load_torch(model_name, threads), "torch"
@@ -0,0 +1,167 @@
+"""
+Micro-batched Embedding Service for DocBrief
+============================================
+Coalesces encode requests from concurrent request threads into one forward
+pass through the embedding model:
+  1. Enqueue  — callers hand over their texts and block on a result slot
+  2. Collect  — one dispatcher thread gathers requests for up to
+                max_wait_ms or until the next one would take the batch past
+                max_batch_size texts (that one opens the following batch)
+  3. Encode   — the combined batch is encoded in a single model call
+  4. Scatter  — rows are split back to each caller in request order
+
+Requests that are already a full batch (e.g. indexing a whole document)
+skip the queue and encode on the caller's thread.
+"""
+
+import queue
+import threading
+import time
+from typing import Callable, Optional
+
+import numpy as np
+
+
+class _Request:
+    __slots__ = ("texts", "enqueued_at", "done", "result", "error")
+
+    def __init__(self, texts: list[str]):
+        self.texts = texts
+        self.enqueued_at = time.perf_counter()
+        self.done = threading.Event()
+        self.result: Optional[np.ndarray] = None
+        self.error: Optional[BaseException] = None
+
+
+def _bucket(n: int) -> str:
+    """Power-of-two histogram bucket label: 1, 2-3, 4-7, 8-15, ..."""
+    lo = 1 << (n.bit_length() - 1)
+    return str(lo) if lo == 1 else f"{lo}-{2 * lo - 1}"
+
+
+class EmbeddingBatcher:
+    """
+    Thread-safe micro-batcher in front of *encode_fn*.
+
+    *encode_fn* takes ``list[str]`` and returns a float32 array with one row
+    per text. Set *max_wait_ms* to 0 to disable batching entirely.
+    """
+
+    def __init__(self, encode_fn: Callable[[list[str]], np.ndarray],
+                 max_batch_size: int = 64, max_wait_ms: float = 5.0):
+        self.encode_fn = encode_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self._queue: "queue.Queue[_Request]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._carry: Optional[_Request] = None   # dispatcher-only: opens the next batch
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.batches = 0
+        self.requests = 0
+        self.texts = 0
+        self.bypassed = 0
+        self.total_wait_ms = 0.0
+        self.batch_texts_hist: dict[str, int] = {}
+        self.batch_requests_hist: dict[str, int] = {}
+
+    # ---- public ----------------------------------------------------------
+
+    def encode(self, texts: list[str]) -> np.ndarray:
+        """Encode *texts*, sharing a forward pass with concurrent callers."""
+        if not texts:
+            return np.zeros((0, 0), dtype="float32")
+        if self.max_wait_ms <= 0 or len(texts) >= self.max_batch_size:
+            with self._stats_lock:
+                self.bypassed += 1
+            return np.asarray(self.encode_fn(texts), dtype="float32")
+
+        self._ensure_started()
+        req = _Request(texts)
+        self._queue.put(req)
+        req.done.wait()
+        if req.error is not None:
+            raise req.error
+        return req.result
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            return {
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": self.max_wait_ms,
+                "batches": self.batches,
+                "requests": self.requests,
+                "texts": self.texts,
+                "bypassed": self.bypassed,
+                "avg_requests_per_batch": round(self.requests / self.batches, 2) if self.batches else 0,
+                "avg_queue_wait_ms": round(self.total_wait_ms / self.requests, 3) if self.requests else 0,
+                "batch_size_histogram": dict(self.batch_texts_hist),
+                "requests_per_batch_histogram": dict(self.batch_requests_hist),
+            }
+
+    # ---- dispatcher ------------------------------------------------------
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, name="embed-batcher",
+                                                daemon=True)
+                self._thread.start()
+
+    def _collect(self) -> list[_Request]:
+        """
+        Block for one request, then gather more until the window closes. A
+        request that would push the batch past max_batch_size texts is held
+        back to open the next batch, so batches never exceed the cap.
+        """
+        if self._carry is not None:
+            batch, self._carry = [self._carry], None
+        else:
+            batch = [self._queue.get()]
+        n_texts = len(batch[0].texts)
+        deadline = time.perf_counter() + self.max_wait_ms / 1000
+        while n_texts < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                req = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if n_texts + len(req.texts) > self.max_batch_size:
+                self._carry = req
+                break
+            batch.append(req)
+            n_texts += len(req.texts)
+        return batch
+
+    def _loop(self):
+        while True:
+            batch = self._collect()
+            texts = [t for req in batch for t in req.texts]
+            started = time.perf_counter()
+            try:
+                emb = np.asarray(self.encode_fn(texts), dtype="float32")
+            except BaseException as e:
+                for req in batch:
+                    req.error = e
+                    req.done.set()
+                continue
+
+            offset = 0
+            for req in batch:
+                req.result = emb[offset:offset + len(req.texts)]
+                offset += len(req.texts)
+                req.done.set()
+
+            with self._stats_lock:
+                self.batches += 1
+                self.requests += len(batch)
+                self.texts += len(texts)
+                self.total_wait_ms += sum((started - r.enqueued_at) * 1000 for r in batch)
+                key = _bucket(len(texts))
+                self.batch_texts_hist[key] = self.batch_texts_hist.get(key, 0) + 1
+                key = _bucket(len(batch))
+                self.batch_requests_hist[key] = self.batch_requests_hist.get(key, 0) + 1
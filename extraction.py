@@ -0,0 +1,333 @@
+"""
+Document Extraction for DocBrief
+================================
+Page-level text extraction for PDFs and (multi-frame) images:
+  1. Splitting  — break a document into page / frame jobs
+  2. Extraction — PyPDF2 text layer or Tesseract OCR per job
+  3. Pooling    — large documents fan out across a process pool
+  4. Ordering   — results are yielded back in page order as they complete
+  5. OCR fallback — PDF pages without a text layer are rasterized and OCR'd,
+                    with results cached by a hash of the page pixels (an
+                    on-disk LRU bounded by OCR_CACHE_MAX_MB and an idle
+                    OCR_CACHE_TTL_S)
+
+Extraction is CPU-bound and holds the GIL, so jobs run in worker processes
+rather than threads. Small documents are handled in-process to skip the
+pool round trip. Every page reports its own elapsed_ms and its source
+("text", "ocr", "ocr_cache", "ocr_skipped" or "ocr_failed").
+"""
+
+import hashlib
+import math
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from io import BytesIO
+from typing import Iterator, Optional
+
+# ---------------------------------------------------------------------------
+# Configuration
+# ---------------------------------------------------------------------------
+def _usable_cpus() -> int:
+    """CPUs this process may run on (os.cpu_count() reports the host's inside containers)."""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:   # macOS / Windows
+        return os.cpu_count() or 1
+
+
+# Each worker process holds its own PyPDF2 / PyMuPDF / Tesseract state next to
+# the web worker, so the default stays small; raise it on larger instances.
+EXTRACT_WORKERS = int(os.getenv("EXTRACT_WORKERS", str(min(2, _usable_cpus()))))
+PARALLEL_MIN_PAGES = int(os.getenv("EXTRACT_PARALLEL_MIN_PAGES", "8"))
+JOBS_PER_WORKER = 4  # several small jobs per worker keeps the tail short
+
+OCR_MAX_DIMENSION = 1200
+OCR_CONFIG = r'--psm 3'
+OCR_PAGE_BUDGET = int(os.getenv("OCR_PAGE_BUDGET", "50"))  # scanned pages OCR'd per PDF
+OCR_DPI = int(os.getenv("OCR_DPI", "150"))
+OCR_CACHE_DIR = os.getenv("OCR_CACHE_DIR", os.path.join(".cache", "ocr"))
+OCR_CACHE_MAX_BYTES = int(os.getenv("OCR_CACHE_MAX_MB", "128")) * 1024 * 1024
+OCR_CACHE_TTL_S = float(os.getenv("OCR_CACHE_TTL_S", str(7 * 24 * 3600)))
+OCR_CACHE_SWEEP_EVERY = 64  # cache writes per process between sweeps
+
+_pool = None
+_pool_lock = threading.Lock()
+_ocr_writes_until_sweep = 0   # first write in each process sweeps
+
+
+def _get_pool():
+    """Lazily start the shared extraction pool (spawned, so safe under threads)."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=EXTRACT_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+    return _pool
+
+
+def _elapsed_ms(t0: float) -> float:
+    return round((time.perf_counter() - t0) * 1000, 2)
+
+
+# ---------------------------------------------------------------------------
+# 1–2. Page jobs (run in worker processes)
+# ---------------------------------------------------------------------------
+
+def _ocr_cache_path(digest: str) -> Optional[str]:
+    if not OCR_CACHE_DIR:
+        return None
+    return os.path.join(OCR_CACHE_DIR, digest[:2], digest + ".txt")
+
+
+def _ocr_cache_read(path: str) -> Optional[str]:
+    """Cached text, or None if absent or idle past OCR_CACHE_TTL_S; a hit refreshes its mtime."""
+    try:
+        if time.time() - os.stat(path).st_mtime > OCR_CACHE_TTL_S:
+            os.remove(path)
+            return None
+        with open(path, encoding="utf-8") as f:
+            text = f.read()
+        os.utime(path)   # last use, for LRU eviction
+        return text
+    except OSError:
+        return None
+
+
+def sweep_ocr_cache() -> int:
+    """
+    Delete OCR cache files idle past OCR_CACHE_TTL_S, then the least
+    recently used until the cache fits OCR_CACHE_MAX_BYTES. Returns the
+    bytes kept. Each worker process sweeps every OCR_CACHE_SWEEP_EVERY writes.
+    """
+    if not OCR_CACHE_DIR:
+        return 0
+    now = time.time()
+    files = []   # (last_used, size, path)
+    for dirpath, _, names in os.walk(OCR_CACHE_DIR):
+        for name in names:
+            path = os.path.join(dirpath, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue   # removed by another worker meanwhile
+            files.append((st.st_mtime, st.st_size, path))
+    files.sort()
+    total = sum(size for _, size, _ in files)
+    for last_used, size, path in files:
+        if now - last_used <= OCR_CACHE_TTL_S and total <= OCR_CACHE_MAX_BYTES:
+            break
+        try:
+            os.remove(path)
+            total -= size
+        except OSError:
+            pass
+    return total
+
+
+def ocr_image(image) -> tuple[str, bool]:
+    """
+    Grayscale + downscale to OCR_MAX_DIMENSION, then run Tesseract.
+
+    Results are cached on disk under a SHA-256 of the preprocessed pixels,
+    so repeated pages (cover sheets, letterheads) skip Tesseract entirely.
+    Returns (text, served_from_cache).
+    """
+    global _ocr_writes_until_sweep
+    from PIL import Image
+    import pytesseract
+
+    image = image.convert('L')  # Grayscale for speed
+    if max(image.size) > OCR_MAX_DIMENSION:
+        image.thumbnail((OCR_MAX_DIMENSION, OCR_MAX_DIMENSION), Image.Resampling.LANCZOS)
+
+    h = hashlib.sha256(f"{OCR_CONFIG}|{image.size}|".encode("utf-8"))
+    h.update(image.tobytes())
+    cache_path = _ocr_cache_path(h.hexdigest())
+    if cache_path:
+        cached = _ocr_cache_read(cache_path)
+        if cached is not None:
+            return cached, True
+
+    text = pytesseract.image_to_string(image, config=OCR_CONFIG)
+
+    if cache_path:
+        try:
+            os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+            tmp = f"{cache_path}.{os.getpid()}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                f.write(text)
+            os.replace(tmp, cache_path)
+        except OSError as e:
+            print(f"OCR cache write failed: {e}")
+        _ocr_writes_until_sweep -= 1
+        if _ocr_writes_until_sweep <= 0:
+            _ocr_writes_until_sweep = OCR_CACHE_SWEEP_EVERY
+            sweep_ocr_cache()
+    return text, False
+
+
+def _pdf_page_job(path: str, start: int, end: int) -> list[tuple[str, float]]:
+    """Extract the text layer of pages [start, end) → [(text, elapsed_ms)]."""
+    from PyPDF2 import PdfReader
+
+    reader = PdfReader(path)
+    results = []
+    for i in range(start, end):
+        t0 = time.perf_counter()
+        results.append((reader.pages[i].extract_text() or "", _elapsed_ms(t0)))
+    return results
+
+
+def _pdf_ocr_job(path: str, page: int) -> tuple[str, float, bool]:
+    """Rasterize one PDF page and OCR it → (text, elapsed_ms, cached)."""
+    from pdf2image import convert_from_path
+
+    t0 = time.perf_counter()
+    images = convert_from_path(path, dpi=OCR_DPI, first_page=page + 1,
+                               last_page=page + 1, grayscale=True)
+    text, cached = ocr_image(images[0]) if images else ("", False)
+    return text, _elapsed_ms(t0), cached
+
+
+def _image_frame_job(path: str, start: int, end: int) -> list[tuple[str, float]]:
+    """OCR frames [start, end) of a (multi-frame) image → [(text, elapsed_ms)]."""
+    from PIL import Image
+
+    results = []
+    with Image.open(path) as image:
+        for i in range(start, end):
+            t0 = time.perf_counter()
+            image.seek(i)
+            text, _ = ocr_image(image)
+            results.append((text, _elapsed_ms(t0)))
+    return results
+
+
+# ---------------------------------------------------------------------------
+# 3–4. Fan-out and ordered reassembly
+# ---------------------------------------------------------------------------
+
+def _write_temp(data: bytes, suffix: str) -> str:
+    """Hand the upload to workers via a temp file instead of pickling it per job."""
+    with tempfile.NamedTemporaryFile(suffix=suffix, delete=False) as tmp:
+        tmp.write(data)
+        return tmp.name
+
+
+def _iter_pages(job, path: str, n_pages: int) -> Iterator[tuple[int, str, float]]:
+    """
+    Yield (page_number, text, elapsed_ms) in page order.
+
+    Documents with at least PARALLEL_MIN_PAGES pages are split into
+    contiguous page ranges and mapped over the process pool.
+    """
+    if n_pages < PARALLEL_MIN_PAGES or EXTRACT_WORKERS <= 1:
+        for i, (text, ms) in enumerate(job(path, 0, n_pages)):
+            yield i, text, ms
+        return
+
+    batch = max(1, math.ceil(n_pages / (EXTRACT_WORKERS * JOBS_PER_WORKER)))
+    pool = _get_pool()
+    futures = [pool.submit(job, path, start, min(start + batch, n_pages))
+               for start in range(0, n_pages, batch)]
+    page = 0
+    try:
+        for future in futures:
+            for text, ms in future.result():
+                yield page, text, ms
+                page += 1
+    finally:
+        for future in futures:
+            future.cancel()
+
+
+def _submit_ocr(path: str, page: int) -> Future:
+    """OCR is heavy enough to use the pool whenever there is more than one worker."""
+    if EXTRACT_WORKERS > 1:
+        return _get_pool().submit(_pdf_ocr_job, path, page)
+    future: Future = Future()
+    try:
+        future.set_result(_pdf_ocr_job(path, page))
+    except Exception as e:
+        future.set_exception(e)
+    return future
+
+
+def iter_pdf_pages(data: bytes,
+                   ocr_budget: int = OCR_PAGE_BUDGET) -> Iterator[tuple[int, str, float, str]]:
+    """
+    Yield (page_number, text, elapsed_ms, source) for every page of a PDF.
+
+    Pages whose text layer is empty are rasterized and OCR'd, up to
+    *ocr_budget* pages per document. While an OCR page is pending, up to
+    EXTRACT_WORKERS × 2 following pages are read ahead so runs of scanned
+    pages are OCR'd concurrently, and pages are still yielded in order.
+    """
+    from PyPDF2 import PdfReader
+
+    n_pages = len(PdfReader(BytesIO(data)).pages)
+    path = _write_temp(data, ".pdf")
+    lookahead = max(2, EXTRACT_WORKERS * 2)
+    ocr_left = ocr_budget
+    source = _iter_pages(_pdf_page_job, path, n_pages)
+    buffer: deque = deque()  # (page, text, ms, ocr_future or None)
+
+    def pull() -> bool:
+        nonlocal ocr_left
+        try:
+            page, text, ms = next(source)
+        except StopIteration:
+            return False
+        future = None
+        if not text.strip() and ocr_left > 0:
+            future = _submit_ocr(path, page)
+            ocr_left -= 1
+        buffer.append((page, text, ms, future))
+        return True
+
+    try:
+        while buffer or pull():
+            if buffer[0][3] is not None:
+                while len(buffer) < lookahead and pull():
+                    pass
+            page, text, ms, future = buffer.popleft()
+            if future is not None:
+                try:
+                    ocr_text, ocr_ms, cached = future.result()
+                except Exception as e:
+                    # A page that cannot be rasterized should not sink the document
+                    print(f"OCR fallback failed on page {page + 1}: {e}")
+                    yield page, text, ms, "ocr_failed"
+                    continue
+                yield page, ocr_text, round(ms + ocr_ms, 2), "ocr_cache" if cached else "ocr"
+            elif not text.strip():
+                yield page, text, ms, "ocr_skipped"
+            else:
+                yield page, text, ms, "text"
+    finally:
+        source.close()
+        for *_, future in buffer:
+            if future is not None:
+                future.cancel()
+        os.remove(path)
+
+
+def iter_image_frames(data: bytes, suffix: str) -> Iterator[tuple[int, str, float, str]]:
+    """Yield (frame_number, text, elapsed_ms, "ocr") for every frame of an image."""
+    from PIL import Image
+
+    with Image.open(BytesIO(data)) as image:
+        n_frames = getattr(image, "n_frames", 1)
+    path = _write_temp(data, suffix)
+    try:
+        for frame, text, ms in _iter_pages(_image_frame_job, path, n_frames):
+            yield frame, text, ms, "ocr"
+    finally:
+        os.remove(path)
@@ -0,0 +1,214 @@
+"""
+Background Jobs for DocBrief
+============================
+Runs long pipelines (chunk → embed → LLM) off the request thread:
+  1. Submit  — enqueue work on a bounded executor, return a job id at once
+  2. Progress — the pipeline reports stage events (with their timings)
+  3. Observe — clients poll the job status or follow its events over SSE
+
+Jobs live in memory and are dropped JOB_TTL_S seconds after finishing.
+"""
+
+import json
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterator, Optional
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_MAX_QUEUE = int(os.getenv("JOB_MAX_QUEUE", "32"))
+JOB_TTL_S = int(os.getenv("JOB_TTL_S", "3600"))
+
+
+class QueueFull(Exception):
+    """Raised when a submit would exceed JOB_MAX_QUEUE pending jobs."""
+
+
+class Job:
+    """A single unit of background work and its event history."""
+
+    def __init__(self, kind: str):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.state = "queued"          # queued → running → done | failed
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.result = None
+        self.error: Optional[str] = None
+        self.events: list[dict] = []
+        self._cond = threading.Condition()
+
+    def progress(self, stage: str, **data):
+        """Record a stage event; safe to call from any thread."""
+        with self._cond:
+            self.events.append({"stage": stage, "timestamp": time.time(), **data})
+            self._cond.notify_all()
+
+    def _start(self):
+        with self._cond:
+            self.started_at = time.time()
+            self.state = "running"
+            self.events.append({"stage": "started", "timestamp": self.started_at})
+            self._cond.notify_all()
+
+    def _finish(self, result=None, error: Optional[str] = None):
+        """Set the terminal state and its event atomically, so SSE readers
+        never see a finished job without its final event."""
+        with self._cond:
+            self.finished_at = time.time()
+            self.state = "failed" if error else "done"
+            self.result = result
+            self.error = error
+            event = {"stage": self.state, "timestamp": self.finished_at}
+            if error:
+                event["error"] = error
+            else:
+                event["result"] = result
+            self.events.append(event)
+            self._cond.notify_all()
+
+    @property
+    def finished(self) -> bool:
+        return self.state in ("done", "failed")
+
+    def to_dict(self, include_result: bool = True) -> dict:
+        with self._cond:
+            out = {
+                "job_id": self.id,
+                "kind": self.kind,
+                "state": self.state,
+                "stage": self.events[-1]["stage"] if self.events else self.state,
+                "stages": [{k: v for k, v in e.items() if k != "result"}
+                           for e in self.events],
+                "created_at": self.created_at,
+                "started_at": self.started_at,
+                "finished_at": self.finished_at,
+            }
+            if self.started_at:
+                out["queue_wait_ms"] = round((self.started_at - self.created_at) * 1000, 2)
+            if self.finished_at and self.started_at:
+                out["run_ms"] = round((self.finished_at - self.started_at) * 1000, 2)
+            if self.error:
+                out["error"] = self.error
+            if include_result and self.state == "done":
+                out["result"] = self.result
+            return out
+
+    def iter_events(self, heartbeat_s: float = 15.0) -> Iterator[Optional[dict]]:
+        """
+        Yield events as they arrive (replaying past ones first) until the job
+        finishes. Yields None every *heartbeat_s* of silence so SSE writers
+        can emit a keep-alive comment.
+        """
+        seen = 0
+        while True:
+            with self._cond:
+                if seen >= len(self.events) and not self.finished:
+                    self._cond.wait(timeout=heartbeat_s)
+                new = self.events[seen:]
+                seen = len(self.events)
+                finished = self.finished
+            if not new and not finished:
+                yield None
+            for event in new:
+                yield event
+            if finished:
+                return
+
+
+class JobManager:
+    """Bounded background executor plus an in-memory job registry."""
+
+    def __init__(self, max_workers: int = JOB_WORKERS, max_queue: int = JOB_MAX_QUEUE,
+                 ttl_s: int = JOB_TTL_S):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.ttl_s = ttl_s
+        self._executor = ThreadPoolExecutor(max_workers=max_workers,
+                                            thread_name_prefix="job")
+        self._jobs: dict[str, Job] = {}
+        self._lock = threading.Lock()
+        self._pending = 0   # queued + running
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+
+    def submit(self, kind: str, fn: Callable, *args, **kwargs) -> Job:
+        """
+        Schedule ``fn(job, *args, **kwargs)``; its return value becomes the
+        job result. Raises :class:`QueueFull` when the backlog is full.
+        """
+        self._expire()
+        job = Job(kind)
+        with self._lock:
+            if self._pending >= self.max_queue:
+                self.rejected += 1
+                raise QueueFull(f"{self._pending} jobs already pending")
+            self._pending += 1
+            self._jobs[job.id] = job
+        job.progress("queued", queue_depth=self.queue_depth())
+        self._executor.submit(self._run, job, fn, args, kwargs)
+        return job
+
+    def _run(self, job: Job, fn: Callable, args: tuple, kwargs: dict):
+        job._start()
+        try:
+            result = fn(job, *args, **kwargs)
+        except Exception as e:
+            print(f"Job {job.id} ({job.kind}) failed: {e}")
+            with self._lock:
+                self._pending -= 1
+                self.failed += 1
+            job._finish(error=str(e))
+        else:
+            with self._lock:
+                self._pending -= 1
+                self.completed += 1
+            job._finish(result=result)
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def queue_depth(self) -> int:
+        """Jobs accepted but not yet started."""
+        with self._lock:
+            return sum(1 for j in self._jobs.values() if j.state == "queued")
+
+    def _expire(self):
+        cutoff = time.time() - self.ttl_s
+        with self._lock:
+            for job_id in [j.id for j in self._jobs.values()
+                           if j.finished and j.finished_at and j.finished_at < cutoff]:
+                del self._jobs[job_id]
+
+    def stats(self) -> dict:
+        with self._lock:
+            running = sum(1 for j in self._jobs.values() if j.state == "running")
+            queued = sum(1 for j in self._jobs.values() if j.state == "queued")
+            return {
+                "workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "queued": queued,
+                "running": running,
+                "completed": self.completed,
+                "failed": self.failed,
+                "rejected": self.rejected,
+            }
+
+
+def sse_format(event: Optional[dict], event_type: Optional[str] = None) -> str:
+    """
+    Encode one event as a Server-Sent Events frame (None → heartbeat).
+    The SSE event name is *event_type*, defaulting to the event's stage.
+    """
+    if event is None:
+        return ": keep-alive\n\n"
+    name = event_type or event["stage"]
+    return f"event: {name}\ndata: {json.dumps(event, default=str)}\n\n"
+
+
+job_manager = JobManager()
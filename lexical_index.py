@@ -0,0 +1,166 @@
+"""
+Lexical (BM25) Index for DocBrief
+=================================
+An inverted index over a store's chunks, built in the same pass as the
+FAISS index, that catches the exact terms dense embeddings blur together:
+  1. Tokenize — lower-cased words, with legal identifiers kept whole:
+                clause numbers ("14.2"), amounts ("$250,000" → "250000")
+                and dates ("2026-12-31")
+  2. Index    — postings stored as CSR arrays (term → chunk ids), each
+                posting's BM25 weight precomputed at build time
+  3. Score    — a query gathers its terms' postings and sums them with one
+                np.bincount; no per-chunk Python loop
+  4. Fuse     — reciprocal-rank fusion of the BM25 and dense rankings
+
+Tune with RAG_BM25_K1 / RAG_BM25_B (term-frequency saturation and length
+normalisation) and RAG_RRF_K (rank damping in the fusion).
+"""
+
+import os
+import re
+from collections import Counter
+from typing import Iterable, Optional
+
+import numpy as np
+
+BM25_K1 = float(os.getenv("RAG_BM25_K1", "1.2"))
+BM25_B = float(os.getenv("RAG_BM25_B", "0.75"))
+RRF_K = int(os.getenv("RAG_RRF_K", "60"))
+
+_TOKEN_RE = re.compile(r"\d+(?:[.,/-]\d+)*|[a-z]+(?:'[a-z]+)?")
+_STOPWORDS = frozenset(
+    "a an and are as at be by for from has have in is it its of on or that the "
+    "this to was were will with shall any such other all not no".split()
+)
+
+
+def tokenize(text: str) -> list[str]:
+    """Lower-cased terms; thousands separators are dropped from numbers."""
+    out = []
+    for tok in _TOKEN_RE.findall(text.lower()):
+        if tok[0].isdigit():
+            out.append(tok.replace(",", ""))
+        elif tok not in _STOPWORDS:
+            out.append(tok)
+    return out
+
+
+class BM25Builder:
+    """Accumulates chunk term counts (e.g. batch by batch while streaming)."""
+
+    def __init__(self):
+        self.vocab: dict[str, int] = {}
+        self._term_ids: list[int] = []
+        self._doc_ids: list[int] = []
+        self._tfs: list[int] = []
+        self._lengths: list[int] = []
+
+    def add(self, chunks: Iterable[str]):
+        vocab = self.vocab
+        for chunk in chunks:
+            doc = len(self._lengths)
+            counts = Counter(tokenize(chunk))
+            self._lengths.append(sum(counts.values()))
+            for term, tf in counts.items():
+                self._term_ids.append(vocab.setdefault(term, len(vocab)))
+                self._doc_ids.append(doc)
+                self._tfs.append(tf)
+
+    def finish(self, k1: float = BM25_K1, b: float = BM25_B) -> "BM25Index":
+        """Sort postings by term and precompute every posting's BM25 weight."""
+        n_docs = len(self._lengths)
+        terms = np.asarray(self._term_ids, dtype="int32")
+        docs = np.asarray(self._doc_ids, dtype="int32")
+        tfs = np.asarray(self._tfs, dtype="float32")
+        lengths = np.asarray(self._lengths, dtype="float32")
+
+        order = np.lexsort((docs, terms))
+        terms, docs, tfs = terms[order], docs[order], tfs[order]
+        df = np.bincount(terms, minlength=len(self.vocab))
+        indptr = np.zeros(len(self.vocab) + 1, dtype="int64")
+        np.cumsum(df, out=indptr[1:])
+
+        idf = np.log1p((n_docs - df + 0.5) / (df + 0.5)).astype("float32")
+        avgdl = float(lengths.mean()) if n_docs and lengths.sum() else 1.0
+        norm = k1 * (1 - b + b * lengths[docs] / avgdl)
+        weights = (idf[terms] * tfs * (k1 + 1) / (tfs + norm)).astype("float32")
+        return BM25Index(self.vocab, indptr, docs, weights, n_docs)
+
+
+class BM25Index:
+    """
+    Immutable BM25 inverted index over chunks ``0 .. n_docs-1``.
+
+    Workflow
+    --------
+    lexical = BM25Index.build(chunks)
+    hits = lexical.search("liability cap $250,000", top_k=10)   # [(chunk, score)]
+    """
+
+    def __init__(self, vocab: dict[str, int], indptr: np.ndarray, doc_ids: np.ndarray,
+                 weights: np.ndarray, n_docs: int):
+        self.vocab = vocab
+        self.indptr = indptr
+        self.doc_ids = doc_ids
+        self.weights = weights
+        self.n_docs = n_docs
+        self._vocab_bytes = sum(len(t) + 80 for t in vocab)
+
+    @classmethod
+    def build(cls, chunks: Iterable[str]) -> "BM25Index":
+        builder = BM25Builder()
+        builder.add(chunks)
+        return builder.finish()
+
+    def scores(self, query: str) -> np.ndarray:
+        """BM25 score of every chunk for *query* (zeros where no term matches)."""
+        term_ids = [self.vocab[t] for t in dict.fromkeys(tokenize(query)) if t in self.vocab]
+        if not term_ids:
+            return np.zeros(self.n_docs, dtype="float32")
+        postings = [slice(self.indptr[t], self.indptr[t + 1]) for t in term_ids]
+        docs = np.concatenate([self.doc_ids[s] for s in postings])
+        weights = np.concatenate([self.weights[s] for s in postings])
+        return np.bincount(docs, weights=weights, minlength=self.n_docs).astype("float32")
+
+    def search(self, query: str, top_k: int = 10) -> list[tuple[int, float]]:
+        """[(chunk_index, score)] best first; chunks sharing no term are omitted."""
+        scores = self.scores(query)
+        k = min(top_k, int(np.count_nonzero(scores)))
+        if k <= 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [(int(i), float(scores[i])) for i in top]
+
+    # ---- persistence -----------------------------------------------------
+
+    def to_arrays(self) -> dict:
+        terms = np.empty(len(self.vocab), dtype=object)
+        for term, i in self.vocab.items():
+            terms[i] = term
+        return {"terms": terms.astype(str), "indptr": self.indptr, "doc_ids": self.doc_ids,
+                "weights": self.weights, "n_docs": np.asarray(self.n_docs)}
+
+    @classmethod
+    def from_arrays(cls, arrays) -> "BM25Index":
+        vocab = {term: i for i, term in enumerate(arrays["terms"].tolist())}
+        return cls(vocab, arrays["indptr"], arrays["doc_ids"], arrays["weights"],
+                   int(arrays["n_docs"]))
+
+    def nbytes(self) -> int:
+        """Array bytes plus a rough per-term cost for the vocabulary dict."""
+        return self.indptr.nbytes + self.doc_ids.nbytes + self.weights.nbytes + self._vocab_bytes
+
+
+def reciprocal_rank_fusion(rankings: list[list[int]], k: int = RRF_K,
+                           top_k: Optional[int] = None) -> list[tuple[int, float]]:
+    """
+    Fuse several best-first rankings of chunk ids: each list contributes
+    ``1 / (k + rank)`` per id. Returns [(chunk_index, fused_score)] best first.
+    """
+    fused: dict[int, float] = {}
+    for ranking in rankings:
+        for rank, i in enumerate(ranking, start=1):
+            fused[i] = fused.get(i, 0.0) + 1.0 / (k + rank)
+    hits = sorted(fused.items(), key=lambda h: -h[1])
+    return hits[:top_k] if top_k is not None else hits
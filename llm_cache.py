@@ -0,0 +1,257 @@
+"""
+LLM Response Cache for DocBrief
+===============================
+Skips repeat Groq generations for prompts that were already answered:
+  1. Key     — SHA-256 over model, temperature and the whitespace-normalised
+               messages, so re-indented prompt templates still match
+  2. Memory  — LRU tier bounded by entry count and total response bytes
+  3. Disk    — optional JSON-per-entry tier (LLM_CACHE_DIR) shared by workers
+               and surviving restarts, bounded by LLM_CACHE_DISK_MAX_MB
+  4. Expiry  — entries older than LLM_CACHE_TTL_S are treated as misses; a
+               periodic sweep on write deletes expired files, then the
+               oldest ones while the tier is over its byte budget
+
+Each hit is credited with the LLM time its original generation took, so
+/metrics can report how much Groq latency the cache saved.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+DISK_SWEEP_EVERY = 256   # disk writes between sweeps while under budget
+
+
+def _normalise(text: str) -> str:
+    return " ".join(text.split())
+
+
+def response_key(messages: list[dict], model: str, temperature: Optional[float]) -> str:
+    """Cache key for one chat-completion request."""
+    h = hashlib.sha256(f"{model}|{temperature}|".encode("utf-8"))
+    for m in messages:
+        h.update(f"{m['role']}\x00{_normalise(m['content'])}\x01".encode("utf-8", errors="ignore"))
+    return h.hexdigest()
+
+
+class LLMResponseCache:
+    """Thread-safe two-tier (memory LRU + optional disk) cache of LLM responses."""
+
+    def __init__(self, max_entries: int = 512, max_bytes: int = 32 * 1024 * 1024,
+                 ttl_s: float = 86400, disk_dir: Optional[str] = None,
+                 disk_max_bytes: int = 256 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_s = ttl_s
+        self.disk_max_bytes = disk_max_bytes
+        self.disk_dir = disk_dir or None
+        if self.disk_dir:
+            try:
+                os.makedirs(self.disk_dir, exist_ok=True)
+            except OSError as e:
+                print(f"LLM cache disk tier disabled ({self.disk_dir}): {e}")
+                self.disk_dir = None
+        self._entries: "OrderedDict[str, dict]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evictions = 0
+        self.bypassed = 0
+        self.saved_llm_ms = 0.0
+        self.disk_evictions = 0
+        self._disk_bytes = 0              # estimate between sweeps
+        self._disk_writes = 0
+        self._sweep_lock = threading.Lock()
+        if self.disk_dir:
+            self.sweep_disk()
+
+    # ---- public ----------------------------------------------------------
+
+    def get(self, key: str) -> Optional[dict]:
+        """Return the live entry ``{"response", "llm_ms", "created_at"}`` or None."""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and now - entry["created_at"] > self.ttl_s:
+                self._drop(key)
+                self.expired += 1
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                self.saved_llm_ms += entry["llm_ms"]
+                return entry
+
+        entry = self._disk_read(key, now)
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+            self.saved_llm_ms += entry["llm_ms"]
+            self._insert(key, entry)
+        return entry
+
+    def put(self, key: str, response: str, llm_ms: float):
+        entry = {"response": response, "llm_ms": round(llm_ms, 2), "created_at": time.time()}
+        with self._lock:
+            self._insert(key, entry)
+        self._disk_write(key, entry)
+
+    def record_bypass(self):
+        with self._lock:
+            self.bypassed += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "expired": self.expired,
+                "evictions": self.evictions,
+                "bypassed": self.bypassed,
+                "hit_rate": round((self.hits + self.disk_hits) / lookups, 4) if lookups else 0,
+                "saved_llm_ms": round(self.saved_llm_ms, 2),
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "ttl_s": self.ttl_s,
+                "disk_dir": self.disk_dir,
+                "disk_bytes": self._disk_bytes,
+                "disk_max_bytes": self.disk_max_bytes,
+                "disk_evictions": self.disk_evictions,
+            }
+
+    # ---- memory tier (lock held) -----------------------------------------
+
+    def _insert(self, key: str, entry: dict):
+        size = len(entry["response"].encode("utf-8", errors="ignore"))
+        if size > self.max_bytes:
+            return
+        self._drop(key)
+        entry["size"] = size
+        self._entries[key] = entry
+        self._bytes += size
+        while self._entries and (len(self._entries) > self.max_entries
+                                 or self._bytes > self.max_bytes):
+            old, _ = next(iter(self._entries.items()))
+            self._drop(old)
+            self.evictions += 1
+
+    def _drop(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry.get("size", 0)
+
+    # ---- disk tier -------------------------------------------------------
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, key[:2], key + ".json")
+
+    def _disk_read(self, key: str, now: float) -> Optional[dict]:
+        if not self.disk_dir:
+            return None
+        path = self._path(key)
+        try:
+            with open(path, encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if now - entry.get("created_at", 0) > self.ttl_s:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            with self._lock:
+                self.expired += 1
+            return None
+        return entry
+
+    def _disk_write(self, key: str, entry: dict):
+        if not self.disk_dir:
+            return
+        path = self._path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump({k: v for k, v in entry.items() if k != "size"}, f)
+            os.replace(tmp, path)
+            size = os.path.getsize(path)
+        except OSError as e:
+            print(f"LLM cache write failed: {e}")
+            return
+        with self._lock:
+            self._disk_bytes += size
+            self._disk_writes += 1
+            due = self._disk_bytes > self.disk_max_bytes or self._disk_writes >= DISK_SWEEP_EVERY
+        if due:
+            self.sweep_disk()
+
+    def sweep_disk(self) -> int:
+        """
+        Delete expired disk entries (by file mtime, i.e. write time), then the
+        oldest until the tier fits disk_max_bytes. Returns the bytes kept;
+        a sweep already running in another thread is not repeated.
+        """
+        if not self.disk_dir or not self._sweep_lock.acquire(blocking=False):
+            return self._disk_bytes
+        try:
+            now = time.time()
+            files = []   # (mtime, size, path)
+            for dirpath, _, names in os.walk(self.disk_dir):
+                for name in names:
+                    path = os.path.join(dirpath, name)
+                    try:
+                        st = os.stat(path)
+                    except OSError:
+                        continue   # replaced or removed by another worker
+                    files.append((st.st_mtime, st.st_size, path))
+            files.sort()
+            total = sum(size for _, size, _ in files)
+            expired = evicted = 0
+            for mtime, size, path in files:
+                is_expired = now - mtime > self.ttl_s
+                if not is_expired and total <= self.disk_max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                total -= size
+                if is_expired:
+                    expired += 1
+                else:
+                    evicted += 1
+            with self._lock:
+                self._disk_bytes = total
+                self._disk_writes = 0
+                self.expired += expired
+                self.disk_evictions += evicted
+            return total
+        finally:
+            self._sweep_lock.release()
+
+
+llm_cache = LLMResponseCache(
+    max_entries=int(os.getenv("LLM_CACHE_MAX_ENTRIES", "512")),
+    max_bytes=int(os.getenv("LLM_CACHE_MAX_MB", "32")) * 1024 * 1024,
+    ttl_s=float(os.getenv("LLM_CACHE_TTL_S", "86400")),
+    disk_dir=os.getenv("LLM_CACHE_DIR", os.path.join(".cache", "llm")),
+    disk_max_bytes=int(os.getenv("LLM_CACHE_DISK_MAX_MB", "256")) * 1024 * 1024,
+)
@@ -0,0 +1,286 @@
+"""
+LLM Gateway for DocBrief
+========================
+The single path from request threads to Groq:
+  1. Pooling     — one keep-alive HTTP connection pool shared by all threads
+  2. Admission   — at most LLM_MAX_IN_FLIGHT calls run at once; callers wait
+                   up to LLM_QUEUE_TIMEOUT_S for a slot, then fail fast
+  3. Timeouts    — every call carries its own deadline (LLM_TIMEOUT_S)
+  4. Retries     — 429 / 5xx / timeouts / connection errors are retried with
+                   jittered exponential backoff, honouring Retry-After
+  5. Breaker     — after LLM_BREAKER_FAILURES consecutive failures the
+                   circuit opens and calls fail immediately; after
+                   LLM_BREAKER_RESET_S one half-open probe decides whether
+                   it closes again
+
+Callers catch :class:`LLMUnavailable` and degrade (mock data, fallback
+replies) instead of waiting on a provider that is down. Point GROQ_BASE_URL
+at scripts/stub_llm_server.py to exercise all of this locally.
+"""
+
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+import groq
+import httpx
+
+LLM_MAX_IN_FLIGHT = int(os.getenv("LLM_MAX_IN_FLIGHT", "8"))
+LLM_QUEUE_TIMEOUT_S = float(os.getenv("LLM_QUEUE_TIMEOUT_S", "10"))
+LLM_TIMEOUT_S = float(os.getenv("LLM_TIMEOUT_S", "60"))
+LLM_CONNECT_TIMEOUT_S = float(os.getenv("LLM_CONNECT_TIMEOUT_S", "5"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))
+LLM_BACKOFF_BASE_S = float(os.getenv("LLM_BACKOFF_BASE_S", "0.5"))
+LLM_BACKOFF_MAX_S = float(os.getenv("LLM_BACKOFF_MAX_S", "8"))
+LLM_BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", "5"))
+LLM_BREAKER_RESET_S = float(os.getenv("LLM_BREAKER_RESET_S", "30"))
+
+
+class LLMUnavailable(Exception):
+    """The call was not (successfully) made: circuit open, saturated, or retries exhausted."""
+
+
+class CircuitOpen(LLMUnavailable):
+    """Raised without calling Groq while the breaker is open."""
+
+
+class GatewaySaturated(LLMUnavailable):
+    """Raised when no in-flight slot frees up within the queue timeout."""
+
+
+def make_groq_client(api_key: Optional[str], base_url: Optional[str] = None):
+    """Groq client on a pooled keep-alive connection; retries are left to the gateway."""
+    http_client = httpx.Client(
+        limits=httpx.Limits(max_connections=LLM_MAX_IN_FLIGHT,
+                            max_keepalive_connections=LLM_MAX_IN_FLIGHT),
+        timeout=httpx.Timeout(LLM_TIMEOUT_S, connect=LLM_CONNECT_TIMEOUT_S),
+    )
+    return groq.Groq(api_key=api_key, base_url=base_url or None, max_retries=0,
+                     http_client=http_client)
+
+
+def _is_retryable(exc: Exception) -> bool:
+    if isinstance(exc, (groq.APITimeoutError, groq.APIConnectionError)):
+        return True
+    status = getattr(exc, "status_code", None)
+    return status == 429 or (status is not None and status >= 500)
+
+
+def _retry_after_s(exc: Exception) -> Optional[float]:
+    response = getattr(exc, "response", None)
+    value = response.headers.get("retry-after") if response is not None else None
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+class CircuitBreaker:
+    """closed → (N consecutive failures) → open → (reset timeout) → half_open → closed | open"""
+
+    def __init__(self, failure_threshold: int = LLM_BREAKER_FAILURES,
+                 reset_timeout_s: float = LLM_BREAKER_RESET_S):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout_s = reset_timeout_s
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self.opened_at: Optional[float] = None
+        self.times_opened = 0
+        self.rejected = 0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """Whether a call may proceed now; claims the single half-open probe."""
+        with self._lock:
+            if self.state == "open" and time.time() - self.opened_at >= self.reset_timeout_s:
+                self.state = "half_open"
+            if self.state == "closed":
+                return True
+            if self.state == "half_open" and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+            self.rejected += 1
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = "closed"
+            self.consecutive_failures = 0
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.consecutive_failures += 1
+            self._probe_in_flight = False
+            if self.state == "half_open" or self.consecutive_failures >= self.failure_threshold:
+                if self.state != "open":
+                    self.times_opened += 1
+                self.state = "open"
+                self.opened_at = time.time()
+
+    def release_probe(self):
+        """Give back a half-open probe that ended without a verdict (e.g. a client error)."""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "state": self.state,
+                "consecutive_failures": self.consecutive_failures,
+                "failure_threshold": self.failure_threshold,
+                "reset_timeout_s": self.reset_timeout_s,
+                "times_opened": self.times_opened,
+                "rejected": self.rejected,
+                "opened_at": self.opened_at,
+            }
+
+
+class LLMGateway:
+    """Concurrency-limited, retrying, circuit-broken front for a Groq-compatible client."""
+
+    def __init__(self, client, max_in_flight: int = LLM_MAX_IN_FLIGHT,
+                 queue_timeout_s: float = LLM_QUEUE_TIMEOUT_S,
+                 timeout_s: float = LLM_TIMEOUT_S, max_retries: int = LLM_MAX_RETRIES,
+                 breaker: Optional[CircuitBreaker] = None):
+        self.client = client
+        self.max_in_flight = max_in_flight
+        self.queue_timeout_s = queue_timeout_s
+        self.timeout_s = timeout_s
+        self.max_retries = max_retries
+        self.breaker = breaker or CircuitBreaker()
+        self._slots = threading.BoundedSemaphore(max_in_flight)
+        self._stats_lock = threading.Lock()
+        self.in_flight = 0
+        self.calls = 0
+        self.succeeded = 0
+        self.failed = 0
+        self.retries = 0
+        self.saturated = 0
+        self.total_queue_ms = 0.0
+        self.total_call_ms = 0.0
+
+    # ---- public ----------------------------------------------------------
+
+    def complete(self, messages: list[dict], model: str, **kwargs) -> str:
+        """Blocking chat completion; returns the message content."""
+        with self._slot():
+            response = self._with_retries(
+                lambda: self.client.chat.completions.create(
+                    messages=messages, model=model, timeout=self.timeout_s, **kwargs)
+            )
+        return response.choices[0].message.content
+
+    def stream(self, messages: list[dict], model: str, **kwargs) -> Iterator[str]:
+        """
+        Streamed chat completion yielding content deltas. Opening the stream
+        is retried; once tokens have been yielded a failure propagates
+        (after being counted against the breaker) rather than replaying.
+        """
+        with self._slot():
+            stream = self._with_retries(
+                lambda: self.client.chat.completions.create(
+                    messages=messages, model=model, stream=True, timeout=self.timeout_s, **kwargs),
+                record_success=False,
+            )
+            try:
+                for chunk in stream:
+                    delta = chunk.choices[0].delta.content if chunk.choices else None
+                    if delta:
+                        yield delta
+            except Exception:
+                self.breaker.record_failure()
+                with self._stats_lock:
+                    self.failed += 1
+                raise
+            except GeneratorExit:
+                # Consumer stopped reading (client disconnect): no verdict
+                self.breaker.release_probe()
+                raise
+            finally:
+                close = getattr(stream, "close", None)
+                if close:
+                    close()
+            self.breaker.record_success()
+            with self._stats_lock:
+                self.succeeded += 1
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            return {
+                "max_in_flight": self.max_in_flight,
+                "in_flight": self.in_flight,
+                "calls": self.calls,
+                "succeeded": self.succeeded,
+                "failed": self.failed,
+                "retries": self.retries,
+                "saturated": self.saturated,
+                "avg_queue_ms": round(self.total_queue_ms / self.calls, 2) if self.calls else 0,
+                "avg_call_ms": round(self.total_call_ms / self.calls, 2) if self.calls else 0,
+                "timeout_s": self.timeout_s,
+                "max_retries": self.max_retries,
+                "breaker": self.breaker.stats(),
+            }
+
+    # ---- internals -------------------------------------------------------
+
+    @contextmanager
+    def _slot(self):
+        if not self.breaker.allow():
+            raise CircuitOpen("LLM circuit breaker is open")
+        t0 = time.perf_counter()
+        if not self._slots.acquire(timeout=self.queue_timeout_s):
+            self.breaker.release_probe()
+            with self._stats_lock:
+                self.saturated += 1
+            raise GatewaySaturated(f"no LLM slot free within {self.queue_timeout_s}s "
+                                   f"({self.max_in_flight} in flight)")
+        t1 = time.perf_counter()
+        with self._stats_lock:
+            self.in_flight += 1
+            self.calls += 1
+            self.total_queue_ms += (t1 - t0) * 1000
+        try:
+            yield
+        finally:
+            with self._stats_lock:
+                self.in_flight -= 1
+                self.total_call_ms += (time.perf_counter() - t1) * 1000
+            self._slots.release()
+
+    def _with_retries(self, call, record_success: bool = True):
+        attempt = 0
+        while True:
+            try:
+                result = call()
+            except Exception as e:
+                if not _is_retryable(e):
+                    # A bad request says nothing about provider health
+                    self.breaker.release_probe()
+                    with self._stats_lock:
+                        self.failed += 1
+                    raise
+                if attempt >= self.max_retries:
+                    self.breaker.record_failure()
+                    with self._stats_lock:
+                        self.failed += 1
+                    raise LLMUnavailable(f"LLM call failed after {attempt + 1} attempts: {e}") from e
+                delay = _retry_after_s(e)
+                if delay is None:
+                    delay = min(LLM_BACKOFF_MAX_S, LLM_BACKOFF_BASE_S * 2 ** attempt)
+                    delay *= random.uniform(0.5, 1.0)
+                attempt += 1
+                with self._stats_lock:
+                    self.retries += 1
+                print(f"LLM call failed ({e}); retry {attempt}/{self.max_retries} in {delay:.2f}s")
+                time.sleep(min(delay, LLM_BACKOFF_MAX_S))
+                continue
+            if record_success:
+                self.breaker.record_success()
+                with self._stats_lock:
+                    self.succeeded += 1
+            return result
@@ -0,0 +1,141 @@
+"""
+Map-reduce Analysis Helpers for DocBrief
+========================================
+The LLM-free half of the map-reduce analysis pipeline (app.py →
+map_reduce_analysis), for documents far larger than one context window:
+  1. Section — cut the text into consecutive sections at chunk boundaries,
+               each within a token budget (no overlap, nothing dropped);
+               a longer document means more sections, never larger ones
+  2. Merge   — combine the per-section JSON extractions: clauses and
+               obligations de-duplicated on normalised text, actions merged
+               by date and sorted chronologically
+  3. Digest  — render the merged partials as compact input for a reduce
+               call; with more than MAP_MAX_SECTIONS partials, they are
+               first reduced in batches (hierarchically) so every reduce
+               call sees at most that many
+
+Tune with MAP_SECTION_TOKENS (section size, clamped by the caller to the
+context window left after the prompt), MAP_MAX_SECTIONS (reduce fan-in),
+MAP_REDUCE_CONCURRENCY (map and batch-reduce calls in flight, see app.py)
+and MAP_REDUCE_DIGEST_TOKENS (input budget of each reduce call).
+"""
+
+import os
+import re
+from typing import Optional
+
+from context_packer import CHARS_PER_TOKEN
+from rag_engine import DEFAULT_CHUNK_STRATEGY, chunk_spans
+
+MAP_SECTION_TOKENS = int(os.getenv("MAP_SECTION_TOKENS", "6000"))
+MAP_MAX_SECTIONS = int(os.getenv("MAP_MAX_SECTIONS", "32"))  # partials per reduce call
+MAP_REDUCE_CONCURRENCY = int(os.getenv("MAP_REDUCE_CONCURRENCY", "4"))
+MAP_REDUCE_MIN_TOKENS = int(os.getenv("MAP_REDUCE_MIN_TOKENS", "0"))  # 0 = only when requested
+MAP_REDUCE_DIGEST_TOKENS = int(os.getenv("MAP_REDUCE_DIGEST_TOKENS", "6000"))  # reduce-call input
+
+_DATE_RE = re.compile(r"^\d{4}-\d{2}-\d{2}$")
+
+
+def split_sections(text: str, section_tokens: int = MAP_SECTION_TOKENS,
+                   strategy: str = DEFAULT_CHUNK_STRATEGY) -> list[str]:
+    """
+    Consecutive, non-overlapping sections of *text*, each ending on a chunk
+    boundary and at most *section_tokens* long (estimated at
+    CHARS_PER_TOKEN); only a single chunk longer than that is kept whole.
+    """
+    if not text.strip():
+        return []
+    max_chars = max(1, section_tokens) * CHARS_PER_TOKEN
+    sections: list[str] = []
+    start = prev_end = 0
+    for _, end in chunk_spans(text, strategy=strategy):
+        if end - start > max_chars and prev_end > start:
+            sections.append(text[start:prev_end])
+            start = prev_end
+        prev_end = end
+    if start < len(text):
+        sections.append(text[start:])
+    return [s for s in sections if s.strip()]
+
+
+def reduce_batches(partials: list, fan_in: int = MAP_MAX_SECTIONS) -> list[list]:
+    """Consecutive groups of at most *fan_in* partials, one reduce call each."""
+    fan_in = max(2, fan_in)
+    return [partials[i:i + fan_in] for i in range(0, len(partials), fan_in)]
+
+
+def _norm(text: str) -> str:
+    return " ".join(re.findall(r"[a-z0-9]+", str(text).lower()))
+
+
+def dedupe_texts(items: list) -> list[str]:
+    """
+    Order-preserving de-duplication on normalised text; an item whose
+    normalised form is contained in a longer one is dropped for it.
+    """
+    kept: list[tuple[str, str]] = []   # (normalised, original)
+    for item in items:
+        if not isinstance(item, str) or not item.strip():
+            continue
+        key = _norm(item)
+        if not key:
+            continue
+        replaced = False
+        for j, (other, _) in enumerate(kept):
+            if key in other:
+                replaced = True
+                break
+            if other in key:
+                kept[j] = (key, item.strip())
+                replaced = True
+                break
+        if not replaced:
+            kept.append((key, item.strip()))
+    return [original for _, original in kept]
+
+
+def merge_actions(actions: list) -> list[dict]:
+    """
+    Merge action dicts by date: one entry per (date, normalised title),
+    descriptions from different sections joined, sorted by date with
+    undated entries last.
+    """
+    merged: dict[tuple[str, str], dict] = {}
+    for action in actions:
+        if not isinstance(action, dict):
+            continue
+        date = str(action.get("date") or "").strip()
+        title = str(action.get("title") or "").strip()
+        description = str(action.get("description") or "").strip()
+        key = (date if _DATE_RE.match(date) else "", _norm(title) or _norm(description))
+        if key not in merged:
+            merged[key] = {"title": title, "date": date, "description": description}
+        elif description and _norm(description) not in _norm(merged[key]["description"]):
+            merged[key]["description"] = f"{merged[key]['description']} {description}".strip()
+    return sorted(merged.values(),
+                  key=lambda a: (not _DATE_RE.match(a["date"]), a["date"], a["title"]))
+
+
+def merge_partials(partials: list[Optional[dict]]) -> dict:
+    """Combine section results (None for failed sections) into one analysis dict."""
+    ok = [p for p in partials if isinstance(p, dict)]
+    return {
+        "summary": "\n\n".join(str(p.get("summary", "")).strip() for p in ok
+                               if str(p.get("summary", "")).strip()),
+        "key_clauses": dedupe_texts([c for p in ok for c in p.get("key_clauses") or []]),
+        "obligations": dedupe_texts([o for p in ok for o in p.get("obligations") or []]),
+        "actions": merge_actions([a for p in ok for a in p.get("actions") or []]),
+    }
+
+
+def render_digest(partials: list[Optional[dict]], merged: dict) -> str:
+    """Reduce-call input: numbered section summaries, then the merged lists."""
+    lines = [f"Section {i} summary: {str(p.get('summary', '')).strip()}"
+             for i, p in enumerate(partials, start=1) if isinstance(p, dict)]
+    lines.append("\nClauses found:")
+    lines += [f"- {c}" for c in merged["key_clauses"]]
+    lines.append("\nObligations found:")
+    lines += [f"- {o}" for o in merged["obligations"]]
+    lines.append("\nDated actions found:")
+    lines += [f"- {a['date'] or 'no date'}: {a['title']} — {a['description']}" for a in merged["actions"]]
+    return "\n".join(lines)
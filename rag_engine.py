@@ -5,46 +5,328 @@ Implements a genuine Retrieval-Augmented Generation pipeline:
   1. Chunking  — split document text into overlapping segments
   2. Embedding — encode chunks via sentence-transformers (MiniLM-L6-v2)
   3. Indexing  — store embeddings in a FAISS inner-product index
-  4. Retrieval — embed a query and retrieve Top-K relevant chunks
+  4. Retrieval — embed a query and retrieve Top-K relevant chunks, fused
+                with a BM25 lexical index (lexical_index.py) in hybrid mode
+  5. Caching   — reuse built stores for identical (text, chunking, model) keys,
+                and re-embed only changed chunks of a new document version
+  6. Persistence — write built stores to disk and reopen them memory-mapped
+  7. Alignment — pair similar chunks across two documents for comparison
+
+Every encode goes through a shared micro-batcher (embedding_service.py) so
+concurrent queries share one forward pass.
 
 All public methods return timing data (elapsed_ms) for latency analysis.
 """
 
+import hashlib
+import json
+import os
+import re
+import shutil
+import tempfile
+import threading
 import time
+from collections import OrderedDict
+from typing import Iterable, Iterator, Optional
+
 import numpy as np
 
+from context_packer import pack_chunks
+from embedding_backends import EMBED_BACKEND, EMBED_THREADS, embedding_id, load_backend
+from embedding_service import EmbeddingBatcher
+from lexical_index import BM25Builder, BM25Index, reciprocal_rank_fusion
+
+MODEL_NAME = "all-MiniLM-L6-v2"
+EMBEDDING_ID = embedding_id(MODEL_NAME, EMBED_BACKEND)  # what cache keys are built from
+
 # ---------------------------------------------------------------------------
-# Lazy-loaded globals (model + FAISS loaded once on first use)
+# Lazy-loaded globals (model + FAISS loaded once, by warm_up() or first use)
 # ---------------------------------------------------------------------------
 _model = None
+_model_backend: Optional[str] = None
+_model_load_ms: Optional[float] = None
 _faiss = None
+_load_lock = threading.Lock()
 
 
 def _get_model():
-    """Lazy-load the sentence-transformer model (≈80 MB download on first run)."""
-    global _model
+    """Lazy-load the sentence encoder on EMBED_BACKEND (≈80 MB download on first run)."""
+    global _model, _model_backend, _model_load_ms
     if _model is None:
-        from sentence_transformers import SentenceTransformer
-        _model = SentenceTransformer("all-MiniLM-L6-v2")
+        with _load_lock:
+            if _model is None:
+                t0 = time.perf_counter()
+                _model, _model_backend = load_backend(EMBED_BACKEND, MODEL_NAME, EMBED_THREADS)
+                _model_load_ms = round((time.perf_counter() - t0) * 1000, 2)
     return _model
 
 
+def embedding_backend_info() -> dict:
+    """Configured vs loaded embedding backend, for /metrics."""
+    return {
+        "configured": EMBED_BACKEND,
+        "loaded": _model_backend if _model_backend else ("custom" if _model is not None else None),
+        "threads": EMBED_THREADS,
+        "model": MODEL_NAME,
+        "load_ms": _model_load_ms,
+    }
+
+
+def _encode(texts: list[str]) -> np.ndarray:
+    """Encode *texts* into L2-normalised float32 embeddings (one model call)."""
+    emb = _get_model().encode(texts, normalize_embeddings=True,
+                              show_progress_bar=False)
+    return np.array(emb, dtype="float32")
+
+
+# All encodes go through one micro-batcher, so concurrent queries from
+# different request threads share a forward pass.
+embedding_batcher = EmbeddingBatcher(
+    _encode,
+    max_batch_size=int(os.getenv("EMBED_MAX_BATCH", "64")),
+    max_wait_ms=float(os.getenv("EMBED_MAX_WAIT_MS", "5")),
+)
+
+
 def _get_faiss():
     """Lazy-import faiss."""
     global _faiss
     if _faiss is None:
-        import faiss as _f
-        _faiss = _f
+        with _load_lock:
+            if _faiss is None:
+                import faiss as _f
+                _faiss = _f
     return _faiss
 
 
+# ---------------------------------------------------------------------------
+# Warm-up (load model + FAISS and run one encode before the first request)
+# ---------------------------------------------------------------------------
+WARMUP_ENABLED = os.getenv("RAG_WARMUP", "1").lower() not in ("0", "false", "no")
+
+_warmup = {"status": "not_started", "error": None, "timings": {},
+           "started_at": None, "finished_at": None}
+_warmup_lock = threading.Lock()
+_warmup_thread: Optional[threading.Thread] = None
+
+
+def warm_up() -> dict:
+    """
+    Import FAISS, load the embedding model and push one dummy batch through
+    the encoder and a tiny index, so the first real request pays none of
+    the load / first-inference cost. Returns the stage timings.
+    """
+    timings = {}
+    t0 = time.perf_counter()
+    faiss = _get_faiss()
+    timings["faiss_import_ms"] = round((time.perf_counter() - t0) * 1000, 2)
+
+    t1 = time.perf_counter()
+    _get_model()
+    timings["model_load_ms"] = round((time.perf_counter() - t1) * 1000, 2)
+
+    t2 = time.perf_counter()
+    emb = _encode(["DocBrief warm-up: termination notice period.",
+                   "Limitation of liability and governing law."])
+    timings["first_encode_ms"] = round((time.perf_counter() - t2) * 1000, 2)
+
+    t3 = time.perf_counter()
+    index = faiss.IndexFlatIP(emb.shape[1])
+    index.add(emb)
+    index.search(emb[:1], 1)
+    timings["first_search_ms"] = round((time.perf_counter() - t3) * 1000, 2)
+    timings["warmup_ms"] = round((time.perf_counter() - t0) * 1000, 2)
+    return timings
+
+
+def _run_warmup():
+    try:
+        timings = warm_up()
+    except Exception as e:
+        print(f"RAG warm-up failed (models load on first request instead): {e}")
+        with _warmup_lock:
+            _warmup.update(status="failed", error=str(e), finished_at=time.time())
+        return
+    with _warmup_lock:
+        _warmup.update(status="ready", timings=timings, finished_at=time.time())
+
+
+def start_warmup() -> bool:
+    """Run warm_up() on a daemon thread; no-op if it already ran or is running."""
+    global _warmup_thread
+    with _warmup_lock:
+        if _warmup_thread is not None and (_warmup_thread.is_alive() or _warmup["status"] == "ready"):
+            return False
+        _warmup.update(status="warming", error=None, started_at=time.time(), finished_at=None)
+        _warmup_thread = threading.Thread(target=_run_warmup, name="rag-warmup", daemon=True)
+        _warmup_thread.start()
+    return True
+
+
+def warmup_status() -> dict:
+    """Snapshot of the warm-up state; ``ready`` is True once a request pays no load cost."""
+    with _warmup_lock:
+        state = dict(_warmup)
+    state["ready"] = state["status"] == "ready" or (_model is not None and _faiss is not None)
+    return state
+
+
+# ---------------------------------------------------------------------------
+# Index factory (flat for small documents, ANN for large ones)
+# ---------------------------------------------------------------------------
+INDEX_TYPES = ("auto", "flat", "hnsw", "ivf")
+DEFAULT_INDEX_TYPE = os.getenv("RAG_INDEX_TYPE", "auto").lower()
+ANN_MIN_CHUNKS = int(os.getenv("RAG_ANN_MIN_CHUNKS", "10000"))
+HNSW_M = int(os.getenv("RAG_HNSW_M", "32"))
+HNSW_EF_CONSTRUCTION = int(os.getenv("RAG_HNSW_EF_CONSTRUCTION", "80"))
+HNSW_EF_SEARCH = int(os.getenv("RAG_HNSW_EF_SEARCH", "64"))
+IVF_NPROBE = int(os.getenv("RAG_IVF_NPROBE", "16"))
+
+# How the index stores vectors: float32 (exact), float16 / sq8 scalar
+# quantization (½ / ¼ of the bytes), or pq product-quantization codes
+# (RAG_PQ_M bytes per vector). RAG_KEEP_EMBEDDINGS=0 additionally drops
+# the float32 copy RAGStore keeps beside the index; vectors are then
+# decoded from the index on the rare paths that need them.
+VECTOR_CODECS = ("float32", "float16", "sq8", "pq")
+DEFAULT_VECTOR_CODEC = os.getenv("RAG_VECTOR_CODEC", "float32").lower()
+KEEP_EMBEDDINGS = os.getenv("RAG_KEEP_EMBEDDINGS", "1").lower() not in ("0", "false", "no")
+PQ_M = int(os.getenv("RAG_PQ_M", "48"))
+PQ_MIN_TRAIN = 39 * 256  # FAISS wants ≥ 39 points per PQ centroid; fewer → sq8
+_CODEC_FACTORY = {"float16": "SQfp16", "sq8": "SQ8"}
+
+
+def resolve_index_type(index_type: str, n_chunks: int) -> str:
+    """Map "auto" to a concrete type: flat below ANN_MIN_CHUNKS, else HNSW."""
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Unknown index_type '{index_type}' (expected one of {INDEX_TYPES})")
+    if index_type == "auto":
+        return "hnsw" if n_chunks >= ANN_MIN_CHUNKS else "flat"
+    return index_type
+
+
+def resolve_codec(codec: str, n_vectors: int, dim: int) -> str:
+    """Validate *codec*; pq falls back to sq8 when it cannot be trained well."""
+    if codec not in VECTOR_CODECS:
+        raise ValueError(f"Unknown vector codec '{codec}' (expected one of {VECTOR_CODECS})")
+    if codec == "pq" and (n_vectors < PQ_MIN_TRAIN or dim % PQ_M):
+        return "sq8"
+    return codec
+
+
+def make_index(embeddings: np.ndarray, index_type: str = "flat",
+               codec: str = DEFAULT_VECTOR_CODEC):
+    """
+    Build a FAISS inner-product index of *index_type* over *embeddings*.
+
+    - flat : exact brute-force scan (IndexFlatIP)
+    - hnsw : graph index (IndexHNSWFlat), search breadth set by efSearch
+    - ivf  : inverted lists over ~4·√n k-means cells (IndexIVFFlat), nprobe cells searched
+
+    *codec* picks how vectors are stored inside it (see VECTOR_CODECS);
+    anything but float32 swaps in the SQ / PQ variant of the same index.
+    """
+    faiss = _get_faiss()
+    n, dim = embeddings.shape
+    index_type = resolve_index_type(index_type, n)
+    codec = resolve_codec(codec, n, dim)
+    storage = "Flat" if codec == "float32" else _CODEC_FACTORY.get(codec, f"PQ{PQ_M}")
+
+    if index_type == "hnsw":
+        if codec == "float32":
+            index = faiss.IndexHNSWFlat(dim, HNSW_M, faiss.METRIC_INNER_PRODUCT)
+        else:
+            index = faiss.index_factory(dim, f"HNSW{HNSW_M}_{storage}", faiss.METRIC_INNER_PRODUCT)
+        index.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+    elif index_type == "ivf":
+        # FAISS wants ≥ 39 training points per centroid
+        nlist = max(1, min(int(4 * np.sqrt(n)), n // 39))
+        index = faiss.index_factory(dim, f"IVF{nlist},{storage}", faiss.METRIC_INNER_PRODUCT)
+    elif codec == "float32":
+        index = faiss.IndexFlatIP(dim)
+    else:
+        index = faiss.index_factory(dim, storage, faiss.METRIC_INNER_PRODUCT)
+
+    if codec == "pq":
+        # index_factory turns on polysemous training for PQ, which costs
+        # minutes and only helps Hamming-distance search we do not use
+        base = faiss.downcast_index(index.storage) if hasattr(index, "hnsw") else index
+        if hasattr(base, "do_polysemous_training"):
+            base.do_polysemous_training = False
+    if not index.is_trained:
+        index.train(embeddings)
+    index.add(embeddings)
+    set_search_params(index)
+    return index
+
+
+def index_kind(index) -> str:
+    """Report "flat", "hnsw" or "ivf" for a (possibly reloaded) FAISS index."""
+    if index is None:
+        return "none"
+    if hasattr(index, "hnsw"):
+        return "hnsw"
+    if hasattr(index, "nprobe"):
+        return "ivf"
+    return "flat"
+
+
+def index_codec(index) -> str:
+    """Report the VECTOR_CODECS entry a (possibly reloaded) FAISS index stores vectors as."""
+    if index is None:
+        return "none"
+    faiss = _get_faiss()
+    base = faiss.downcast_index(index.storage) if hasattr(index, "hnsw") else index
+    if isinstance(base, (faiss.IndexScalarQuantizer, faiss.IndexIVFScalarQuantizer)):
+        return "float16" if base.sq.qtype == faiss.ScalarQuantizer.QT_fp16 else "sq8"
+    if isinstance(base, (faiss.IndexPQ, faiss.IndexIVFPQ)):
+        return "pq"
+    return "float32"
+
+
+def index_bytes(index) -> int:
+    """Approximate resident size of a FAISS index: vector codes plus graph / id overhead."""
+    if index is None:
+        return 0
+    if hasattr(index, "hnsw"):
+        storage = _get_faiss().downcast_index(index.storage)
+        return index.ntotal * storage.code_size + index.hnsw.neighbors.size() * 4
+    code_size = getattr(index, "code_size", index.d * 4)
+    if hasattr(index, "nprobe"):
+        code_size += 8  # inverted lists keep an int64 id per vector
+    return index.ntotal * code_size
+
+
+def set_search_params(index, nprobe: Optional[int] = None, ef_search: Optional[int] = None):
+    """Apply nprobe / efSearch to an ANN index; no-op for flat indexes."""
+    kind = index_kind(index)
+    if kind == "hnsw":
+        index.hnsw.efSearch = ef_search or HNSW_EF_SEARCH
+    elif kind == "ivf":
+        index.nprobe = nprobe or IVF_NPROBE
+
+
 # ---------------------------------------------------------------------------
 # 1. Chunking
 # ---------------------------------------------------------------------------
 
-def chunk_text(text: str, chunk_size: int = 500, overlap: int = 50) -> list[str]:
+CHUNK_STRATEGIES = ("fixed", "structured")
+DEFAULT_CHUNK_STRATEGY = os.getenv("RAG_CHUNK_STRATEGY", "fixed").lower()
+# Uploaded documents (app.py → document_store) may be revised later; their
+# chunk boundaries follow the text's structure so an edit only re-chunks
+# its own neighbourhood and the rest of the index is reused.
+DOCUMENT_CHUNK_STRATEGY = os.getenv("RAG_DOCUMENT_CHUNK_STRATEGY", "structured").lower()
+
+
+def _check_strategy(strategy: str) -> str:
+    if strategy not in CHUNK_STRATEGIES:
+        raise ValueError(f"Unknown chunk strategy '{strategy}' (expected one of {CHUNK_STRATEGIES})")
+    return strategy
+
+
+def chunk_text(text: str, chunk_size: int = 500, overlap: int = 50,
+               strategy: str = DEFAULT_CHUNK_STRATEGY) -> list[str]:
     """
-    Split *text* into overlapping character-based chunks.
+    Split *text* into overlapping chunks.
 
     Parameters
     ----------
@@ -54,6 +336,10 @@ def chunk_text(text: str, chunk_size: int = 500, overlap: int = 50) -> list[str]
         Target characters per chunk (~100 words at 5 chars/word).
     overlap : int
         Characters shared between consecutive chunks to preserve context.
+    strategy : str
+        "fixed" cuts every chunk_size - overlap characters; "structured"
+        cuts at section headings, paragraphs or sentences (see
+        :func:`iter_structured_spans`).
 
     Returns
     -------
@@ -62,6 +348,8 @@ def chunk_text(text: str, chunk_size: int = 500, overlap: int = 50) -> list[str]
     """
     if not text or not text.strip():
         return []
+    if _check_strategy(strategy) == "structured":
+        return [chunk for _, _, chunk in iter_structured_spans([text], chunk_size, overlap)]
 
     chunks: list[str] = []
     start = 0
@@ -77,9 +365,194 @@ def chunk_text(text: str, chunk_size: int = 500, overlap: int = 50) -> list[str]
     return chunks
 
 
+def chunk_spans(text: str, chunk_size: int = 500, overlap: int = 50,
+                strategy: str = DEFAULT_CHUNK_STRATEGY) -> list[tuple[int, int]]:
+    """
+    Character (start, end) offsets of each chunk :func:`chunk_text` returns,
+    in the same order, so ``text[start:end] == chunk``.
+    """
+    spans: list[tuple[int, int]] = []
+    if not text or not text.strip():
+        return spans
+    if _check_strategy(strategy) == "structured":
+        return [(start, end) for start, end, _ in iter_structured_spans([text], chunk_size, overlap)]
+    start = 0
+    text_len = len(text)
+    while start < text_len:
+        raw = text[start:min(start + chunk_size, text_len)]
+        stripped = raw.strip()
+        if stripped:
+            lead = len(raw) - len(raw.lstrip())
+            spans.append((start + lead, start + lead + len(stripped)))
+        start += chunk_size - overlap
+    return spans
+
+
+def iter_chunks(pieces: Iterable[str], chunk_size: int = 500,
+                overlap: int = 50, strategy: str = DEFAULT_CHUNK_STRATEGY) -> Iterator[str]:
+    """
+    Incremental :func:`chunk_text` over a stream of text pieces (e.g. pages).
+
+    Yields exactly the chunks ``chunk_text("".join(pieces))`` would, but only
+    buffers the unconsumed tail, so memory is bounded by one piece plus one
+    chunk rather than by the whole document.
+    """
+    if _check_strategy(strategy) == "structured":
+        for _, _, chunk in iter_structured_spans(pieces, chunk_size, overlap):
+            yield chunk
+        return
+
+    step = chunk_size - overlap
+    buf = ""  # always starts at the next chunk's start offset
+    for piece in pieces:
+        if not piece:
+            continue
+        buf += piece
+        start = 0
+        while len(buf) - start >= chunk_size:
+            chunk = buf[start:start + chunk_size].strip()
+            if chunk:
+                yield chunk
+            start += step
+        buf = buf[start:]
+
+    start = 0
+    while start < len(buf):
+        chunk = buf[start:start + chunk_size].strip()
+        if chunk:
+            yield chunk
+        start += step
+
+
+# ---- structure-aware chunking ----------------------------------------------
+#
+# Break points, strongest first. Every quantifier is bounded, so each match
+# attempt does constant work and a scan stays linear in the window length.
+_BREAK_RE = re.compile(
+    # numbered / labelled heading at the start of a line: "4.", "4.2)", "(b)", "Section 7"
+    r"(?P<heading>(?<=\n)[ \t]{0,8}(?=(?:\d{1,3}(?:\.\d{1,3}){0,3}[.)]?|\([a-z0-9]{1,3}\)"
+    r"|ARTICLE|Article|SECTION|Section|SCHEDULE|Schedule|CLAUSE|Clause|§)[ \t]))"
+    # blank line
+    r"|(?P<paragraph>\n[ \t]{0,16}\n)"
+    # sentence end (not "4." inside a heading number)
+    r"|(?P<sentence>(?<=[A-Za-z)\]\"'%])[.!?][\"')\]]?(?=\s))"
+)
+_BREAK_LOOKAHEAD = 32  # chars past the window a break match may need to see
+CHARS_PER_TOKEN = 4    # MiniLM WordPiece averages ~4 characters per token
+
+
+def _structured_cut(buf: str, start: int, chunk_size: int, overlap: int) -> tuple[int, int]:
+    """
+    Choose where the chunk starting at *start* ends, and where the next one
+    starts. Needs ``buf[start:start + chunk_size + _BREAK_LOOKAHEAD]``.
+
+    The cut is the furthest heading (moved back to the first of a run of
+    headings, so titles stay with their body), else the furthest blank line,
+    else the furthest sentence end, else the furthest whitespace in
+    ``(start + min_chars, start + chunk_size]``. Only cuts that are not at a
+    heading or blank line carry an overlap, and that overlap starts on a
+    sentence (or word) boundary.
+    """
+    min_chars = max(chunk_size // 4, overlap + 1)
+    limit = start + chunk_size
+    best = {"heading": -1, "paragraph": -1, "sentence": -1}
+    headings: list[int] = []
+    sentences: list[int] = []
+    for m in _BREAK_RE.finditer(buf, start + 1, limit + _BREAK_LOOKAHEAD):
+        pos = m.end()
+        if pos > limit:
+            break
+        kind = m.lastgroup
+        if kind == "sentence":
+            sentences.append(pos)
+        elif kind == "heading":
+            headings.append(pos)
+        if pos > start + min_chars:
+            best[kind] = pos
+
+    if best["heading"] > 0:
+        # Keep a title line with the sub-heading right after it ("3. Fees" / "3.1 ...")
+        cut = best["heading"]
+        for pos in reversed(headings[:-1]):
+            if pos <= start + min_chars or cut - pos >= min_chars:
+                break
+            cut = pos
+        return cut, cut
+    if best["paragraph"] > 0:
+        return best["paragraph"], best["paragraph"]
+
+    cut = best["sentence"]
+    if cut < 0:
+        cut = max(buf.rfind(" ", start + min_chars, limit), buf.rfind("\n", start + min_chars, limit))
+        if cut <= start + min_chars:
+            cut = limit
+    for pos in sentences:
+        if cut - overlap <= pos < cut:
+            return cut, pos
+    space = buf.find(" ", cut - overlap, cut)
+    return cut, (space + 1 if space >= 0 else cut)
+
+
+def iter_structured_spans(pieces: Iterable[str], chunk_size: int = 500,
+                          overlap: int = 50) -> Iterator[tuple[int, int, str]]:
+    """
+    Structure-aware chunking over a stream of text pieces.
+
+    Chunks end at numbered-section headings, blank lines or sentence ends
+    where possible, and never exceed *chunk_size* characters (~chunk_size /
+    CHARS_PER_TOKEN tokens, inside MiniLM's 256-token window). Yields
+    (start, end, chunk) with offsets into ``"".join(pieces)``.
+
+    Each cut looks at a fixed window past the chunk start, so the stream is
+    consumed in one linear pass and the result does not depend on how the
+    text was split into pieces.
+    """
+    buf = ""
+    base = 0    # offset of buf[0] in the joined text
+    start = 0   # offset of the next chunk
+
+    def emit(s: int, e: int):
+        raw = buf[s - base:e - base]
+        chunk = raw.strip()
+        if chunk:
+            lead = len(raw) - len(raw.lstrip())
+            return s + lead, s + lead + len(chunk), chunk
+        return None
+
+    for piece in pieces:
+        if not piece:
+            continue
+        buf += piece
+        while base + len(buf) - start >= chunk_size + _BREAK_LOOKAHEAD:
+            cut, nxt = _structured_cut(buf, start - base, chunk_size, overlap)
+            span = emit(start, base + cut)
+            if span:
+                yield span
+            start = base + nxt
+        buf = buf[start - base:]
+        base = start
+
+    while start < base + len(buf):
+        if base + len(buf) - start <= chunk_size:
+            span = emit(start, base + len(buf))
+            if span:
+                yield span
+            return
+        cut, nxt = _structured_cut(buf, start - base, chunk_size, overlap)
+        span = emit(start, base + cut)
+        if span:
+            yield span
+        start = base + nxt
+
+
 # ---------------------------------------------------------------------------
 # 2–4. RAG Store (embed → index → retrieve)
 # ---------------------------------------------------------------------------
+PACK_MAX_CANDIDATES = 256  # most chunks retrieved to fill a token budget
+RETRIEVAL_MODES = ("dense", "hybrid")
+DEFAULT_RETRIEVAL_MODE = os.getenv("RAG_RETRIEVAL_MODE", "hybrid").lower()
+HYBRID_CANDIDATES = int(os.getenv("RAG_HYBRID_CANDIDATES", "50"))  # per ranking, before fusion
+
 
 class RAGStore:
     """
@@ -90,55 +563,196 @@ class RAGStore:
     store = RAGStore()
     timing = store.build_index(document_text)   # chunk + embed + index
     results, timing = store.query("question")   # embed query + retrieve top-K
+
+    *index_type* is "flat", "hnsw", "ivf" or "auto" (flat below
+    ANN_MIN_CHUNKS chunks, HNSW above); see :func:`make_index`. *codec*
+    sets how the index stores vectors, and with *keep_embeddings* False
+    the float32 array is dropped once the index is built. *retrieval* is
+    "dense" (FAISS only) or "hybrid" (FAISS and BM25 rankings fused by
+    reciprocal rank); the BM25 index is built alongside FAISS either way.
     """
 
-    def __init__(self):
+    def __init__(self, index_type: str = DEFAULT_INDEX_TYPE,
+                 codec: str = DEFAULT_VECTOR_CODEC, keep_embeddings: bool = KEEP_EMBEDDINGS,
+                 retrieval: str = DEFAULT_RETRIEVAL_MODE):
+        resolve_index_type(index_type, 0)  # validate early
+        resolve_codec(codec, 0, 0)
+        if retrieval not in RETRIEVAL_MODES:
+            raise ValueError(f"retrieval must be one of {RETRIEVAL_MODES}, got {retrieval!r}")
+        self.index_type = index_type
+        self.codec = codec
+        self.keep_embeddings = keep_embeddings
+        self.retrieval = retrieval
         self.chunks: list[str] = []
-        self.index = None          # faiss.IndexFlatIP
-        self.embeddings = None     # np.ndarray (n_chunks × dim)
+        self.index = None          # faiss index (flat / HNSW / IVF)
+        self.embeddings = None     # np.ndarray (n_chunks × dim), None when dropped
+        self.lexical: Optional[BM25Index] = None
+        self._chunk_hashes: Optional[list[str]] = None
+
+    def settings(self) -> dict:
+        """Constructor arguments that reproduce this store's configuration."""
+        return {"index_type": self.index_type, "codec": self.codec,
+                "keep_embeddings": self.keep_embeddings, "retrieval": self.retrieval}
 
     # ---- build -----------------------------------------------------------
 
-    def build_index(self, text: str, chunk_size: int = 500, overlap: int = 50) -> dict:
+    def build_index(self, text: str, chunk_size: int = 500, overlap: int = 50,
+                    strategy: str = DEFAULT_CHUNK_STRATEGY,
+                    reuse: Optional["RAGStore"] = None) -> dict:
         """
-        Chunk text, generate embeddings, and build a FAISS index.
+        Chunk text, generate embeddings, and build a FAISS index and the
+        BM25 inverted index.
+
+        With *reuse* (typically the store of a previous version of the same
+        document, or this store itself to update it in place), chunks are
+        matched by content hash: matching chunks take the stored vector and
+        only new or changed chunks are embedded. Chunks that no longer occur
+        are dropped, since the indexes are rebuilt from the new chunk list.
 
-        Returns dict with timing: chunk_ms, embedding_ms, index_ms, total_ms,
-        plus n_chunks and embedding_dim.
+        Returns dict with timing: chunk_ms, embedding_ms, index_ms,
+        lexical_index_ms, total_ms, plus n_chunks, embedding_dim, index_type,
+        vector_codec, bytes_per_chunk (vector storage: index + kept
+        embeddings) and chunk_strategy; with *reuse* also chunks_reused,
+        chunks_embedded and chunks_removed.
         """
-        faiss = _get_faiss()
-        model = _get_model()
         timings: dict = {}
 
         # --- Chunk ---
         t0 = time.perf_counter()
-        self.chunks = chunk_text(text, chunk_size, overlap)
+        chunks = chunk_text(text, chunk_size, overlap, strategy)
         timings["chunk_ms"] = round((time.perf_counter() - t0) * 1000, 2)
 
-        if not self.chunks:
-            return {**timings, "n_chunks": 0, "embedding_dim": 0,
+        if not chunks:
+            self.chunks = []
+            self._chunk_hashes = None
+            self.lexical = None
+            return {**timings, "n_chunks": 0, "embedding_dim": 0, "chunk_strategy": strategy,
                     "embedding_ms": 0, "index_ms": 0, "total_ms": timings["chunk_ms"]}
 
-        # --- Embed ---
+        # --- Embed (only chunks *reuse* has no vector for) ---
         t1 = time.perf_counter()
-        self.embeddings = model.encode(self.chunks, normalize_embeddings=True,
-                                       show_progress_bar=False)
-        self.embeddings = np.array(self.embeddings, dtype="float32")
+        if reuse is not None and reuse.chunks and reuse.index is not None:
+            embeddings, reuse_stats = _embed_reusing(chunks, reuse)
+            timings.update(reuse_stats)
+        else:
+            embeddings = embedding_batcher.encode(chunks)
+        self.chunks = chunks
+        self._chunk_hashes = None
+        self.embeddings = embeddings
         timings["embedding_ms"] = round((time.perf_counter() - t1) * 1000, 2)
 
         # --- Index (Inner Product on L2-normalised vectors ≡ cosine similarity) ---
         t2 = time.perf_counter()
         dim = self.embeddings.shape[1]
-        self.index = faiss.IndexFlatIP(dim)
-        self.index.add(self.embeddings)
+        self.index = make_index(self.embeddings, self.index_type, self.codec)
+        if not self.keep_embeddings:
+            self.embeddings = None
         timings["index_ms"] = round((time.perf_counter() - t2) * 1000, 2)
 
+        # --- Lexical (BM25 postings over the same chunks) ---
+        t3 = time.perf_counter()
+        self.lexical = BM25Index.build(self.chunks)
+        timings["lexical_index_ms"] = round((time.perf_counter() - t3) * 1000, 2)
+
         timings["n_chunks"] = len(self.chunks)
         timings["embedding_dim"] = dim
+        timings["index_type"] = index_kind(self.index)
+        timings["vector_codec"] = index_codec(self.index)
+        timings["bytes_per_chunk"] = self.bytes_per_chunk()
+        timings["chunk_strategy"] = strategy
         timings["total_ms"] = round(sum(v for k, v in timings.items()
                                         if k.endswith("_ms")), 2)
         return timings
 
+    def build_index_stream(self, pieces: Iterable[str], chunk_size: int = 500,
+                           overlap: int = 50, batch_size: int = 64,
+                           strategy: str = DEFAULT_CHUNK_STRATEGY) -> dict:
+        """
+        Build the index from a stream of text pieces (e.g. PDF pages).
+
+        Chunks are embedded and added to FAISS in batches of *batch_size* as
+        soon as they are available, so the first chunks are indexed before
+        the last piece has been produced.
+
+        Each batch's terms also go into the BM25 index as it arrives.
+        Returns the same keys as :meth:`build_index`, plus n_batches and
+        first_batch_ms. ``chunk_ms`` here includes time spent producing the
+        pieces upstream (e.g. PDF parsing), since the two are interleaved.
+
+        Batches are added to a flat index while streaming; if the final size
+        calls for an ANN index (or the codec for compressed storage), it is
+        rebuilt once from the embeddings.
+        """
+        faiss = _get_faiss()
+        self.chunks = []
+        self._chunk_hashes = None
+        self.index = None
+        lexical = BM25Builder()
+        embedding_ms = index_ms = lexical_ms = 0.0
+        n_batches = 0
+        first_batch_ms = None
+        parts: list[np.ndarray] = []
+        pending: list[str] = []
+        t_start = time.perf_counter()
+
+        def flush():
+            nonlocal embedding_ms, index_ms, lexical_ms, n_batches, first_batch_ms
+            t1 = time.perf_counter()
+            emb = embedding_batcher.encode(pending)
+            t2 = time.perf_counter()
+            if self.index is None:
+                self.index = faiss.IndexFlatIP(emb.shape[1])
+            self.index.add(emb)
+            t3 = time.perf_counter()
+            lexical.add(pending)
+            embedding_ms += (t2 - t1) * 1000
+            index_ms += (t3 - t2) * 1000
+            lexical_ms += (time.perf_counter() - t3) * 1000
+            parts.append(emb)
+            self.chunks.extend(pending)
+            pending.clear()
+            n_batches += 1
+            if first_batch_ms is None:
+                first_batch_ms = round((t3 - t_start) * 1000, 2)
+
+        for chunk in iter_chunks(pieces, chunk_size, overlap, strategy):
+            pending.append(chunk)
+            if len(pending) >= batch_size:
+                flush()
+        if pending:
+            flush()
+
+        self.embeddings = np.vstack(parts) if parts else None
+        parts.clear()
+        if self.embeddings is not None and (
+                resolve_index_type(self.index_type, len(self.chunks)) != "flat"
+                or self.codec != "float32"):
+            t4 = time.perf_counter()
+            self.index = make_index(self.embeddings, self.index_type, self.codec)
+            index_ms += (time.perf_counter() - t4) * 1000
+        if not self.keep_embeddings:
+            self.embeddings = None
+        t5 = time.perf_counter()
+        self.lexical = lexical.finish() if self.chunks else None
+        lexical_ms += (time.perf_counter() - t5) * 1000
+
+        total_ms = (time.perf_counter() - t_start) * 1000
+        return {
+            "chunk_ms": round(total_ms - embedding_ms - index_ms - lexical_ms, 2),
+            "embedding_ms": round(embedding_ms, 2),
+            "index_ms": round(index_ms, 2),
+            "lexical_index_ms": round(lexical_ms, 2),
+            "n_chunks": len(self.chunks),
+            "embedding_dim": self.index.d if self.index is not None else 0,
+            "index_type": index_kind(self.index),
+            "vector_codec": index_codec(self.index),
+            "bytes_per_chunk": self.bytes_per_chunk(),
+            "chunk_strategy": strategy,
+            "n_batches": n_batches,
+            "first_batch_ms": first_batch_ms or 0,
+            "total_ms": round(total_ms, 2),
+        }
+
     # ---- query -----------------------------------------------------------
 
     def query(self, query_text: str, top_k: int = 5) -> tuple[list[str], dict]:
@@ -151,30 +765,185 @@ class RAGStore:
             retrieved_chunks : list[str]   — ordered by relevance (best first)
             timings          : dict        — retrieval_ms, query_embedding_ms
         """
-        if self.index is None or not self.chunks:
-            return [], {"retrieval_ms": 0, "query_embedding_ms": 0}
+        hits, timings = self.search(query_text, top_k)
+        return [self.chunks[i] for i, _ in hits], timings
 
-        model = _get_model()
+    def search(self, query_text: str, top_k: int = 5,
+               retrieval: Optional[str] = None) -> tuple[list[tuple[int, float]], dict]:
+        """
+        Like :meth:`query`, but returns [(chunk_index, score)] best first.
+
+        In hybrid mode the dense and BM25 top HYBRID_CANDIDATES are fused by
+        reciprocal rank, so scores are fused RRF scores rather than cosines;
+        retrieval_ms covers both searches and the fusion (bm25_ms is the
+        lexical share). *retrieval* overrides the store's mode.
+        """
+        hits, timings = self.search_many([query_text], top_k, retrieval)
+        timings.pop("n_queries", None)
+        timings.update(timings.pop("per_query")[0])
+        return hits[0], timings
+
+    def search_many(self, queries: list[str], top_k: int = 5,
+                    retrieval: Optional[str] = None) -> tuple[list[list[tuple[int, float]]], dict]:
+        """
+        :meth:`search` for several queries at once: one batched encode and
+        one batched FAISS search, then per-query BM25 fusion in hybrid mode.
+
+        Returns (hits per query, timings); timings["per_query"] holds each
+        query's scores (and bm25_ms / n_lexical_hits when hybrid).
+        """
+        if self.index is None or not self.chunks or not queries:
+            return [[] for _ in queries], {"retrieval_ms": 0, "query_embedding_ms": 0,
+                                           "per_query": [{} for _ in queries]}
+        retrieval = retrieval or self.retrieval
+        hybrid = retrieval == "hybrid"
         timings: dict = {}
 
-        # Embed query
+        # Embed all queries in one pass (micro-batched with concurrent callers)
         t0 = time.perf_counter()
-        q_emb = model.encode([query_text], normalize_embeddings=True,
-                             show_progress_bar=False)
-        q_emb = np.array(q_emb, dtype="float32")
+        q_emb = embedding_batcher.encode(list(queries))
         timings["query_embedding_ms"] = round((time.perf_counter() - t0) * 1000, 2)
 
         # Retrieve
         t1 = time.perf_counter()
         k = min(top_k, len(self.chunks))
-        scores, indices = self.index.search(q_emb, k)
+        n_dense = min(len(self.chunks), max(top_k, HYBRID_CANDIDATES)) if hybrid else k
+        scores, indices = self.index.search(q_emb, n_dense)
+
+        results, per_query = [], []
+        for query, row_ids, row_scores in zip(queries, indices, scores):
+            # ANN indexes pad short result lists with -1
+            hits = [(int(i), float(s)) for i, s in zip(row_ids, row_scores)
+                    if 0 <= i < len(self.chunks)]
+            stats: dict = {}
+            if hybrid:
+                t2 = time.perf_counter()
+                lexical_hits = self.lexical_index().search(query, n_dense)
+                stats["bm25_ms"] = round((time.perf_counter() - t2) * 1000, 2)
+                stats["n_lexical_hits"] = len(lexical_hits)
+                hits = reciprocal_rank_fusion([[i for i, _ in hits], [i for i, _ in lexical_hits]],
+                                              top_k=k)
+            stats["scores"] = [round(s, 4) for _, s in hits]
+            results.append(hits)
+            per_query.append(stats)
         timings["retrieval_ms"] = round((time.perf_counter() - t1) * 1000, 2)
 
-        retrieved = [self.chunks[i] for i in indices[0] if i < len(self.chunks)]
         timings["top_k"] = k
-        timings["scores"] = [round(float(s), 4) for s in scores[0][:len(retrieved)]]
+        timings["retrieval_mode"] = retrieval
+        timings["n_queries"] = len(queries)
+        timings["per_query"] = per_query
+        return results, timings
+
+    def lexical_index(self) -> BM25Index:
+        """The BM25 index, built on first use for stores persisted without one."""
+        if self.lexical is None:
+            self.lexical = BM25Index.build(self.chunks)
+        return self.lexical
+
+    def score_chunks(self, query_text: str) -> tuple[np.ndarray, dict]:
+        """
+        Cosine similarity of *query_text* to every chunk, in chunk order.
+        Used to rank chunks that were selected by other means (e.g. alignment).
+        """
+        if self.index is None or not self.chunks:
+            return np.zeros(0, dtype="float32"), {"query_embedding_ms": 0, "scoring_ms": 0}
+        t0 = time.perf_counter()
+        q_emb = embedding_batcher.encode([query_text])
+        t1 = time.perf_counter()
+        scores = self.vectors() @ q_emb[0]
+        return scores, {"query_embedding_ms": round((t1 - t0) * 1000, 2),
+                        "scoring_ms": round((time.perf_counter() - t1) * 1000, 2)}
 
-        return retrieved, timings
+    def vectors(self) -> np.ndarray:
+        """
+        Chunk embeddings as float32 (n_chunks × dim): the kept array, or —
+        when it was dropped — vectors decoded from the index (lossy for
+        float16 / sq8 / pq codecs).
+        """
+        if self.embeddings is not None:
+            return np.ascontiguousarray(self.embeddings, dtype="float32")
+        if self.index is None or not self.index.ntotal:
+            return np.zeros((0, self.index.d if self.index is not None else 0), dtype="float32")
+        if hasattr(self.index, "nprobe"):
+            self.index.make_direct_map()
+        return self.index.reconstruct_n(0, self.index.ntotal)
+
+    # ---- versions --------------------------------------------------------
+
+    def update(self, text: str, chunk_size: int = 500, overlap: int = 50,
+               strategy: str = DEFAULT_CHUNK_STRATEGY) -> dict:
+        """Re-index this store from a new version of its text, re-embedding only changed chunks."""
+        return self.build_index(text, chunk_size, overlap, strategy, reuse=self)
+
+    def chunk_hashes(self) -> list[str]:
+        """Content hash of every chunk, in chunk order (computed once per build)."""
+        if self._chunk_hashes is None or len(self._chunk_hashes) != len(self.chunks):
+            self._chunk_hashes = [chunk_hash(c) for c in self.chunks]
+        return self._chunk_hashes
+
+    def diff(self, previous: "RAGStore") -> dict:
+        """
+        Chunk-level difference from *previous* by content hash: indexes of
+        chunks only in this store ("added") and only in *previous*
+        ("removed"). Unchanged text contributes to neither, so a comparison
+        can focus on what the new version actually changed.
+        """
+        mine, theirs = self.chunk_hashes(), previous.chunk_hashes()
+        mine_set, theirs_set = set(mine), set(theirs)
+        return {
+            "added": [i for i, h in enumerate(mine) if h not in theirs_set],
+            "removed": [i for i, h in enumerate(theirs) if h not in mine_set],
+            "unchanged": sum(1 for h in mine if h in theirs_set),
+        }
+
+    # ---- ANN evaluation --------------------------------------------------
+
+    def rebuild_index(self, index_type: str) -> dict:
+        """Rebuild the index as *index_type* from the stored vectors (no re-embedding)."""
+        if self.index is None and self.embeddings is None:
+            raise ValueError("rebuild_index needs a built store")
+        t0 = time.perf_counter()
+        vectors = self.vectors()
+        self.index_type = index_type
+        self.index = make_index(vectors, index_type, self.codec)
+        return {"index_type": index_kind(self.index),
+                "index_ms": round((time.perf_counter() - t0) * 1000, 2)}
+
+    def measure_recall(self, queries: list[str], top_k: int = 10,
+                       nprobe: Optional[int] = None,
+                       ef_search: Optional[int] = None) -> dict:
+        """
+        Recall@k of the current index against an exact flat scan of the same
+        embeddings, plus mean search latency of both. Use it to pick
+        nprobe / efSearch for the speed/recall trade-off.
+        """
+        if self.index is None or not queries:
+            return {}
+        faiss = _get_faiss()
+        set_search_params(self.index, nprobe=nprobe, ef_search=ef_search)
+        exact = faiss.IndexFlatIP(self.index.d)
+        exact.add(self.vectors())
+
+        q_emb = embedding_batcher.encode(list(queries))
+        k = min(top_k, len(self.chunks))
+
+        t0 = time.perf_counter()
+        _, ann_ids = self.index.search(q_emb, k)
+        ann_ms = (time.perf_counter() - t0) * 1000
+        t1 = time.perf_counter()
+        _, exact_ids = exact.search(q_emb, k)
+        exact_ms = (time.perf_counter() - t1) * 1000
+
+        overlap = sum(len(set(a) & set(e)) for a, e in zip(ann_ids.tolist(), exact_ids.tolist()))
+        set_search_params(self.index)  # restore defaults
+        return {
+            "index_type": index_kind(self.index),
+            "top_k": k,
+            "n_queries": len(queries),
+            "recall_at_k": round(overlap / (k * len(queries)), 4) if k else 0,
+            "ann_search_ms_per_query": round(ann_ms / len(queries), 4),
+            "flat_search_ms_per_query": round(exact_ms / len(queries), 4),
+        }
 
     # ---- convenience -----------------------------------------------------
 
@@ -187,13 +956,617 @@ class RAGStore:
         return concatenated context string and full timing breakdown.
         """
         build_timings = self.build_index(text, chunk_size, overlap)
-        retrieved, query_timings = self.query(query, top_k)
-        context = "\n\n---\n\n".join(retrieved)
+        return self.context_for_query(query, top_k, build_timings)
+
+    def context_for_query(self, query: str, top_k: int = 10,
+                          build_timings: Optional[dict] = None,
+                          token_budget: Optional[int] = None) -> tuple[str, dict]:
+        """
+        Retrieve top-K chunks from an already-built index and join them.
+
+        With *token_budget*, enough candidates to fill the budget are
+        retrieved instead and packed by :func:`context_packer.pack_chunks`
+        (score order, overlap removed); its stats are merged into the timings.
+
+        *build_timings* (e.g. from :meth:`build_index` or :class:`IndexCache`)
+        are merged into the returned breakdown so ``total_rag_ms`` covers both.
+        """
+        build_timings = build_timings or {}
+        pack_stats: dict = {}
+        if token_budget is None:
+            retrieved, query_timings = self.query(query, top_k)
+            context = "\n\n---\n\n".join(retrieved)
+        else:
+            n_candidates = max(top_k, min(PACK_MAX_CANDIDATES,
+                                          2 * token_budget // self._avg_chunk_tokens()))
+            hits, query_timings = self.search(query, n_candidates)
+            t_pack = time.perf_counter()
+            context, pack_stats = pack_chunks(self.chunks, hits, token_budget)
+            pack_stats["pack_ms"] = round((time.perf_counter() - t_pack) * 1000, 2)
+
+        all_timings = {**build_timings, **query_timings, **pack_stats}
+        all_timings["total_rag_ms"] = round(
+            build_timings.get("total_ms", 0)
+            + query_timings.get("query_embedding_ms", 0)
+            + query_timings.get("retrieval_ms", 0)
+            + pack_stats.get("pack_ms", 0), 2
+        )
+        return context, all_timings
 
-        all_timings = {**build_timings, **query_timings}
+    def context_for_queries(self, queries: dict[str, str], token_budget: int,
+                            build_timings: Optional[dict] = None,
+                            top_k: int = 5) -> tuple[str, dict]:
+        """
+        Pack context for several named queries (e.g. one per section of an
+        output schema) into one *token_budget*.
+
+        All queries are retrieved in one :meth:`search_many` call. Their hits
+        are merged round-robin by rank, duplicates are dropped, and each
+        query may contribute at most an equal share of the chunks that fit
+        the budget, so no one topic crowds out the rest. Timings carry the
+        batch totals plus ``queries``: per-query scores and chunks_selected.
+        """
+        build_timings = build_timings or {}
+        names = list(queries)
+        n_fit = max(len(names), token_budget // self._avg_chunk_tokens())
+        quota = -(-n_fit // len(names)) if names else 0
+        hit_lists, query_timings = self.search_many(
+            [queries[n] for n in names], max(top_k, min(PACK_MAX_CANDIDATES, 2 * quota)))
+        per_query = query_timings.pop("per_query")
+
+        t_merge = time.perf_counter()
+        order: list[int] = []
+        taken: set[int] = set()
+        selected = dict.fromkeys(names, 0)
+        for rank in range(max(map(len, hit_lists), default=0)):
+            for name, hits in zip(names, hit_lists):
+                if rank >= len(hits) or selected[name] >= quota or hits[rank][0] in taken:
+                    continue
+                taken.add(hits[rank][0])
+                order.append(hits[rank][0])
+                selected[name] += 1
+        # pack_chunks fills best score first: scores encode the merged order
+        merged = [(i, float(len(order) - pos)) for pos, i in enumerate(order)]
+        context, pack_stats = pack_chunks(self.chunks, merged, token_budget)
+        pack_stats["pack_ms"] = round((time.perf_counter() - t_merge) * 1000, 2)
+
+        all_timings = {**build_timings, **query_timings, **pack_stats}
+        all_timings["section_quota"] = quota
+        all_timings["queries"] = {name: {**stats, "chunks_selected": selected[name]}
+                                  for name, stats in zip(names, per_query)}
         all_timings["total_rag_ms"] = round(
             build_timings.get("total_ms", 0)
             + query_timings.get("query_embedding_ms", 0)
-            + query_timings.get("retrieval_ms", 0), 2
+            + query_timings.get("retrieval_ms", 0)
+            + pack_stats["pack_ms"], 2
         )
         return context, all_timings
+
+    def _avg_chunk_tokens(self) -> int:
+        """Estimated tokens per chunk, from the first 64 chunks."""
+        return max(1, sum(map(len, self.chunks[:64])) //
+                   max(1, min(64, len(self.chunks))) // CHARS_PER_TOKEN)
+
+    # ---- sizing ----------------------------------------------------------
+
+    def lexical_bytes(self) -> int:
+        return self.lexical.nbytes() if self.lexical is not None else 0
+
+    def vector_bytes(self) -> int:
+        """Bytes spent on vectors: the FAISS index plus the kept embeddings array."""
+        total = index_bytes(self.index)
+        if self.embeddings is not None:
+            total += self.embeddings.nbytes
+        return total
+
+    def bytes_per_chunk(self) -> float:
+        return round(self.vector_bytes() / len(self.chunks), 1) if self.chunks else 0
+
+    def memory_bytes(self) -> int:
+        """Approximate resident size of chunks, embeddings, FAISS and BM25 indexes."""
+        return sum(len(c) for c in self.chunks) + self.vector_bytes() + self.lexical_bytes()
+
+
+def chunk_hash(chunk: str) -> str:
+    """Content hash identifying a chunk across document versions."""
+    return hashlib.blake2b(chunk.encode("utf-8", errors="ignore"), digest_size=16).hexdigest()
+
+
+def _embed_reusing(chunks: list[str], reuse: "RAGStore") -> tuple[np.ndarray, dict]:
+    """
+    Embeddings for *chunks*, copying the vector of every chunk whose content
+    hash *reuse* already holds and encoding only the rest. Vectors of
+    lossy-codec stores without kept embeddings are decoded from the index.
+    """
+    by_hash: dict[str, int] = {}
+    for i, h in enumerate(reuse.chunk_hashes()):
+        by_hash.setdefault(h, i)
+    old_vectors = reuse.vectors()
+    src = np.fromiter((by_hash.get(chunk_hash(c), -1) for c in chunks), dtype="int64",
+                      count=len(chunks))
+    hit = src >= 0
+    missing = np.flatnonzero(~hit)
+
+    embeddings = np.empty((len(chunks), old_vectors.shape[1]), dtype="float32")
+    embeddings[hit] = old_vectors[src[hit]]
+    if len(missing):
+        embeddings[missing] = embedding_batcher.encode([chunks[j] for j in missing])
+    return embeddings, {
+        "chunks_reused": int(hit.sum()),
+        "chunks_embedded": int(len(missing)),
+        "chunks_removed": len(reuse.chunks) - len(np.unique(src[hit])),
+    }
+
+
+# ---------------------------------------------------------------------------
+# 5. Content-addressed index cache
+# ---------------------------------------------------------------------------
+
+def document_key(text: str, chunk_size: int = 500, overlap: int = 50,
+                 model_name: str = EMBEDDING_ID,
+                 strategy: str = DEFAULT_CHUNK_STRATEGY) -> str:
+    """SHA-256 over everything that determines the built index."""
+    h = _document_hasher(chunk_size, overlap, model_name, strategy)
+    h.update(text.encode("utf-8", errors="ignore"))
+    return h.hexdigest()
+
+
+def _document_hasher(chunk_size: int, overlap: int, model_name: str = EMBEDDING_ID,
+                     strategy: str = DEFAULT_CHUNK_STRATEGY):
+    """Hasher pre-seeded with the build parameters; feed it the text next."""
+    h = hashlib.sha256()
+    # "fixed" keeps the original seed so existing on-disk stores stay valid
+    seed = f"{model_name}|{chunk_size}|{overlap}|"
+    if strategy != "fixed":
+        seed += f"{strategy}|"
+    h.update(seed.encode("utf-8"))
+    return h
+
+
+# ---------------------------------------------------------------------------
+# 6. Persistent on-disk store
+# ---------------------------------------------------------------------------
+
+class PersistentIndexStore:
+    """
+    Directory-per-document store of built indexes.
+
+    Layout under *root*::
+
+        <document_key>/meta.json        store settings (index type, codec, ...)
+        <document_key>/chunks.json      chunk text
+        <document_key>/embeddings.npy   float32 (n_chunks × dim)
+        <document_key>/index.faiss      serialised FAISS index
+        <document_key>/lexical.npz      BM25 postings (rebuilt on first use if absent)
+
+    Reloads memory-map both arrays, so reopening a known document costs
+    file-open time only and every gunicorn worker shares the same OS pages.
+
+    The store holds document text, so it is bounded: an entry unused for
+    *ttl_s* is deleted, and every save evicts least recently used entries
+    (directory mtime, refreshed on load) until at most *max_bytes* remain.
+    """
+
+    def __init__(self, root: str, max_bytes: int = 1024 * 1024 * 1024,
+                 ttl_s: float = 7 * 24 * 3600):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.ttl_s = ttl_s
+        os.makedirs(root, exist_ok=True)
+        self.loads = 0
+        self.saves = 0
+        self.expired = 0
+        self.evictions = 0
+        self._prune_lock = threading.Lock()
+        self.prune()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root, key)
+
+    def contains(self, key: str) -> bool:
+        return os.path.exists(os.path.join(self._path(key), "index.faiss"))
+
+    def save(self, key: str, store: "RAGStore") -> bool:
+        """Write *store* under *key*. Writes go to a temp dir and are renamed in."""
+        if store.index is None or self.contains(key):
+            return False
+        faiss = _get_faiss()
+        tmp = tempfile.mkdtemp(prefix=f".{key[:12]}-", dir=self.root)
+        try:
+            with open(os.path.join(tmp, "meta.json"), "w", encoding="utf-8") as f:
+                json.dump(store.settings(), f)
+            with open(os.path.join(tmp, "chunks.json"), "w", encoding="utf-8") as f:
+                json.dump(store.chunks, f)
+            if store.embeddings is not None:
+                np.save(os.path.join(tmp, "embeddings.npy"),
+                        np.asarray(store.embeddings, dtype="float32"))
+            faiss.write_index(store.index, os.path.join(tmp, "index.faiss"))
+            if store.lexical is not None:
+                np.savez(os.path.join(tmp, "lexical.npz"), **store.lexical.to_arrays())
+            os.replace(tmp, self._path(key))
+        except OSError:
+            # Another worker won the rename race, or the disk is read-only
+            shutil.rmtree(tmp, ignore_errors=True)
+            return False
+        self.saves += 1
+        self.prune()
+        return True
+
+    def load(self, key: str) -> Optional["RAGStore"]:
+        """Reopen a stored index memory-mapped, or return None if absent."""
+        path = self._path(key)
+        if not self.contains(key):
+            return None
+        try:
+            if time.time() - os.stat(path).st_mtime > self.ttl_s:
+                shutil.rmtree(path, ignore_errors=True)
+                self.expired += 1
+                return None
+            os.utime(path)   # last use, for LRU eviction
+        except OSError:
+            return None
+        faiss = _get_faiss()
+        try:
+            settings = {}
+            meta_path = os.path.join(path, "meta.json")
+            if os.path.exists(meta_path):   # absent in stores written before it existed
+                with open(meta_path, encoding="utf-8") as f:
+                    settings = json.load(f)
+            with open(os.path.join(path, "chunks.json"), encoding="utf-8") as f:
+                chunks = json.load(f)
+            index_path = os.path.join(path, "index.faiss")
+            try:
+                index = faiss.read_index(
+                    index_path, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY
+                )
+            except RuntimeError:
+                # Older faiss builds cannot mmap every index type
+                index = faiss.read_index(index_path)
+            emb_path = os.path.join(path, "embeddings.npy")
+            embeddings = np.load(emb_path, mmap_mode="r") if os.path.exists(emb_path) else None
+            lexical_path = os.path.join(path, "lexical.npz")
+            lexical = None
+            if os.path.exists(lexical_path):
+                with np.load(lexical_path) as arrays:
+                    lexical = BM25Index.from_arrays(arrays)
+        except (OSError, ValueError, RuntimeError) as e:
+            print(f"Persistent index load failed for {key[:12]}: {e}")
+            return None
+
+        set_search_params(index)
+        store = RAGStore(**settings)
+        store.chunks = chunks
+        store.index = index
+        store.embeddings = embeddings
+        store.lexical = lexical
+        self.loads += 1
+        return store
+
+    def prune(self) -> int:
+        """Delete expired entries, then the least recently used beyond max_bytes; returns bytes kept."""
+        with self._prune_lock:
+            now = time.time()
+            entries = []   # (last_used, bytes, path)
+            try:
+                with os.scandir(self.root) as it:
+                    for entry in it:
+                        if entry.name.startswith(".") or not entry.is_dir():
+                            continue   # in-progress writes
+                        try:
+                            size = sum(f.stat().st_size for f in os.scandir(entry.path))
+                            entries.append((entry.stat().st_mtime, size, entry.path))
+                        except OSError:
+                            continue   # removed by another worker meanwhile
+            except OSError as e:
+                print(f"Persistent RAG store prune failed: {e}")
+                return 0
+            entries.sort()
+            total = sum(size for _, size, _ in entries)
+            for last_used, size, path in entries:
+                expired = now - last_used > self.ttl_s
+                if not expired and total <= self.max_bytes:
+                    break
+                shutil.rmtree(path, ignore_errors=True)
+                total -= size
+                if expired:
+                    self.expired += 1
+                else:
+                    self.evictions += 1
+            return total
+
+    def stats(self) -> dict:
+        return {"root": self.root, "loads": self.loads, "saves": self.saves,
+                "expired": self.expired, "evictions": self.evictions,
+                "max_bytes": self.max_bytes, "ttl_s": self.ttl_s}
+
+
+class IndexCache:
+    """
+    Thread-safe LRU cache of built :class:`RAGStore` objects.
+
+    Stores are keyed by :func:`document_key`, so a follow-up chatbot turn on
+    the same document only pays query-embedding + FAISS search cost.
+    Eviction is bounded both by entry count and by approximate memory.
+    With a *persistent* store, misses are first looked up on disk and
+    freshly built stores are written through. *store_settings* are the
+    :class:`RAGStore` constructor arguments used for every build.
+    Concurrent misses on the same key are single-flight: the first caller
+    builds, later callers wait for it and are served from the cache.
+    """
+
+    def __init__(self, max_entries: int = 16, max_bytes: int = 256 * 1024 * 1024,
+                 persistent: Optional[PersistentIndexStore] = None,
+                 store_settings: Optional[dict] = None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.persistent = persistent
+        self.store_settings = dict(store_settings or {})
+        self._entries: "OrderedDict[str, RAGStore]" = OrderedDict()
+        self._sizes: dict = {}
+        self._lock = threading.Lock()
+        self._inflight: dict = {}  # key -> threading.Event set when its build ends
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.inflight_waits = 0
+
+    def get_or_build(self, text: str, chunk_size: int = 500, overlap: int = 50,
+                     strategy: str = DEFAULT_CHUNK_STRATEGY,
+                     key: Optional[str] = None,
+                     previous_key: Optional[str] = None) -> tuple["RAGStore", dict]:
+        """
+        Return a built store for *text*, building and caching it on a miss.
+
+        The returned timings mirror :meth:`RAGStore.build_index`; on a hit the
+        build stages are reported as 0 ms, ``cache_hit`` is True and
+        ``cache_tier`` says whether it came from "memory" or "disk". A
+        caller that already knows the document's *key* (e.g. from the
+        document store) skips hashing the text; it must pass the *strategy*
+        the key was made with. On a miss, *previous_key* names the store of
+        an earlier version of the document: its vectors are reused for
+        unchanged chunks (the earlier store is not modified). A caller that
+        waited for another thread's build of the same key reports
+        ``inflight_wait`` True.
+        """
+        key = key or document_key(text, chunk_size, overlap, strategy=strategy)
+
+        t0 = time.perf_counter()
+        waited = False
+        while True:
+            with self._lock:
+                store = self._entries.get(key)
+                if store is not None:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    break
+                pending = self._inflight.get(key)
+                if pending is None:
+                    pending = self._inflight[key] = threading.Event()
+                    break
+                self.inflight_waits += 1
+            # Another thread is building this key: wait, then re-check. If
+            # its build failed (or was too large to cache) the next pass
+            # becomes the builder.
+            pending.wait()
+            waited = True
+
+        if store is not None:
+            lookup_ms = round((time.perf_counter() - t0) * 1000, 2)
+            timings = {
+                "chunk_ms": 0, "embedding_ms": 0, "index_ms": 0,
+                "n_chunks": len(store.chunks),
+                "embedding_dim": store.index.d if store.index is not None else 0,
+                "bytes_per_chunk": store.bytes_per_chunk(),
+                "cache_lookup_ms": lookup_ms,
+                "total_ms": lookup_ms,
+                "cache_hit": True,
+                "cache_tier": "memory",
+            }
+            if waited:
+                timings["inflight_wait"] = True
+            return store, timings
+
+        try:
+            return self._load_or_build(key, text, chunk_size, overlap, strategy, previous_key)
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            pending.set()
+
+    def _load_or_build(self, key: str, text: str, chunk_size: int, overlap: int,
+                       strategy: str, previous_key: Optional[str]) -> tuple["RAGStore", dict]:
+        """Miss path of :meth:`get_or_build`: disk tier, then a build (caller holds the in-flight slot)."""
+        if self.persistent is not None:
+            t1 = time.perf_counter()
+            store = self.persistent.load(key)
+            if store is not None:
+                load_ms = round((time.perf_counter() - t1) * 1000, 2)
+                with self._lock:
+                    self.disk_hits += 1
+                    self._insert(key, store)
+                return store, {
+                    "chunk_ms": 0, "embedding_ms": 0, "index_ms": 0,
+                    "n_chunks": len(store.chunks),
+                    "embedding_dim": store.index.d,
+                    "bytes_per_chunk": store.bytes_per_chunk(),
+                    "disk_load_ms": load_ms,
+                    "total_ms": load_ms,
+                    "cache_hit": True,
+                    "cache_tier": "disk",
+                }
+
+        # Build outside the lock so concurrent misses on other documents
+        # do not serialise behind one large embedding job.
+        previous = self.peek(previous_key) if previous_key else None
+        store = RAGStore(**self.store_settings)
+        timings = store.build_index(text, chunk_size, overlap, strategy, reuse=previous)
+        timings["cache_hit"] = False
+        if previous_key:
+            timings["incremental"] = previous is not None
+
+        if self.persistent is not None:
+            t2 = time.perf_counter()
+            self.persistent.save(key, store)
+            timings["disk_save_ms"] = round((time.perf_counter() - t2) * 1000, 2)
+
+        with self._lock:
+            self.misses += 1
+            self._insert(key, store)
+        return store, timings
+
+    def build_from_stream(self, pieces: Iterable[str], chunk_size: int = 500, overlap: int = 50,
+                          strategy: str = DEFAULT_CHUNK_STRATEGY) -> tuple["RAGStore", dict, str]:
+        """
+        Build a store from streamed pieces and cache it under the key of
+        their concatenation, so a later :meth:`get_or_build` on the full text
+        is a hit. Returns (store, timings, key).
+        """
+        hasher = _document_hasher(chunk_size, overlap, strategy=strategy)
+
+        def hashed(stream):
+            for piece in stream:
+                hasher.update(piece.encode("utf-8", errors="ignore"))
+                yield piece
+
+        store = RAGStore(**self.store_settings)
+        timings = store.build_index_stream(hashed(pieces), chunk_size, overlap,
+                                           strategy=strategy)
+        key = hasher.hexdigest()
+        timings["cache_hit"] = False
+
+        if self.persistent is not None:
+            self.persistent.save(key, store)
+        with self._lock:
+            self.misses += 1
+            self._insert(key, store)
+        return store, timings, key
+
+    def peek(self, key: str) -> Optional["RAGStore"]:
+        """The cached store for *key* (memory, then disk) without building or counting a lookup."""
+        with self._lock:
+            store = self._entries.get(key)
+        if store is None and self.persistent is not None:
+            store = self.persistent.load(key)
+        return store
+
+    def _insert(self, key: str, store: "RAGStore"):
+        """Add *store* as most-recently-used and evict (lock held)."""
+        size = store.memory_bytes()
+        if size <= self.max_bytes:
+            self._entries[key] = store
+            self._entries.move_to_end(key)
+            self._sizes[key] = size
+            self._evict()
+
+    def _evict(self):
+        """Drop least-recently-used entries until both bounds hold (lock held)."""
+        while self._entries and (
+            len(self._entries) > self.max_entries
+            or sum(self._sizes.values()) > self.max_bytes
+        ):
+            key, _ = self._entries.popitem(last=False)
+            self._sizes.pop(key, None)
+            self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._sizes.clear()
+
+    def stats(self) -> dict:
+        """Hit/miss counters and current occupancy."""
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            hits = self.hits + self.disk_hits
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "inflight_waits": self.inflight_waits,
+                "hit_rate": round(hits / lookups, 4) if lookups else 0,
+                "entries": len(self._entries),
+                "bytes": sum(self._sizes.values()),
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "persistent": self.persistent.stats() if self.persistent else None,
+            }
+
+
+def _persistent_store_from_env() -> Optional[PersistentIndexStore]:
+    """RAG_STORE_DIR enables the disk tier; set it to an empty string to disable."""
+    root = os.getenv("RAG_STORE_DIR", os.path.join(".cache", "rag_store"))
+    if not root:
+        return None
+    try:
+        return PersistentIndexStore(
+            root,
+            max_bytes=int(os.getenv("RAG_STORE_MAX_MB", "1024")) * 1024 * 1024,
+            ttl_s=float(os.getenv("RAG_STORE_TTL_S", str(7 * 24 * 3600))),
+        )
+    except OSError as e:
+        print(f"Persistent RAG store disabled ({root}): {e}")
+        return None
+
+
+index_cache = IndexCache(
+    max_entries=int(os.getenv("RAG_CACHE_MAX_ENTRIES", "16")),
+    max_bytes=int(os.getenv("RAG_CACHE_MAX_MB", "256")) * 1024 * 1024,
+    persistent=_persistent_store_from_env(),
+)
+
+
+# ---------------------------------------------------------------------------
+# 7. Cross-document chunk alignment
+# ---------------------------------------------------------------------------
+ALIGN_MIN_SCORE = float(os.getenv("RAG_ALIGN_MIN_SCORE", "0.6"))
+
+
+def align_stores(store_a: "RAGStore", store_b: "RAGStore",
+                 min_score: float = ALIGN_MIN_SCORE) -> tuple[dict, dict]:
+    """
+    Pair chunks of two indexed documents by embedding similarity.
+
+    Each chunk is matched to its nearest neighbour in the other document;
+    mutual nearest neighbours scoring at least *min_score* become aligned
+    pairs (e.g. termination clause ↔ termination clause). Every other chunk
+    is unmatched — including one whose best match clears *min_score* but
+    was paired with a closer chunk (two termination clauses against one),
+    so no chunk drops out of the comparison.
+
+    Returns
+    -------
+    (alignment, timings)
+        alignment : dict — pairs [(i, j, score)] ordered by i,
+                           only_a [i], only_b [j]
+        timings   : dict — alignment_ms, n_pairs, n_only_a, n_only_b
+    """
+    t0 = time.perf_counter()
+    pairs: list[tuple[int, int, float]] = []
+    only_a: list[int] = list(range(len(store_a.chunks)))
+    only_b: list[int] = list(range(len(store_b.chunks)))
+
+    if store_a.chunks and store_b.chunks:
+        emb_a = store_a.vectors()
+        emb_b = store_b.vectors()
+        # One nearest-neighbour search per direction through the existing indexes
+        score_ab, best_ab = store_b.index.search(emb_a, 1)
+        score_ba, best_ba = store_a.index.search(emb_b, 1)
+        best_ab, score_ab = best_ab[:, 0], score_ab[:, 0]
+        best_ba, score_ba = best_ba[:, 0], score_ba[:, 0]
+
+        for i, j in enumerate(best_ab.tolist()):
+            if j >= 0 and best_ba[j] == i and score_ab[i] >= min_score:
+                pairs.append((i, j, round(float(score_ab[i]), 4)))
+        paired_a = {i for i, _, _ in pairs}
+        paired_b = {j for _, j, _ in pairs}
+        only_a = [i for i in only_a if i not in paired_a]
+        only_b = [j for j in only_b if j not in paired_b]
+
+    return {"pairs": pairs, "only_a": only_a, "only_b": only_b}, {
+        "alignment_ms": round((time.perf_counter() - t0) * 1000, 2),
+        "n_pairs": len(pairs),
+        "n_only_a": len(only_a),
+        "n_only_b": len(only_b),
+    }
@@ -0,0 +1,202 @@
+"""
+Embedding backend benchmark and parity check.
+
+Loads each embedding backend (embedding_backends.py) in its own subprocess,
+so memory numbers are not polluted by the previous one, and measures:
+  - load_ms / rss_mb       : model load time and resident memory after load
+  - chunks_per_s           : document-chunk encode throughput (batched)
+  - query latency          : single-query encode p50/p95/p99
+Then compares every backend against the reference (default torch):
+  - cosine_mean / min      : per-text agreement of the embedding vectors
+  - top1_agreement         : share of queries whose best chunk is unchanged
+  - recall_at_k            : overlap of the top-k chunk sets per query
+
+    python scripts/benchmark_embeddings.py --backends torch torch-int8 onnx-int8 --threads 2
+    python scripts/benchmark_embeddings.py --doc-chars 500000 --output emb_bench.json
+
+The ONNX backends need ``pip install "sentence-transformers[onnx]"``; a
+backend that falls back to torch is reported as such and not compared.
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmark_rag import QUERIES, generate_document, percentiles  # noqa: E402
+
+
+def _rss_mb() -> float:
+    """Current resident set size in MB (peak RSS where /proc is unavailable)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return round(int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20, 1)
+    except (OSError, ValueError, IndexError):
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return round(peak / (2**20 if sys.platform == "darwin" else 2**10), 1)
+
+
+# ---------------------------------------------------------------------------
+# Worker (one backend per process)
+# ---------------------------------------------------------------------------
+
+def run_worker(args) -> None:
+    import numpy as np
+    from embedding_backends import load_backend
+    from rag_engine import MODEL_NAME, chunk_text
+
+    doc = generate_document(args.doc_chars, seed=7)
+    chunks = chunk_text(doc)
+    queries = (QUERIES * (args.queries // len(QUERIES) + 1))[:args.queries]
+
+    rss_before = _rss_mb()
+    t0 = time.perf_counter()
+    model, loaded = load_backend(args.worker, MODEL_NAME, args.threads)
+    load_ms = (time.perf_counter() - t0) * 1000
+    rss_loaded = _rss_mb()
+
+    def encode(texts):
+        return np.asarray(model.encode(texts, normalize_embeddings=True, show_progress_bar=False,
+                                       batch_size=args.batch_size), dtype="float32")
+
+    encode(chunks[:args.batch_size])   # first-inference cost is warm-up's job, not measured here
+
+    best_chunk_s = float("inf")
+    chunk_embs = None
+    for _ in range(args.repeats):
+        t1 = time.perf_counter()
+        chunk_embs = encode(chunks)
+        best_chunk_s = min(best_chunk_s, time.perf_counter() - t1)
+
+    query_ms = []
+    query_embs = []
+    for q in queries:
+        t2 = time.perf_counter()
+        query_embs.append(encode([q])[0])
+        query_ms.append((time.perf_counter() - t2) * 1000)
+
+    np.savez(args.emb_out, chunks=chunk_embs, queries=np.stack(query_embs))
+    print(json.dumps({
+        "backend": args.worker,
+        "loaded": loaded,
+        "threads": args.threads,
+        "load_ms": round(load_ms, 2),
+        "rss_mb": rss_loaded,
+        "model_rss_mb": round(rss_loaded - rss_before, 1),
+        "peak_rss_mb": _rss_mb(),
+        "n_chunks": len(chunks),
+        "chunk_encode_ms": round(best_chunk_s * 1000, 2),
+        "chunks_per_s": round(len(chunks) / best_chunk_s, 1) if best_chunk_s else None,
+        "query": percentiles(query_ms),
+    }))
+
+
+# ---------------------------------------------------------------------------
+# Parity
+# ---------------------------------------------------------------------------
+
+def parity(ref_path: str, cand_path: str, top_k: int) -> dict:
+    import numpy as np
+    ref, cand = np.load(ref_path), np.load(cand_path)
+    cos = np.concatenate([
+        np.sum(ref["chunks"] * cand["chunks"], axis=1),
+        np.sum(ref["queries"] * cand["queries"], axis=1),
+    ])
+    k = min(top_k, ref["chunks"].shape[0])
+    ref_top = np.argsort(-(ref["queries"] @ ref["chunks"].T), axis=1)[:, :k]
+    cand_top = np.argsort(-(cand["queries"] @ cand["chunks"].T), axis=1)[:, :k]
+    recall = [len(set(a) & set(b)) / k for a, b in zip(ref_top.tolist(), cand_top.tolist())]
+    return {
+        "cosine_mean": round(float(cos.mean()), 5),
+        "cosine_min": round(float(cos.min()), 5),
+        "top1_agreement": round(float(np.mean(ref_top[:, 0] == cand_top[:, 0])), 4),
+        f"recall_at_{k}": round(float(np.mean(recall)), 4),
+    }
+
+
+# ---------------------------------------------------------------------------
+# Driver
+# ---------------------------------------------------------------------------
+
+def main(argv=None) -> dict:
+    parser = argparse.ArgumentParser(description="DocBrief embedding backend benchmark")
+    parser.add_argument("--backends", nargs="+", default=["torch", "torch-int8", "onnx", "onnx-int8"])
+    parser.add_argument("--reference", default="torch", help="backend the others are compared against")
+    parser.add_argument("--threads", type=int, default=int(os.getenv("EMBED_THREADS", "0")),
+                        help="intra-op threads per backend (0 = library default)")
+    parser.add_argument("--doc-chars", type=int, default=200_000)
+    parser.add_argument("--queries", type=int, default=60)
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--output", default="embedding_bench.json")
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    parser.add_argument("--emb-out", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.worker:
+        run_worker(args)
+        return {}
+
+    backends = list(dict.fromkeys([args.reference] + args.backends))
+    report = {
+        "meta": {
+            "timestamp": time.time(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "args": vars(args),
+        },
+        "backends": {},
+    }
+
+    print("======================================================")
+    print("   DOCBRIEF EMBEDDING BACKEND BENCHMARK")
+    print("======================================================\n")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = {}
+        for backend in backends:
+            path = os.path.join(tmp, f"{backend}.npz")
+            cmd = [sys.executable, os.path.abspath(__file__), "--worker", backend, "--emb-out", path,
+                   "--threads", str(args.threads), "--doc-chars", str(args.doc_chars),
+                   "--queries", str(args.queries), "--batch-size", str(args.batch_size),
+                   "--repeats", str(args.repeats)]
+            print(f"[{backend}] ...", end="", flush=True)
+            proc = subprocess.run(cmd, capture_output=True, text=True)
+            if proc.returncode != 0:
+                print(f" failed:\n{proc.stderr.strip()[-2000:]}")
+                report["backends"][backend] = {"error": proc.stderr.strip()[-2000:]}
+                continue
+            stats = json.loads(proc.stdout.strip().splitlines()[-1])
+            report["backends"][backend] = stats
+            if stats["loaded"] == backend:
+                paths[backend] = path
+            print(f" load={stats['load_ms']}ms rss={stats['rss_mb']}MB "
+                  f"{stats['chunks_per_s']} chunks/s query p50={stats['query'].get('p50_ms')}ms"
+                  + ("" if stats["loaded"] == backend else f" (fell back to {stats['loaded']})"))
+
+        if args.reference in paths:
+            for backend, path in paths.items():
+                if backend == args.reference:
+                    continue
+                report["backends"][backend]["parity"] = p = parity(paths[args.reference], path, args.top_k)
+                print(f"[{backend}] vs {args.reference}: " + "  ".join(f"{k}={v}" for k, v in p.items()))
+        else:
+            print(f"Reference backend {args.reference!r} did not run; parity skipped.")
+
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nResults written to {args.output}")
+    return report
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,537 @@
+"""
+Offline RAG benchmark / load test.
+
+Measures the RAG hot path without any network access:
+  - chunk_text            : chunking throughput and chunk shape per document
+                            size, for each chunk strategy (fixed / structured)
+  - RAGStore.build_index  : chunk + embed + index latency
+  - RAGStore.query        : per-query latency (p50/p95/p99)
+  - ANN tiers             : recall@10 and search latency of HNSW / IVF vs flat
+  - vector codecs         : bytes per chunk and recall@10 of float16 / sq8 /
+                            pq storage vs exact float32
+  - retrieval modes       : recall@k of dense, BM25 and hybrid retrieval on
+                            exact-term queries (amounts, dates), and the
+                            smallest k at which each matches dense@10
+  - analysis retrieval    : single mixed query vs one query per schema
+                            section, at the same token budget: clause kinds
+                            and deadline dates that reach the context
+  - /analyze_document and /chatbot under concurrent load, via the Flask
+    test client with a stub Groq client (fixed, configurable latency)
+  - map-reduce vs RAG analysis of very long documents: per-stage latency,
+    sections, total prompt tokens and share of the document sent to the LLM
+
+Results are written as JSON so runs can be diffed between releases:
+
+    python scripts/benchmark_rag.py --output bench.json
+    python scripts/benchmark_rag.py --sizes 1000 100000 --concurrency 8 --stub-embedder
+
+--stub-embedder swaps MiniLM for a deterministic hash embedder, which
+isolates chunking/FAISS/Flask overhead and lets the suite run on machines
+without the model cached.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import platform
+import random
+import re
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Add parent directory to path so we can import app modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+DEFAULT_SIZES = [1_000, 10_000, 100_000, 1_000_000, 5_000_000]
+DEFAULT_ENDPOINT_SIZES = [1_000, 10_000, 100_000]
+
+STUB_ANALYSIS = {
+    "summary": "Benchmark stub summary.",
+    "key_clauses": ["Termination: 30 days written notice."],
+    "obligations": ["Maintain confidentiality."],
+    "actions": [{"title": "Renewal", "date": "2026-12-31", "description": "Renewal deadline."}],
+}
+
+CLAUSE_TEMPLATES = [
+    "{n}. TERMINATION. Either party may terminate this Agreement upon {d} days' written notice to the other party.",
+    "{n}. LIABILITY. In no event shall the aggregate liability of {p} exceed ${amt:,} in any calendar year.",
+    "{n}. CONFIDENTIALITY. The Receiving Party shall hold all Confidential Information of {p} in strict confidence for {y} years.",
+    "{n}. PAYMENT. Invoices are payable within {d} days; late amounts accrue interest at {r}% per month.",
+    "{n}. GOVERNING LAW. This Agreement is governed by the laws of the State of {s}.",
+    "{n}. INDEMNIFICATION. {p} shall indemnify and hold harmless the other party against third-party claims.",
+    "{n}. DEADLINE. The deliverables described in Schedule {sch} are due on 20{yy}-{mm:02d}-{dd:02d}.",
+    "{n}. DISPUTE RESOLUTION. Disputes shall be resolved by binding arbitration in {s} under AAA rules.",
+]
+PARTIES = ["the Disclosing Party", "the Receiving Party", "the Supplier", "the Customer", "the Licensor"]
+STATES = ["California", "New York", "Delaware", "Texas", "Washington"]
+
+
+# ---------------------------------------------------------------------------
+# Fixtures
+# ---------------------------------------------------------------------------
+
+def generate_document(length: int, seed: int = 0) -> str:
+    """Varied pseudo-contract text of exactly *length* characters."""
+    rng = random.Random(seed)
+    parts: list[str] = []
+    size = 0
+    n = 1
+    while size < length:
+        if n % 12 == 1:
+            heading = f"\n\nARTICLE {n // 12 + 1}. GENERAL PROVISIONS\n\n"
+            parts.append(heading)
+            size += len(heading)
+        clause = rng.choice(CLAUSE_TEMPLATES).format(
+            n=n, d=rng.choice([15, 30, 45, 60, 90]), p=rng.choice(PARTIES),
+            amt=rng.randint(10, 5000) * 1000, y=rng.randint(1, 10), r=rng.choice([1, 1.5, 2]),
+            s=rng.choice(STATES), sch=rng.choice("ABCDE"), yy=rng.randint(25, 30),
+            mm=rng.randint(1, 12), dd=rng.randint(1, 28),
+        ) + " "
+        parts.append(clause)
+        size += len(clause)
+        n += 1
+    return "".join(parts)[:length]
+
+
+QUERIES = [
+    "termination notice period",
+    "limitation of liability cap",
+    "confidentiality obligations duration",
+    "payment terms and late interest",
+    "governing law and jurisdiction",
+    "deadlines for deliverables",
+]
+
+
+class _StubCompletions:
+    """Mimics groq.Groq().chat.completions with a fixed latency."""
+
+    def __init__(self, latency_ms: float):
+        self.latency_ms = latency_ms
+
+    def create(self, messages, model=None, stream=False, **kwargs):
+        time.sleep(self.latency_ms / 1000)
+        is_json = "JSON" in messages[0]["content"]
+        content = json.dumps(STUB_ANALYSIS) if is_json else "Stub answer based on the retrieved context."
+        if stream:
+            def chunks():
+                for word in content.split(" "):
+                    yield _ns(choices=[_ns(delta=_ns(content=word + " "))])
+            return chunks()
+        return _ns(choices=[_ns(message=_ns(content=content))])
+
+
+class _ns:
+    def __init__(self, **kw):
+        self.__dict__.update(kw)
+
+
+class StubGroqClient:
+    def __init__(self, latency_ms: float):
+        self.chat = _ns(completions=_StubCompletions(latency_ms))
+
+
+class HashEmbedder:
+    """Deterministic 384-d unit vectors seeded by a text hash (no model)."""
+
+    def encode(self, texts, normalize_embeddings=True, show_progress_bar=False, **kwargs):
+        import numpy as np
+        out = np.empty((len(texts), 384), dtype="float32")
+        for i, t in enumerate(texts):
+            seed = int.from_bytes(hashlib.blake2b(t.encode("utf-8"), digest_size=8).digest(), "little")
+            v = np.random.default_rng(seed).standard_normal(384).astype("float32")
+            out[i] = v / np.linalg.norm(v)
+        return out
+
+
+# ---------------------------------------------------------------------------
+# Measurement helpers
+# ---------------------------------------------------------------------------
+
+def percentiles(samples_ms: list[float]) -> dict:
+    """p50/p95/p99 (nearest-rank), mean, min, max of *samples_ms*."""
+    if not samples_ms:
+        return {}
+    s = sorted(samples_ms)
+
+    def rank(p):
+        return s[min(len(s) - 1, max(0, int(round(p / 100 * len(s) + 0.5)) - 1))]
+
+    return {
+        "n": len(s),
+        "p50_ms": round(rank(50), 3),
+        "p95_ms": round(rank(95), 3),
+        "p99_ms": round(rank(99), 3),
+        "mean_ms": round(statistics.fmean(s), 3),
+        "min_ms": round(s[0], 3),
+        "max_ms": round(s[-1], 3),
+    }
+
+
+def timed(fn, *args, **kwargs) -> tuple[float, object]:
+    t0 = time.perf_counter()
+    out = fn(*args, **kwargs)
+    return (time.perf_counter() - t0) * 1000, out
+
+
+# ---------------------------------------------------------------------------
+# Benchmarks
+# ---------------------------------------------------------------------------
+
+def bench_chunking(doc: str, repeats: int, strategy: str = "fixed") -> dict:
+    from rag_engine import chunk_text
+
+    samples = []
+    chunks = []
+    for _ in range(repeats):
+        ms, chunks = timed(chunk_text, doc, strategy=strategy)
+        samples.append(ms)
+    stats = percentiles(samples)
+    stats["n_chunks"] = len(chunks)
+    stats["avg_chunk_chars"] = round(sum(map(len, chunks)) / len(chunks), 1) if chunks else 0
+    # Share of chunks that stop mid-sentence (a proxy for split clauses)
+    stats["mid_sentence_cut_ratio"] = round(
+        sum(1 for c in chunks if c[-1] not in ".!?;:)\"'") / len(chunks), 3) if chunks else 0
+    stats["mb_per_s"] = round(len(doc) / 1e6 / (stats["p50_ms"] / 1000), 2) if stats["p50_ms"] else None
+    return stats
+
+
+def bench_build_and_query(doc: str, n_queries: int,
+                          strategy: str = "fixed") -> tuple[object, dict]:
+    from rag_engine import RAGStore
+
+    store = RAGStore()
+    wall_ms, build_timings = timed(store.build_index, doc, strategy=strategy)
+    query_samples = []
+    for i in range(n_queries):
+        ms, _ = timed(store.query, QUERIES[i % len(QUERIES)], 10)
+        query_samples.append(ms)
+    return store, {
+        "build": {"wall_ms": round(wall_ms, 3), **{k: v for k, v in build_timings.items()
+                                                   if not isinstance(v, (dict, list))}},
+        "query": percentiles(query_samples),
+    }
+
+
+def bench_ann(store, index_types: list[str], top_k: int = 10) -> dict:
+    """Rebuild *store* as each ANN type and measure recall@k against flat."""
+    queries = QUERIES * 5
+    out = {}
+    for index_type in index_types:
+        if len(store.chunks) < 2 * top_k:
+            break
+        build = store.rebuild_index(index_type)
+        out[index_type] = {**build, **store.measure_recall(queries, top_k)}
+    return out
+
+
+def bench_codecs(store, codecs: list[str], top_k: int = 10) -> dict:
+    """Re-encode *store*'s vectors with each codec; bytes/chunk and recall@k vs float32 flat."""
+    from rag_engine import embedding_batcher, index_bytes, index_codec, make_index
+
+    vectors = store.vectors()
+    if len(vectors) < 2 * top_k:
+        return {}
+    q_emb = embedding_batcher.encode(QUERIES * 5)
+    _, exact_ids = make_index(vectors, "flat", "float32").search(q_emb, top_k)
+    out = {}
+    for codec in codecs:
+        build_ms, index = timed(make_index, vectors, "flat", codec)
+        search_ms, (_, ids) = timed(index.search, q_emb, top_k)
+        overlap = sum(len(set(a) & set(e)) for a, e in zip(ids.tolist(), exact_ids.tolist()))
+        out[codec] = {
+            "vector_codec": index_codec(index),
+            "index_ms": round(build_ms, 2),
+            "bytes_per_chunk": round(index_bytes(index) / len(vectors), 1),
+            "recall_at_k": round(overlap / (top_k * len(q_emb)), 4),
+            "search_ms_per_query": round(search_ms / len(q_emb), 4),
+        }
+    return out
+
+
+def exact_term_queries(doc: str, n: int = 40) -> list[tuple[str, str]]:
+    """(query, term) pairs asking for a specific amount or date from *doc*."""
+    amounts = list(dict.fromkeys(re.findall(r"\$\d[\d,]*\d", doc)))[:n // 2]
+    dates = list(dict.fromkeys(re.findall(r"20\d\d-\d\d-\d\d", doc)))[:n - len(amounts)]
+    return ([(f"liability cap of {a}", a) for a in amounts]
+            + [(f"deliverables due on {d}", d) for d in dates])
+
+
+def bench_retrieval_modes(store, doc: str, top_ks=(1, 3, 5, 10)) -> dict:
+    """Recall@k (query's term present in a retrieved chunk) per retrieval mode."""
+    pairs = exact_term_queries(doc)
+    if not pairs or len(store.chunks) < 2 * max(top_ks):
+        return {}
+    k_max = max(top_ks)
+    out = {}
+    for mode in ("dense", "bm25", "hybrid"):
+        ranks, samples = [], []
+        for query, term in pairs:
+            if mode == "bm25":
+                ms, hits = timed(store.lexical_index().search, query, k_max)
+            else:
+                ms, (hits, _) = timed(store.search, query, k_max, mode)
+            samples.append(ms)
+            ranks.append(next((r for r, (i, _) in enumerate(hits, 1) if term in store.chunks[i]), None))
+        recall = {k: round(sum(1 for r in ranks if r and r <= k) / len(pairs), 4) for k in top_ks}
+        out[mode] = {f"recall_at_{k}": v for k, v in recall.items()}
+        out[mode]["search"] = percentiles(samples)
+        out[mode]["_recall"] = recall
+    target = out["dense"]["_recall"][k_max]
+    for mode in out:
+        recall = out[mode].pop("_recall")
+        out[mode][f"k_to_match_dense_at_{k_max}"] = next((k for k in top_ks if recall[k] >= target), None)
+    out["n_queries"] = len(pairs)
+    return out
+
+
+CLAUSE_KINDS = [re.match(r"\{n\}\. ([A-Z ]+)\.", t).group(1) for t in CLAUSE_TEMPLATES]
+
+
+def bench_analysis_retrieval(store, token_budget: int = 3000) -> dict:
+    """Coverage and cost of the analysis context: one mixed query vs per-section queries."""
+    from app import ANALYSIS_QUERIES, ANALYSIS_QUERY
+
+    runs = {
+        "single": lambda: store.context_for_query(ANALYSIS_QUERY, 10, token_budget=token_budget),
+        "multi": lambda: store.context_for_queries(ANALYSIS_QUERIES, token_budget),
+    }
+    out = {}
+    for mode, run in runs.items():
+        ms, (context, timings) = timed(run)
+        out[mode] = {
+            "wall_ms": round(ms, 2),
+            "context_tokens": timings.get("context_tokens"),
+            "chunks_packed": timings.get("chunks_packed"),
+            "clause_kinds_covered": sum(kind in context for kind in CLAUSE_KINDS),
+            "dates_covered": len(set(re.findall(r"20\d\d-\d\d-\d\d", context))),
+            "query_embedding_ms": timings.get("query_embedding_ms"),
+            "retrieval_ms": timings.get("retrieval_ms"),
+        }
+    out["clause_kinds"] = len(CLAUSE_KINDS)
+    return out
+
+
+def revise_document(doc: str, fraction: float = 0.05, seed: int = 0) -> str:
+    """*doc* with about *fraction* of its sentences reworded, deleted or followed by a new one."""
+    rng = random.Random(seed)
+    sentences = doc.split(". ")
+    out = []
+    for sentence in sentences:
+        if rng.random() >= fraction:
+            out.append(sentence)
+            continue
+        edit = rng.choice(("reword", "delete", "insert"))
+        if edit == "reword":
+            out.append(sentence.replace(" the ", " such ", 1) + " as amended")
+        elif edit == "insert":
+            out += [sentence, "The parties further agree to the amendment set out in this revision"]
+    return ". ".join(out)
+
+
+def bench_incremental(doc: str, strategies: list[str], fraction: float = 0.05) -> dict:
+    """Re-index a ~*fraction*-edited revision reusing the original's vectors vs. from scratch."""
+    from rag_engine import RAGStore
+    revised = revise_document(doc, fraction)
+    out = {"edit_fraction": fraction}
+    for strategy in strategies:
+        original = RAGStore()
+        original.build_index(doc, strategy=strategy)
+        full_ms, full = timed(RAGStore().build_index, revised, strategy=strategy)
+        inc_ms, inc = timed(original.update, revised, strategy=strategy)
+        out[strategy] = {
+            "n_chunks": inc["n_chunks"],
+            "chunks_reused": inc.get("chunks_reused", 0),
+            "chunks_embedded": inc.get("chunks_embedded", 0),
+            "chunks_removed": inc.get("chunks_removed", 0),
+            "reuse_ratio": round(inc.get("chunks_reused", 0) / max(1, inc["n_chunks"]), 4),
+            "full_embedding_ms": full["embedding_ms"],
+            "incremental_embedding_ms": inc["embedding_ms"],
+            "full_wall_ms": round(full_ms, 2),
+            "incremental_wall_ms": round(inc_ms, 2),
+        }
+    return out
+
+
+def bench_endpoint(client, path: str, bodies: list[dict], concurrency: int) -> dict:
+    """Fire *bodies* at *path* with *concurrency* workers; latency + throughput."""
+    def one(body):
+        t0 = time.perf_counter()
+        resp = client.post(path, json=body)
+        _ = resp.get_data()  # drain streamed responses
+        return (time.perf_counter() - t0) * 1000, resp.status_code
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(one, bodies))
+    wall_s = time.perf_counter() - t0
+
+    stats = percentiles([ms for ms, _ in results])
+    stats["errors"] = sum(1 for _, code in results if code >= 400)
+    stats["concurrency"] = concurrency
+    stats["throughput_rps"] = round(len(results) / wall_s, 2) if wall_s else None
+    return stats
+
+
+def bench_map_reduce(client, doc: str) -> dict:
+    """One /analyze_document per pipeline on *doc*; stage latencies and token totals."""
+    out = {}
+    for pipeline in ("rag", "map_reduce"):
+        ms, resp = timed(client.post, "/analyze_document",
+                         json={"text": doc, "pipeline": pipeline, "no_cache": True})
+        m = resp.get_json().get("_metrics", {})
+        out[pipeline] = {
+            "wall_ms": round(ms, 2),
+            "status": resp.status_code,
+            "prompt_tokens": m.get("prompt_tokens"),
+            "document_share": round(m.get("input_chars", 0) / len(doc), 4) if doc else 0,
+            **{k: m.get(k) for k in ("n_sections", "section_ms", "map_ms", "merge_ms", "reduce_ms",
+                                     "completion_tokens", "sections_failed") if k in m},
+        }
+    return out
+
+
+# ---------------------------------------------------------------------------
+# Driver
+# ---------------------------------------------------------------------------
+
+def main(argv=None) -> dict:
+    parser = argparse.ArgumentParser(description="Offline DocBrief RAG benchmark")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES,
+                        help="document sizes (characters) for chunk/build/query benchmarks")
+    parser.add_argument("--endpoint-sizes", type=int, nargs="+", default=DEFAULT_ENDPOINT_SIZES,
+                        help="document sizes (characters) for the endpoint load test")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=32, help="requests per endpoint per size")
+    parser.add_argument("--queries", type=int, default=50, help="queries per document")
+    parser.add_argument("--chunk-repeats", type=int, default=5)
+    parser.add_argument("--llm-latency-ms", type=float, default=0.0,
+                        help="simulated Groq latency for the stub client")
+    parser.add_argument("--pipeline-mode", default="rag",
+                        help="ANALYSIS_PIPELINE_MODE used for /analyze_document")
+    parser.add_argument("--stub-embedder", action="store_true",
+                        help="use a deterministic hash embedder instead of MiniLM")
+    parser.add_argument("--ann-types", nargs="*", default=["hnsw", "ivf"],
+                        help="ANN index types to compare against flat (recall@10, search latency)")
+    parser.add_argument("--vector-codecs", nargs="*", default=["float32", "float16", "sq8", "pq"],
+                        help="vector storage codecs to compare (bytes/chunk, recall@10 vs float32)")
+    parser.add_argument("--skip-retrieval-modes", action="store_true",
+                        help="skip the dense vs BM25 vs hybrid recall comparison")
+    parser.add_argument("--chunk-strategies", nargs="+", default=["fixed", "structured"],
+                        help="chunk strategies to benchmark; build/query/ANN use the first")
+    parser.add_argument("--map-reduce-sizes", type=int, nargs="*", default=[1_000_000],
+                        help="document sizes for the map-reduce vs RAG analysis comparison")
+    parser.add_argument("--skip-endpoints", action="store_true")
+    parser.add_argument("--output", default="bench_results.json")
+    args = parser.parse_args(argv)
+
+    # Keep the run hermetic: no Groq, no on-disk index reuse between runs
+    os.environ.setdefault("GROQ_API_KEY", "offline-benchmark")
+    os.environ["RAG_STORE_DIR"] = ""
+    os.environ["LLM_CACHE_DIR"] = ""
+    os.environ["ANALYSIS_PIPELINE_MODE"] = args.pipeline_mode
+
+    import rag_engine
+    if args.stub_embedder:
+        rag_engine._model = HashEmbedder()
+
+    report = {
+        "meta": {
+            "timestamp": time.time(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "embedder": "hash-stub" if args.stub_embedder else rag_engine.EMBEDDING_ID,
+            "args": vars(args),
+        },
+        "sizes": {},
+        "endpoints": {},
+    }
+
+    print("======================================================")
+    print("   DOCBRIEF OFFLINE RAG BENCHMARK")
+    print("======================================================\n")
+
+    for size in args.sizes:
+        doc = generate_document(size, seed=size)
+        print(f"[{size:>9,} chars] chunking...", end="", flush=True)
+        chunk_stats = {}
+        for strategy in args.chunk_strategies:
+            chunk_stats[strategy] = bench_chunking(doc, args.chunk_repeats, strategy)
+            print(f" {strategy}: p50={chunk_stats[strategy]['p50_ms']}ms "
+                  f"n={chunk_stats[strategy]['n_chunks']}", end="", flush=True)
+        print("  build+query...", end="", flush=True)
+        store, bq = bench_build_and_query(doc, args.queries, args.chunk_strategies[0])
+        print(f" build={bq['build']['wall_ms']}ms  query p50={bq['query']['p50_ms']}ms")
+        if args.ann_types:
+            bq["ann"] = bench_ann(store, args.ann_types)
+            for index_type, r in bq["ann"].items():
+                print(f"    {index_type}: recall@{r['top_k']}={r['recall_at_k']} "
+                      f"search={r['ann_search_ms_per_query']}ms vs flat {r['flat_search_ms_per_query']}ms")
+        if args.vector_codecs:
+            bq["codecs"] = bench_codecs(store, args.vector_codecs)
+            for codec, r in bq["codecs"].items():
+                print(f"    {codec}: {r['bytes_per_chunk']} B/chunk ({r['vector_codec']}) "
+                      f"recall@10={r['recall_at_k']}")
+        bq["analysis_retrieval"] = r = bench_analysis_retrieval(store)
+        print("    analysis context: " + "  ".join(
+            f"{mode} tokens={r[mode]['context_tokens']} clauses={r[mode]['clause_kinds_covered']}/"
+            f"{r['clause_kinds']} dates={r[mode]['dates_covered']}" for mode in ("single", "multi")))
+        if not args.skip_retrieval_modes:
+            bq["retrieval_modes"] = bench_retrieval_modes(store, doc)
+            for mode, r in bq["retrieval_modes"].items():
+                if isinstance(r, dict):
+                    print(f"    {mode}: " + " ".join(f"{k}={v}" for k, v in r.items()
+                                                    if k.startswith(("recall", "k_to"))))
+        bq["incremental"] = r = bench_incremental(doc, args.chunk_strategies)
+        print("    revision re-index: " + "  ".join(
+            f"{s} reused={r[s]['reuse_ratio']:.0%} embed={r[s]['incremental_embedding_ms']}ms "
+            f"(full {r[s]['full_embedding_ms']}ms)" for s in args.chunk_strategies))
+        report["sizes"][str(size)] = {"chunk_text": chunk_stats, **bq}
+
+    if not args.skip_endpoints:
+        import app as app_module
+        app_module.llm_gateway.client = StubGroqClient(args.llm_latency_ms)
+        app_module.limiter.enabled = False
+        client = app_module.app.test_client()
+
+        for size in args.endpoint_sizes:
+            doc = generate_document(size, seed=size)
+            # Unique text per request → every analysis pays the cold build
+            analyze_bodies = [{"text": f"[{i}] " + doc, "no_cache": True}
+                              for i in range(args.requests)]
+            # Same document every turn → follow-up chat questions hit the index cache
+            # (the LLM response cache is bypassed so every turn reaches the stub)
+            chat_bodies = [{"chatInput": QUERIES[i % len(QUERIES)], "context": doc, "no_cache": True}
+                           for i in range(args.requests)]
+            print(f"[{size:>9,} chars] /analyze_document x{args.requests} @ c={args.concurrency}...",
+                  end="", flush=True)
+            analyze = bench_endpoint(client, "/analyze_document", analyze_bodies, args.concurrency)
+            print(f" p50={analyze['p50_ms']}ms p99={analyze['p99_ms']}ms  /chatbot...", end="", flush=True)
+            chat = bench_endpoint(client, "/chatbot", chat_bodies, args.concurrency)
+            print(f" p50={chat['p50_ms']}ms p99={chat['p99_ms']}ms")
+            report["endpoints"][str(size)] = {"/analyze_document": analyze, "/chatbot": chat}
+            app_module.index_cache.clear()
+
+        for size in args.map_reduce_sizes:
+            doc = generate_document(size, seed=size + 1)
+            print(f"[{size:>9,} chars] map-reduce vs rag analysis...", end="", flush=True)
+            r = bench_map_reduce(client, doc)
+            print("  " + "  ".join(f"{p}: {v['wall_ms']}ms tokens={v['prompt_tokens']} "
+                                   f"share={v['document_share']}" for p, v in r.items()))
+            report.setdefault("map_reduce", {})[str(size)] = r
+            app_module.index_cache.clear()
+
+        report["embedding_batcher"] = rag_engine.embedding_batcher.stats()
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nResults written to {args.output}")
+    return report
+
+
+if __name__ == "__main__":
+    main()
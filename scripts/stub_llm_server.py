@@ -0,0 +1,165 @@
+"""
+Local stand-in for the Groq chat-completions API.
+
+Serves POST /openai/v1/chat/completions (plain and stream=true SSE) with a
+configurable latency and injected failures, so the LLM gateway's
+concurrency limit, retries and circuit breaker can be exercised without
+network access or an API key:
+
+    python scripts/stub_llm_server.py --port 8765 --latency-ms 300 --error-rate 0.2
+    GROQ_BASE_URL=http://127.0.0.1:8765 GROQ_API_KEY=stub python app.py
+
+--error-status picks the injected failure (429 carries a Retry-After
+header); --fail-first N fails the first N requests, then recovers, which
+is the quickest way to watch the breaker open and close again.
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Same shapes as the prompts in app.py (_build_analysis_prompt and
+# _build_compare_prompt), so the frontend renders stub replies unchanged.
+STUB_ANALYSIS = {
+    "summary": "Stub analysis from the local LLM server.",
+    "key_clauses": ["Termination: either party may terminate with 30 days' written notice."],
+    "obligations": ["The client must pay each invoice within 30 days."],
+    "actions": [
+        {"title": "Contract Renewal", "date": "2025-12-01", "description": "Stub renewal deadline."}
+    ],
+}
+STUB_COMPARISON = {
+    "differences": ["Stub difference between Document A and Document B."],
+    "similarities": ["Stub similarity between Document A and Document B."],
+    "verdict": "Stub verdict from the local LLM server.",
+}
+STUB_REPLY = "Stub answer based on the retrieved context."
+
+
+class StubState:
+    def __init__(self, latency_ms: float, error_rate: float, error_status: int, fail_first: int):
+        self.latency_ms = latency_ms
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.fail_first = fail_first
+        self.requests = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.lock = threading.Lock()
+
+
+def make_handler(state: StubState):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, fmt, *args):
+            pass
+
+        def do_GET(self):
+            with state.lock:
+                body = json.dumps({"requests": state.requests,
+                                   "max_in_flight": state.max_in_flight}).encode()
+            self._send(200, body, "application/json")
+
+        def do_POST(self):
+            if not self.path.rstrip("/").endswith("/chat/completions"):
+                self._send(404, b'{"error": {"message": "not found"}}', "application/json")
+                return
+            payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            with state.lock:
+                state.requests += 1
+                n = state.requests
+                state.in_flight += 1
+                state.max_in_flight = max(state.max_in_flight, state.in_flight)
+            try:
+                time.sleep(state.latency_ms / 1000)
+                if n <= state.fail_first or random.random() < state.error_rate:
+                    headers = {"Retry-After": "0.1"} if state.error_status == 429 else {}
+                    self._send(state.error_status,
+                               json.dumps({"error": {"message": "injected failure"}}).encode(),
+                               "application/json", headers)
+                    return
+                content = _reply_for(payload.get("messages") or [{"content": ""}])
+                if payload.get("stream"):
+                    self._stream(payload.get("model"), content)
+                else:
+                    self._send(200, json.dumps(_completion(payload.get("model"), content)).encode(),
+                               "application/json")
+            finally:
+                with state.lock:
+                    state.in_flight -= 1
+
+        def _send(self, status: int, body: bytes, content_type: str, headers: dict = None):
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            for k, v in (headers or {}).items():
+                self.send_header(k, v)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _stream(self, model: str, content: str):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            for word in content.split(" "):
+                chunk = {"id": "stub", "object": "chat.completion.chunk", "created": int(time.time()),
+                         "model": model, "choices": [{"index": 0, "delta": {"content": word + " "},
+                                                      "finish_reason": None}]}
+                self._write_chunk(f"data: {json.dumps(chunk)}\n\n".encode())
+            self._write_chunk(b"data: [DONE]\n\n")
+            self._write_chunk(b"")
+
+        def _write_chunk(self, data: bytes):
+            self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+            self.wfile.flush()
+
+    return Handler
+
+
+def _reply_for(messages: list) -> str:
+    """Comparison or analysis JSON for the app's JSON prompts, plain text for chat."""
+    if "JSON" not in messages[0]["content"]:
+        return STUB_REPLY
+    if '"differences"' in messages[-1]["content"]:
+        return json.dumps(STUB_COMPARISON)
+    return json.dumps(STUB_ANALYSIS)
+
+
+def _completion(model: str, content: str) -> dict:
+    return {
+        "id": "stub", "object": "chat.completion", "created": int(time.time()), "model": model,
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": content},
+                     "finish_reason": "stop"}],
+        "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=float, default=200)
+    parser.add_argument("--error-rate", type=float, default=0.0,
+                        help="fraction of requests answered with --error-status")
+    parser.add_argument("--error-status", type=int, default=503)
+    parser.add_argument("--fail-first", type=int, default=0,
+                        help="fail the first N requests, then recover")
+    args = parser.parse_args()
+
+    state = StubState(args.latency_ms, args.error_rate, args.error_status, args.fail_first)
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(state))
+    print(f"Stub LLM server on http://{args.host}:{args.port} "
+          f"(latency {args.latency_ms}ms, error rate {args.error_rate}, status {args.error_status})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+"""Chunk alignment used by /compare_documents (rag_engine.align_stores)."""
+
+import numpy as np
+import pytest
+
+pytest.importorskip("faiss")
+
+from rag_engine import RAGStore, align_stores, make_index  # noqa: E402
+
+
+def _store(chunks: list[str], vectors: list[list[float]]) -> RAGStore:
+    emb = np.asarray(vectors, dtype="float32")
+    emb /= np.linalg.norm(emb, axis=1, keepdims=True)
+    store = RAGStore()
+    store.chunks = chunks
+    store.embeddings = emb
+    store.index = make_index(emb)
+    return store
+
+
+def test_non_mutual_match_is_reported_unmatched():
+    a = _store(["Termination on 30 days notice.", "Termination on 90 days notice.",
+                "Governed by the laws of Delaware."],
+               [[1, 0.05, 0], [1, 0.2, 0], [0, 0, 1]])
+    b = _store(["Termination on 60 days notice.", "Governed by the laws of New York."],
+               [[1, 0.1, 0], [0, 0.05, 1]])
+
+    alignment, timings = align_stores(a, b, min_score=0.5)
+
+    assert [(i, j) for i, j, _ in alignment["pairs"]] == [(0, 0), (2, 1)]
+    # The 90-day clause clears min_score against B's termination clause but
+    # lost the mutual match; it must still reach the comparison.
+    assert alignment["only_a"] == [1]
+    assert alignment["only_b"] == []
+    assert timings["n_only_a"] == 1
+
+
+def test_every_chunk_is_paired_or_unmatched():
+    rng = np.random.default_rng(0)
+    a = _store([f"a{i}" for i in range(12)], rng.standard_normal((12, 8)).tolist())
+    b = _store([f"b{j}" for j in range(9)], rng.standard_normal((9, 8)).tolist())
+
+    alignment, _ = align_stores(a, b, min_score=-1.0)
+
+    paired_a = [i for i, _, _ in alignment["pairs"]]
+    paired_b = [j for _, j, _ in alignment["pairs"]]
+    assert sorted(paired_a + alignment["only_a"]) == list(range(12))
+    assert sorted(paired_b + alignment["only_b"]) == list(range(9))
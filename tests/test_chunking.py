@@ -0,0 +1,61 @@
+"""Fixed and structure-aware chunking (rag_engine.chunk_text / iter_chunks)."""
+
+import pytest
+
+from rag_engine import chunk_spans, chunk_text, iter_chunks
+
+
+def _contract(n_sections: int = 8, n_clauses: int = 8) -> str:
+    sections = []
+    for i in range(1, n_sections + 1):
+        body = " ".join(f"Clause {i}.{j} requires the party to act within {j * 3} days of notice."
+                        for j in range(1, n_clauses + 1))
+        sections.append(f"{i}. Section {i}\n{body}\n\n")
+    return "".join(sections)
+
+
+def _pieces(text: str, size: int) -> list[str]:
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+def test_structured_chunks_stay_within_chunk_size():
+    # One unbroken run of words has no heading, paragraph or sentence break
+    text = _contract() + "word " * 400
+
+    chunks = chunk_text(text, chunk_size=300, overlap=50, strategy="structured")
+
+    assert chunks
+    assert max(len(c) for c in chunks) <= 300
+
+
+def test_structured_spans_locate_their_chunks():
+    text = _contract()
+
+    chunks = chunk_text(text, chunk_size=300, overlap=50, strategy="structured")
+    spans = chunk_spans(text, chunk_size=300, overlap=50, strategy="structured")
+
+    assert [text[s:e] for s, e in spans] == chunks
+
+
+def test_structured_chunks_resync_after_an_edit():
+    text = _contract()
+    edited = text.replace("Clause 1.2 requires", "Clause 1.2 strictly and promptly requires")
+
+    before = chunk_text(text, chunk_size=300, overlap=50, strategy="structured")
+    after = chunk_text(edited, chunk_size=300, overlap=50, strategy="structured")
+
+    # Only the chunk holding the edit changes; every later cut lands where it did
+    assert len(after) == len(before)
+    assert sum(a != b for a, b in zip(before, after)) == 1
+    assert after[1:] == before[1:]
+
+
+@pytest.mark.parametrize("strategy", ["fixed", "structured"])
+@pytest.mark.parametrize("piece_size", [1, 97, 4096])
+def test_streamed_chunks_match_one_shot(strategy, piece_size):
+    text = _contract() + "word " * 200
+
+    streamed = list(iter_chunks(_pieces(text, piece_size), chunk_size=300, overlap=50,
+                                strategy=strategy))
+
+    assert streamed == chunk_text(text, chunk_size=300, overlap=50, strategy=strategy)
@@ -0,0 +1,75 @@
+"""Replacing and evicting documents in the multi-document index (corpus.CorpusIndex)."""
+
+import zlib
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+pytest.importorskip("faiss")
+
+import corpus  # noqa: E402
+from corpus import CorpusIndex  # noqa: E402
+from rag_engine import RAGStore, chunk_text, make_index  # noqa: E402
+
+
+def _embed(texts: list[str]) -> np.ndarray:
+    emb = np.stack([np.random.default_rng(zlib.crc32(t.encode())).standard_normal(8)
+                    for t in texts]).astype("float32")
+    return emb / np.linalg.norm(emb, axis=1, keepdims=True)
+
+
+class _IndexCache:
+    """Builds stores from :func:`_embed` instead of the embedding model."""
+
+    def get_or_build(self, text, chunk_size, overlap, strategy, key=None):
+        store = RAGStore()
+        store.chunks = chunk_text(text, chunk_size, overlap, strategy)
+        store.embeddings = _embed(store.chunks)
+        store.index = make_index(store.embeddings)
+        return store, {"cache_hit": False}
+
+
+@pytest.fixture(autouse=True)
+def _stub_embeddings(monkeypatch):
+    monkeypatch.setattr(corpus, "index_cache", _IndexCache())
+    monkeypatch.setattr(corpus, "embedding_batcher", SimpleNamespace(encode=_embed))
+
+
+def _doc(tag: str, n_chunks: int) -> str:
+    # chunk_size=100, overlap=0: one chunk per 100 characters
+    return "".join(f"{tag} clause {i}. ".ljust(100, ".") for i in range(n_chunks))
+
+
+def test_re_adding_a_document_replaces_its_chunks():
+    index = CorpusIndex(chunk_size=100, overlap=0)
+    index.add_document(_doc("old", 4), document_id="msa")
+
+    index.add_document(_doc("new", 2), document_id="msa")
+    hits, _ = index.query("clause", top_k=10)
+
+    assert index.stats() == {"documents": 1, "chunks": 2, "max_chunks": index.max_chunks}
+    assert sorted(h["text"][:12] for h in hits) == ["new clause 0", "new clause 1"]
+
+
+def test_oldest_document_is_evicted_over_max_chunks():
+    index = CorpusIndex(max_chunks=5, chunk_size=100, overlap=0)
+    index.add_document(_doc("a", 2), document_id="a")
+    index.add_document(_doc("b", 2), document_id="b")
+
+    _, timings = index.add_document(_doc("c", 2), document_id="c")
+
+    assert timings["corpus_evicted"] == ["a"]
+    assert [d["document_id"] for d in index.list_documents()] == ["b", "c"]
+    assert index.stats()["chunks"] == 4
+
+
+def test_queried_document_is_not_the_next_evicted():
+    index = CorpusIndex(max_chunks=5, chunk_size=100, overlap=0)
+    index.add_document(_doc("a", 2), document_id="a")
+    index.add_document(_doc("b", 2), document_id="b")
+    index.query("clause", document_ids=["a"])
+
+    _, timings = index.add_document(_doc("c", 2), document_id="c")
+
+    assert timings["corpus_evicted"] == ["b"]
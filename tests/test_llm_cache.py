@@ -0,0 +1,61 @@
+"""Expiry and disk bounds of the LLM response cache (llm_cache.LLMResponseCache)."""
+
+import os
+import time
+
+import llm_cache
+from llm_cache import LLMResponseCache
+
+
+class _Clock:
+    def __init__(self, now: float = 1_000_000.0):
+        self.now = now
+
+    def time(self) -> float:
+        return self.now
+
+
+def _disk_files(root) -> list[str]:
+    return sorted(name for _, _, names in os.walk(root) for name in names)
+
+
+def test_memory_entry_expires_after_ttl(monkeypatch):
+    clock = _Clock()
+    monkeypatch.setattr(llm_cache.time, "time", clock.time)
+    cache = LLMResponseCache(ttl_s=60)
+    cache.put("k", "response", llm_ms=120.0)
+
+    clock.now += 59
+    assert cache.get("k")["response"] == "response"
+    clock.now += 2
+    assert cache.get("k") is None
+    assert cache.stats()["expired"] == 1
+
+
+def test_expired_disk_entry_is_a_miss_and_removed(tmp_path, monkeypatch):
+    clock = _Clock()
+    monkeypatch.setattr(llm_cache.time, "time", clock.time)
+    LLMResponseCache(ttl_s=60, disk_dir=str(tmp_path)).put("ab12", "response", llm_ms=120.0)
+
+    clock.now += 61
+    restarted = LLMResponseCache(ttl_s=60, disk_dir=str(tmp_path))
+
+    assert restarted.get("ab12") is None
+    assert _disk_files(tmp_path) == []
+
+
+def test_disk_sweep_evicts_oldest_entries_over_budget(tmp_path):
+    cache = LLMResponseCache(ttl_s=3600, disk_dir=str(tmp_path), disk_max_bytes=10 ** 9)
+    written = time.time() - 60
+    for i in range(5):
+        key = f"{i:02d}" + "f" * 62
+        cache.put(key, "x" * 1000, llm_ms=1.0)
+        os.utime(cache._path(key), (written + i, written + i))
+    newest_two = sum(os.path.getsize(cache._path(f"{i:02d}" + "f" * 62)) for i in (3, 4))
+
+    cache.disk_max_bytes = newest_two
+    kept = cache.sweep_disk()
+
+    assert kept == newest_two
+    assert _disk_files(tmp_path) == ["03" + "f" * 62 + ".json", "04" + "f" * 62 + ".json"]
+    assert cache.stats()["disk_evictions"] == 3
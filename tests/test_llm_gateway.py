@@ -0,0 +1,123 @@
+"""Circuit breaker and retry state machine (llm_gateway)."""
+
+from types import SimpleNamespace
+
+import pytest
+
+import llm_gateway
+from llm_gateway import CircuitBreaker, CircuitOpen, LLMGateway, LLMUnavailable
+
+
+class _StatusError(Exception):
+    """Stands in for a Groq API error; the gateway only looks at status_code."""
+
+    def __init__(self, status_code: int):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+        self.response = None
+
+
+class _Client:
+    """Groq-shaped client that raises each queued error once, then answers."""
+
+    def __init__(self, *errors):
+        self.errors = list(errors)
+        self.calls = 0
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    def _create(self, **kwargs):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        message = SimpleNamespace(content="ok")
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+
+
+@pytest.fixture(autouse=True)
+def _no_backoff(monkeypatch):
+    monkeypatch.setattr(llm_gateway, "LLM_BACKOFF_BASE_S", 0)
+
+
+def _complete(gateway: LLMGateway) -> str:
+    return gateway.complete([{"role": "user", "content": "hi"}], model="stub")
+
+
+def test_breaker_opens_after_consecutive_failures():
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout_s=60)
+
+    for _ in range(2):
+        breaker.record_failure()
+    assert breaker.state == "closed"
+    breaker.record_failure()
+
+    assert breaker.state == "open"
+    assert breaker.allow() is False
+    assert breaker.stats()["rejected"] == 1
+
+
+def test_half_open_admits_a_single_probe():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout_s=0)
+    breaker.record_failure()
+
+    assert breaker.allow() is True
+    assert breaker.state == "half_open"
+    assert breaker.allow() is False
+
+
+def test_probe_success_closes_breaker():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout_s=0)
+    breaker.record_failure()
+    breaker.allow()
+
+    breaker.record_success()
+
+    assert breaker.state == "closed"
+    assert breaker.consecutive_failures == 0
+
+
+def test_probe_failure_reopens_breaker():
+    breaker = CircuitBreaker(failure_threshold=5, reset_timeout_s=0)
+    for _ in range(5):
+        breaker.record_failure()
+    breaker.allow()
+
+    # A half-open probe reopens on its first failure, not after a fresh streak
+    breaker.record_failure()
+
+    assert breaker.state == "open"
+    assert breaker.times_opened == 2
+
+
+def test_retryable_errors_are_retried_until_success():
+    client = _Client(_StatusError(503), _StatusError(429))
+    gateway = LLMGateway(client, max_retries=3, breaker=CircuitBreaker(failure_threshold=1))
+
+    assert _complete(gateway) == "ok"
+    assert client.calls == 3
+    assert gateway.retries == 2
+    assert gateway.breaker.state == "closed"
+
+
+def test_exhausted_retries_count_one_breaker_failure():
+    client = _Client(*[_StatusError(500)] * 3)
+    gateway = LLMGateway(client, max_retries=2, breaker=CircuitBreaker(failure_threshold=1))
+
+    with pytest.raises(LLMUnavailable):
+        _complete(gateway)
+    assert client.calls == 3
+    assert gateway.breaker.state == "open"
+
+    with pytest.raises(CircuitOpen):
+        _complete(gateway)
+    assert client.calls == 3
+
+
+def test_client_errors_are_not_retried_and_leave_breaker_closed():
+    client = _Client(_StatusError(400))
+    gateway = LLMGateway(client, max_retries=3, breaker=CircuitBreaker(failure_threshold=1))
+
+    with pytest.raises(_StatusError):
+        _complete(gateway)
+    assert client.calls == 1
+    assert gateway.retries == 0
+    assert gateway.breaker.state == "closed"